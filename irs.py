@@ -16,9 +16,11 @@ import argparse
 import json
 import logging
 import sys
-from pprint import pformat
-from k4sru.sru import generate_info_sru, generate_blanketter_sru
-from k4sru.data import init_stocks_data, process_transactions, save_stocks_data, print_statistics
+# Only the option values are imported here, each command imports the modules it uses when it
+# runs so that --help and short commands start fast (see the startup check of the bench command)
+from k4sru.options import (DEFAULT_YEAR, PROFILE_MODES, DEFAULT_SIZES, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE_MB,
+                           DEFAULT_SNAPSHOT_TRADES, DEFAULT_SNAPSHOT_DAYS,
+                           parse_currency_mix, parse_tolerance, parse_timestamp, parse_sell)
 
 INPUT_DIR = 'input/'
 
@@ -66,43 +68,517 @@ Supported file format:
 
     # Add other arguments
     k4sru_parser.add_argument('--config', default=f'{INPUT_DIR}config.json', help='path to configuration file')
-    k4sru_parser.add_argument('--indata',
-                       required=True,
-                       help='input CSV file with trade data')
+    k4sru_parser.add_argument('--indata', nargs='+',
+                       help='input files, glob patterns or - for standard input with trade data (required unless --store is given)')
     k4sru_parser.add_argument('--indata2',
-                        help='optional secondary input CSV file with additional trade data (e.g., Bitstamp trades)')
+                        help='optional secondary input CSV file with additional trade data (e.g., Bitstamp trades), same as an extra --indata file')
+    k4sru_parser.add_argument('--workers', type=int,
+                       help='maximum number of worker processes used to parse the input files (default: number of CPUs)')
     k4sru_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
                        default='INFO', help='set logging level')
-    k4sru_parser.add_argument('--year', default=2026, help='tax year for which to generate the K4 SRU files')
+    add_year_argument(k4sru_parser, 'tax year for which to generate the K4 SRU files')
     k4sru_parser.add_argument('--longnames', action='store_true', default=False,
                        help='output long names in the generated K4 SRU file instead of the ticker symbols')
+    k4sru_parser.add_argument('--store',
+                       help='SQLite trade store; input files are added to the store and the tax year is read from it')
+    k4sru_parser.add_argument('--symbols', nargs='+',
+                       help='only process these symbols (requires --store)')
+    k4sru_parser.add_argument('--columnar', nargs='?', const='auto', choices=['auto', 'arrow', 'fixed'],
+                       help='also export K4 rows, journal and portfolio in a columnar format (Arrow IPC when pyarrow is installed, otherwise fixed-width binary)')
+    k4sru_parser.add_argument('--profile', nargs='?', const='full', choices=list(PROFILE_MODES),
+                       help='profile each pipeline stage: time, memory (time and tracemalloc peak) or full (also cProfile, the default); '
+                            'writes profile_<year>.txt and profile_<year>_<stage>.prof to the output directory')
+    k4sru_parser.add_argument('--metrics',
+                       help='write engine branch hit counts and latency histograms to this file, Prometheus text format if it ends with .prom or .txt, otherwise JSON')
+    k4sru_parser.add_argument('--metrics-sample', type=int, default=1,
+                       help='measure the latency of every N:th trade for --metrics (default: 1, every trade)')
+    k4sru_parser.add_argument('--trace',
+                       help='write a Chrome trace event JSON file of the pipeline stages and input file parsing (view in Perfetto or chrome://tracing)')
+    k4sru_parser.add_argument('--snapshots',
+                       help='write engine snapshots to this index file for position queries as of any time (see the asof command)')
+    k4sru_parser.add_argument('--snapshot-trades', type=int, default=DEFAULT_SNAPSHOT_TRADES,
+                       help=f'take a snapshot every N trades, 0 to disable (default: {DEFAULT_SNAPSHOT_TRADES})')
+    k4sru_parser.add_argument('--snapshot-days', type=int, default=DEFAULT_SNAPSHOT_DAYS,
+                       help=f'take a snapshot every N days, 0 to disable (default: {DEFAULT_SNAPSHOT_DAYS})')
+    k4sru_parser.add_argument('--lineage',
+                       help='write the source trades of each K4 row to this lineage file (see the explain command)')
+    k4sru_parser.add_argument('--prices',
+                       help='price snapshot file (CSV or JSON) for a mark-to-market valuation of the year-end portfolio, '
+                            'writes valuation_<year>.csv and valuation_exposure_<year>.csv to the output directory')
+    k4sru_parser.add_argument('--force', action='store_true', default=False,
+                       help='run the pipeline even if the result cache has the outputs of the same inputs')
+    k4sru_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                       help=f'directory of the result cache (default: {DEFAULT_CACHE_DIR})')
+    k4sru_parser.add_argument('--cache-size', type=float, default=DEFAULT_CACHE_SIZE_MB,
+                       help=f'enable the result cache with this maximum size in MB, least recently used results are evicted, 0 disables the cache (default: {DEFAULT_CACHE_SIZE_MB})')
+
+    # Subcommand: generate
+    generate_parser = subparsers.add_parser('generate', help='Generate a synthetic IBKR flex CSV file for benchmarks and tests.')
+    generate_parser.add_argument('--trades', type=int, default=1000, help='number of trades (default: 1000)')
+    generate_parser.add_argument('--output', help='path to the generated file, gzip compressed if it ends with .gz (default: output/synthetic_<year>.csv)')
+    add_generator_arguments(generate_parser)
+
+    # Subcommand: bench
+    bench_parser = subparsers.add_parser('bench', help='Benchmark the k4sru pipeline stages on synthetic trade histories.')
+    bench_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                       help='numbers of trades to benchmark (default: %(default)s)')
+    bench_parser.add_argument('--workers', type=int,
+                       help='maximum number of worker processes used to parse the input files (default: number of CPUs)')
+    bench_parser.add_argument('--output', help='path to the JSON results file (default: output/bench_<year>.json)')
+    bench_parser.add_argument('--engines', nargs='*',
+                       help='engines to check against the reference engine (default: all registered engines, none if given without names)')
+    bench_parser.add_argument('--startup-budget', type=float, default=30.0,
+                       help='maximum import time in ms of the command line (`irs.py --help`), 0 to skip the check (default: 30)')
+    add_generator_arguments(bench_parser)
+
+    # Subcommand: equivalence
+    equivalence_parser = subparsers.add_parser('equivalence', help='Check that alternative engines produce the same output as the reference engine.')
+    equivalence_parser.add_argument('--indata', nargs='+',
+                       help='input files with trade data, a synthetic trade history is generated if omitted')
+    equivalence_parser.add_argument('--trades', type=int, default=10000, help='number of synthetic trades (default: 10000)')
+    equivalence_parser.add_argument('--engines', nargs='+',
+                       help='engines to check against the reference engine (default: all registered engines)')
+    equivalence_parser.add_argument('--tolerance', type=parse_tolerance, action='append', default=[],
+                       help='absolute tolerance of the numbers of a section, e.g. k4_data=0.01 (sections: k4_data, stocks_data, statistics, sru)')
+    equivalence_parser.add_argument('--output', help='write the equivalence report as JSON to this file')
+    add_generator_arguments(equivalence_parser)
+
+    # Subcommand: watch
+    watch_parser = subparsers.add_parser('watch', help='Watch the inputs of k4sru and refresh the outputs when they change.')
+    watch_parser.add_argument('--config', default=f'{INPUT_DIR}config.json', help='path to configuration file')
+    watch_parser.add_argument('--indata', nargs='+', required=True,
+                       help='input files or glob patterns with trade data, new files matching a pattern are picked up')
+    add_year_argument(watch_parser, 'tax year for which to generate the K4 SRU files')
+    watch_parser.add_argument('--longnames', action='store_true', default=False,
+                       help='use long names in the SRU file')
+    watch_parser.add_argument('--interval', type=float, default=0.5, help='seconds between two polls of the inputs (default: 0.5)')
+    watch_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
+
+    # Subcommand: asof
+    asof_parser = subparsers.add_parser('asof', help='Show positions and average prices as of a date from the engine snapshots of a k4sru run.',
+                       description='Show positions and average prices as of a date from the engine snapshots of a k4sru run. '
+                                   'Like k4sru, the option trades up to the date are applied after all other trades up to the date, '
+                                   'not at their own time, so a currency balance between an option trade and a later trade in the '
+                                   'same currency includes the option trade after that later trade.')
+    asof_parser.add_argument('--date', type=parse_timestamp, required=True,
+                       help='date (end of day) or time of the positions, e.g. 2025-06-30 or "2025-06-30 15:30:00"')
+    add_year_argument(asof_parser, 'tax year of the snapshot index')
+    asof_parser.add_argument('--index', help='snapshot index written by k4sru --snapshots (default: output/snapshots_<year>.json)')
+    asof_parser.add_argument('--symbols', nargs='+', help='only show these symbols (default: all open positions)')
+    asof_parser.add_argument('--output', help='write the positions as JSON to this file')
+    asof_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
+
+    # Subcommand: whatif
+    whatif_parser = subparsers.add_parser('whatif', help='Show the K4 and tax effect of hypothetical trades on the engine state after the input files.')
+    whatif_parser.add_argument('--indata', nargs='+', required=True, help='input files or glob patterns with trade data')
+    add_year_argument(whatif_parser, 'tax year of the input files')
+    whatif_parser.add_argument('--sell', type=parse_sell, action='append', default=[],
+                       help='hypothetical sell <symbol>:<quantity|all|percent%%>[:<price>], e.g. AAOI:50%%:41.5 (repeatable, the last traded price if omitted)')
+    whatif_parser.add_argument('--scenarios', help='JSON file with a list of scenarios, see k4sru/whatif.py')
+    whatif_parser.add_argument('--workers', type=int,
+                       help='maximum number of worker processes used to evaluate the scenarios (default: number of CPUs)')
+    whatif_parser.add_argument('--output', help='write the results as JSON to this file')
+    whatif_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
+
+    # Subcommand: harvest
+    harvest_parser = subparsers.add_parser('harvest', help='Choose the open positions to sell to reach a target capital income or to use a loss budget.')
+    harvest_parser.add_argument('--indata', nargs='+', required=True, help='input files or glob patterns with trade data')
+    harvest_parser.add_argument('--prices', required=True,
+                       help='price snapshot, CSV with Symbol,Price,Currency columns or JSON, see k4sru/prices.py')
+    add_year_argument(harvest_parser, 'tax year of the input files')
+    harvest_goal = harvest_parser.add_mutually_exclusive_group()
+    harvest_goal.add_argument('--target', type=float,
+                       help='target capital income of the year in SEK, e.g. 0 to offset the realized gains')
+    harvest_goal.add_argument('--loss-budget', type=float,
+                       help='maximum loss to realize in SEK with the largest tax reduction (default: all losses)')
+    harvest_parser.add_argument('--date', type=parse_timestamp, help='date of the sales (default: the time of the last trade)')
+    harvest_parser.add_argument('--output', help='path to the JSON file with the trades and projected K4 rows (default: output/harvest_<year>.json)')
+    harvest_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
+
+    # Subcommand: reconcile
+    reconcile_parser = subparsers.add_parser('reconcile', help='Compare the computed positions with broker open-positions exports and find the first divergent date.')
+    reconcile_parser.add_argument('--positions', nargs='+', required=True,
+                       help='broker open-positions CSV files with Symbol, Quantity and optional ISIN and ReportDate columns, see k4sru/reconcile.py')
+    reconcile_source = reconcile_parser.add_mutually_exclusive_group(required=True)
+    reconcile_source.add_argument('--indata', nargs='+', help='input files or glob patterns with trade data')
+    reconcile_source.add_argument('--index', help='snapshot index written by k4sru --snapshots instead of the input files')
+    add_year_argument(reconcile_parser, 'tax year of the input files')
+    reconcile_parser.add_argument('--currencies', action='store_true', default=False,
+                       help='also compare currency balances, which open-positions exports usually leave out')
+    reconcile_parser.add_argument('--output', help='path to the JSON report (default: output/reconcile_<year>.json)')
+    reconcile_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
+
+    # Subcommand: explain
+    explain_parser = subparsers.add_parser('explain', help='Show the source trades of a K4 row from the lineage file of a k4sru run.')
+    explain_parser.add_argument('--row', required=True, help='beteckning of the K4 row, e.g. RHMd, or its long name')
+    add_year_argument(explain_parser, 'tax year of the lineage file')
+    explain_parser.add_argument('--lineage', help='lineage file written by k4sru --lineage (default: output/lineage_<year>.lin)')
+    explain_parser.add_argument('--output', help='write the contributions as JSON to this file')
+    explain_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
+
+    # Subcommand: serve
+    serve_parser = subparsers.add_parser('serve', help='Run a local daemon keeping the engine state in memory, with a JSON API over HTTP or a Unix socket.')
+    add_year_argument(serve_parser, 'tax year of the engine state')
+    serve_parser.add_argument('--indata', nargs='+',
+                       help='input files processed on start when there is no checkpoint')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='host name or address to listen on (default: 127.0.0.1)')
+    serve_parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on (default: 8765)')
+    serve_parser.add_argument('--socket', help='listen on this Unix socket instead of the TCP port')
+    serve_parser.add_argument('--checkpoint', help='checkpoint file of the engine state (default: output/serve_<year>.json)')
+    serve_parser.add_argument('--checkpoint-interval', type=float, default=60,
+                       help='seconds between checkpoints when the state has changed (default: 60)')
+    serve_parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
 
     return parser
 
+def add_year_argument(parser, help):
+    """Add the --year option, the same type and default for every subcommand."""
+    parser.add_argument('--year', type=int, default=DEFAULT_YEAR, help=f'{help} (default: {DEFAULT_YEAR})')
+
+def add_generator_arguments(parser):
+    """Add the synthetic trade generator options to a subcommand parser."""
+    add_year_argument(parser, 'year of the synthetic trades')
+    parser.add_argument('--symbols', type=int, default=50, help='number of stock symbols (default: 50)')
+    parser.add_argument('--currencies', type=parse_currency_mix, default=None,
+                       help='currency mix of the stocks, e.g. USD=0.6,EUR=0.2,SEK=0.15,DKK=0.05 (the default)')
+    parser.add_argument('--margin-loans', type=float, default=0.05,
+                       help='share of foreign stock buys that are not funded by a currency trade (default: 0.05)')
+    parser.add_argument('--options', type=float, default=0.05, help='share of option trades (default: 0.05)')
+    parser.add_argument('--btc', type=float, default=0.02, help='share of BTC trades (default: 0.02)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--debug', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+                       default='INFO', help='set logging level')
+
+def generator_options(args):
+    """Get the generate_flex_csv options from the parsed arguments."""
+    return {
+        'symbols': args['symbols'],
+        'currencies': args['currencies'],
+        'margin_loans': args['margin_loans'],
+        'options': args['options'],
+        'btc': args['btc'],
+        'seed': args['seed'],
+    }
+
 def read_config(config_file):
     """Read configuration from JSON file."""
     with open(config_file) as f:
         return json.load(f)
 
 def handle_k4sru(args):
-    config = read_config(args.get('config', INPUT_DIR + 'config.json'))
+    from k4sru.sru import generate_info_sru, generate_blanketter_sru
+    from k4sru.data import init_stocks_data, process_transactions, save_stocks_data, print_statistics, no_stage, combine_stages, STDIN
+    from k4sru import metrics
+    config_path = args.get('config', INPUT_DIR + 'config.json')
+    config = read_config(config_path)
+    filenames = list(args.get('indata') or [])
+    if args.get('indata2'):
+        filenames.append(args['indata2'])
+    year = args['year']
+    longnames = args.get('longnames', False)
+    # Check the columnar format before any output file is written
+    columnar_format = args.get('columnar')
+    if columnar_format:
+        from k4sru.columnar import resolve_columnar_format, export_columnar
+        columnar_format = resolve_columnar_format(columnar_format)
+
+    # Result cache of runs with the same inputs. Standard input cannot be hashed without consuming
+    # it, runs from a trade store and runs with diagnostics, columnar exports, a valuation or a lineage
+    # are not cached.
+    cache_dir = args.get('cache_dir')
+    cache_bytes = int((args.get('cache_size') or 0) * 1024 * 1024)
+    cache_key = None
+    if (cache_dir and cache_bytes > 0 and STDIN not in filenames and
+            not any(args.get(option) for option in ('store', 'profile', 'metrics', 'trace', 'columnar', 'snapshots', 'prices', 'lineage'))):
+        from k4sru.cache import result_key, restore_result, store_result
+        cache_key = result_key(config_path, filenames, year, longnames)
+        if not args.get('force') and restore_result(cache_dir, cache_key, year):
+            return
+
+    # Optional per-stage profiling
+    profile_mode = args.get('profile')
+    profile_results = {}
+    stages = []
+    if profile_mode:
+        from k4sru.profiling import stage_profiler, save_profile_report
+        stages.append(stage_profiler(profile_results, profile_mode))
+
+    # Optional trace of the pipeline stages
+    trace_path = args.get('trace')
+    trace_events = []
+    file_spans = [] if trace_path else None
+    if trace_path:
+        from k4sru.trace import trace_tags, stage_tracer, save_trace
+        tags = trace_tags(config, year)
+        stages.append(stage_tracer(trace_events, tags))
+    stage = combine_stages(*stages) if stages else no_stage
+
+    # Optional engine branch metrics
+    metrics_path = args.get('metrics')
+    if metrics_path:
+        metrics.enable(args.get('metrics_sample') or 1)
+
+    # Optional audit lineage of the K4 rows
+    lineage_path = args.get('lineage')
+    if lineage_path:
+        from k4sru import lineage
+        lineage.enable()
 
     # Generate INFO.SRU file
-    generate_info_sru(config)
+    with stage('generate_info_sru'):
+        generate_info_sru(config)
 
     # Generate BLANKETTER.SRU file
-    filepath_ibkr = args.get('indata', INPUT_DIR + 'indata_ibkr.csv')
-    filepath_bitstamp = args.get('indata2', INPUT_DIR + 'indata_bitstamp.csv')
-    year = args.get('year', 2024)
-    longnames = args.get('longnames', False)
+    workers = args.get('workers')
     logging.debug("Starting to process parsed CSV data from Interactive Brokers")
-    stocks_data = init_stocks_data(year)
-    transactions = process_transactions(filepath_ibkr, filepath_bitstamp, year, stocks_data, k4_data, currency_rates, statistics_data)
+    with stage('init_stocks_data'):
+        stocks_data = init_stocks_data(year)
+    # Optional engine snapshots for position queries as of any time
+    snapshots_path = args.get('snapshots')
+    snapshot_index = None
+    if snapshots_path:
+        from k4sru.snapshots import new_snapshot_index, save_snapshot_index
+        snapshot_index = new_snapshot_index(year, args.get('snapshot_trades', 0), args.get('snapshot_days', 0))
+    store_path = args.get('store')
+    if store_path:
+        from k4sru.store import open_store, ingest_files, process_store_transactions
+        conn = open_store(store_path)
+        if filenames:
+            with stage('ingest'):
+                ingest_files(conn, filenames, workers)
+        transactions = process_store_transactions(conn, year, stocks_data, k4_data, currency_rates, statistics_data, args.get('symbols'), stage, snapshot_index)
+        conn.close()
+    else:
+        transactions = process_transactions(filenames, year, stocks_data, k4_data, currency_rates, statistics_data, workers, stage, file_spans, snapshot_index)
+    if lineage_path:
+        lineage.disable()
+        with stage('save_lineage'):
+            lineage.save_lineage(lineage_path, year)
+            lineage.reset()
+    if snapshot_index is not None:
+        with stage('save_snapshots'):
+            save_snapshot_index(snapshots_path, snapshot_index)
     # Save the processed data to a JSON file
-    save_stocks_data(year, stocks_data)
-    generate_blanketter_sru(config, transactions, longnames, year)
+    with stage('save_stocks_data'):
+        save_stocks_data(year, stocks_data)
+    with stage('generate_blanketter_sru'):
+        generate_blanketter_sru(config, transactions, longnames, year)
     # Print statistics data
-    print_statistics(statistics_data, k4_data, year)
+    with stage('print_statistics'):
+        journal = print_statistics(statistics_data, k4_data, year)
+    # Export columnar data for pandas/Arrow consumers
+    if columnar_format:
+        with stage('export_columnar'):
+            export_columnar(year, transactions, journal, stocks_data, columnar_format)
+    # Mark-to-market valuation of the year-end portfolio
+    prices_path = args.get('prices')
+    if prices_path:
+        from k4sru.valuation import value_year_end
+        with stage('valuation'):
+            value_year_end(year, stocks_data, currency_rates, prices_path)
+
+    if cache_key:
+        store_result(cache_dir, cache_key, year, cache_bytes)
+
+    if profile_mode:
+        save_profile_report(profile_results, year)
+    if metrics_path:
+        metrics.disable()
+        metrics.save_metrics(metrics_path)
+        logging.info(f"Engine metrics saved to {metrics_path}")
+    if trace_path:
+        save_trace(trace_path, trace_events, tags, file_spans)
+
+def handle_generate(args):
+    from k4sru.synthetic import generate_flex_csv
+    year = args['year']
+    filename = args.get('output') or f'output/synthetic_{year}.csv'
+    written = generate_flex_csv(filename, args['trades'], year, **generator_options(args))
+    logging.info(f"{written} synthetic trades written to {filename}")
+
+def handle_bench(args):
+    from k4sru.bench import run_benchmark
+    year = args['year']
+    output = args.get('output') or f'output/bench_{year}.json'
+    startup_budget = args.get('startup_budget') or None
+    results = run_benchmark(args['sizes'], year, output, args.get('workers'), args.get('engines'), startup_budget, **generator_options(args))
+    if not results.get('startup', {}).get('within_budget', True):
+        logging.error("The command line startup exceeds the import time budget, see the benchmark results")
+        sys.exit(1)
+    for result in results['results']:
+        if not all(check['equivalent'] for check in result.get('equivalence', {}).values()):
+            logging.error("An engine is not equivalent to the reference engine, see the benchmark results")
+            sys.exit(1)
+
+def handle_equivalence(args):
+    from k4sru.data import init_stocks_data, read_input_files, deduplicate_trades
+    from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates
+    from k4sru.bench import BENCH_CONFIG
+    from k4sru.equivalence import check_equivalence
+    year = args['year']
+    if args.get('indata'):
+        sources = read_input_files(args['indata'])
+        trades, _ = deduplicate_trades([(filename, source_trades) for filename, source_trades, _ in sources])
+        rates = [rate for _, _, source_rates in sources for rate in source_rates]
+        portfolio = init_stocks_data(year)
+        predefined_rates = None
+    else:
+        trades = list(iter_synthetic_trades(args['trades'], year, **generator_options(args)))
+        rates = list(iter_synthetic_rates(year, args['seed']))
+        portfolio = {}
+        predefined_rates = {}
+    report = check_equivalence(trades, rates, year, args.get('engines'), portfolio, predefined_rates, BENCH_CONFIG, dict(args['tolerance']))
+    if args.get('output'):
+        with open(args['output'], 'w') as file:
+            json.dump(report, file, indent=4)
+        logging.info(f"Equivalence report saved to {args['output']}")
+    if not all(check['equivalent'] for check in report.values()):
+        sys.exit(1)
+
+def handle_watch(args):
+    from k4sru.watch import watch
+    watch(args['config'], args['indata'], args['year'], args['longnames'], args['interval'])
+
+def handle_asof(args):
+    from k4sru.snapshots import load_snapshot_index, positions_as_of
+    year = args['year']
+    index = load_snapshot_index(args.get('index') or f'output/snapshots_{year}.json')
+    timestamp = args['date']
+    positions = positions_as_of(index, timestamp, args.get('symbols'))
+    logging.info(f"Positions as of {timestamp}")
+    logging.info("=" * 60)
+    logging.info(f"{'Symbol':<25} {'Quantity':>15} {'Avg price (SEK)':>18}")
+    logging.info("-" * 60)
+    for symbol, position in positions.items():
+        logging.info(f"{symbol:<25} {position['quantity']:>15.4f} {position['avgprice']:>18.4f}")
+    logging.info("=" * 60)
+    if args.get('output'):
+        with open(args['output'], 'w') as file:
+            json.dump({'timestamp': timestamp, 'positions': positions}, file, indent=4)
+
+def handle_whatif(args):
+    from k4sru.whatif import load_base_state, read_scenarios, simulate
+    scenarios = list(args['sell'])
+    if args.get('scenarios'):
+        scenarios += read_scenarios(args['scenarios'])
+    if not scenarios:
+        logging.error("No scenarios, use --sell or --scenarios")
+        sys.exit(1)
+    base = load_base_state(args['indata'], args['year'], args.get('workers'))
+    results = simulate(base, scenarios, args.get('workers'))
+    logging.info(f"Realized profit/loss {base['profit_loss']:.0f} SEK, tax {base['profit_loss'] * 0.3:.0f} SEK")
+    logging.info("=" * 87)
+    logging.info(f"{'Scenario':<45} {'Profit/Loss (SEK)':>20} {'Tax (SEK)':>20}")
+    logging.info("-" * 87)
+    for result in results[:100]:
+        scenario = result['scenario']
+        label = f"{scenario.get('side', 'SELL')} {scenario.get('quantity', 'all')} {scenario['symbol']}"
+        if result['error']:
+            logging.info(f"{label:<45} {result['error']}")
+        else:
+            logging.info(f"{label:<45} {result['profit_loss']:>20.0f} {result['tax']:>20.0f}")
+    if len(results) > 100:
+        logging.info(f"... {len(results) - 100} more scenarios")
+    logging.info("=" * 87)
+    if args.get('output'):
+        with open(args['output'], 'w') as file:
+            json.dump(results, file, indent=4)
+        logging.info(f"Scenario results saved to {args['output']}")
+
+def handle_harvest(args):
+    from k4sru.whatif import load_base_state
+    from k4sru.prices import read_prices
+    from k4sru.harvest import harvest
+    year = args['year']
+    prices = read_prices(args['prices'])
+    base = load_base_state(args['indata'], year)
+    result = harvest(base, prices, args.get('target'), args.get('loss_budget'), args.get('date'))
+    if result['skipped']:
+        logging.warning(f"No price for {', '.join(sorted(result['skipped']))}, not considered")
+    logging.info("=" * 87)
+    logging.info(f"{'Sell':<25} {'Quantity':>15} {'Price':>12} {'Proceeds (SEK)':>15} {'Profit/Loss (SEK)':>17}")
+    logging.info("-" * 87)
+    for trade in result['trades']:
+        logging.info(f"{trade['symbol']:<25} {trade['quantity']:>15.4f} {trade['price']:>12.4f} {trade['proceeds']:>15.0f} {trade['profit_loss']:>17.0f}")
+    logging.info("-" * 87)
+    for label in ('before', 'after'):
+        summary = result[label]
+        logging.info(f"{label.capitalize():<10} profit/loss {summary['profit_loss']:>12.0f}  capital income {summary['capital_income']:>12.0f}  tax {summary['tax']:>10.0f}")
+    logging.info("=" * 87)
+    output = args.get('output') or f'output/harvest_{year}.json'
+    with open(output, 'w') as file:
+        json.dump(result, file, indent=4)
+    logging.info(f"Harvest trades and projected K4 rows saved to {output}")
+
+def handle_reconcile(args):
+    from k4sru.snapshots import load_snapshot_index
+    from k4sru.reconcile import read_broker_positions, build_snapshot_index, reconcile
+    year = args['year']
+    reports = {}
+    for filename in args['positions']:
+        for date, positions in read_broker_positions(filename, year).items():
+            reports.setdefault(date, {}).update(positions)
+    index = load_snapshot_index(args['index']) if args.get('index') else build_snapshot_index(args['indata'], year)
+    result = reconcile(index, reports, args.get('currencies'))
+    logging.info("=" * 87)
+    logging.info(f"{'Date':<10} {'Symbol':<25} {'Status':<17} {'Broker':>10} {'Computed':>10} {'Difference':>10}")
+    logging.info("-" * 87)
+    for entry in result['dates']:
+        if not entry['differences']:
+            logging.info(f"{entry['date']:<10} {entry['positions']} positions agree")
+        for difference in entry['differences']:
+            logging.info(f"{entry['date']:<10} {difference['symbol']:<25} {difference['status']:<17} "
+                         f"{difference['broker']:>10.4f} {difference['computed']:>10.4f} {difference['difference']:>10.4f}")
+    logging.info("=" * 87)
+    output = args.get('output') or f'output/reconcile_{year}.json'
+    with open(output, 'w') as file:
+        json.dump(result, file, indent=4)
+    logging.info(f"Reconciliation report saved to {output}")
+    if result['first_divergent_date']:
+        logging.error(f"The computed positions diverge from the broker on {result['first_divergent_date']}")
+        sys.exit(1)
+
+def handle_explain(args):
+    from k4sru.lineage import explain
+    from k4sru.data import get_k4_d_antal
+    year = args['year']
+    result = explain(args.get('lineage') or f'output/lineage_{year}.lin', args['row'])
+    if result is None:
+        logging.error(f"No K4 row {args['row']} in the lineage")
+        sys.exit(1)
+    contributions = result['contributions']
+    logging.info(f"K4 row {result['beteckning']} ({result['beskrivning']}), {len(contributions)} contributions")
+    logging.info("=" * 120)
+    logging.info(f"{'Source':<30} {'Trade':>6} {'Date':<16} {'Side':<5} {'Quantity':>12} {'Price':>12} {'Antal':>12} {'Forsaljningspris':>17} {'Omkostnadsbelopp':>17}")
+    logging.info("-" * 120)
+    for contribution in contributions:
+        logging.info(f"{contribution['source'] or '(trade store)':<30} {contribution['trade'] or '':>6} {contribution['date'] or '':<16} "
+                     f"{contribution['side'] or '':<5} {contribution['quantity'] or '':>12} {contribution['price'] or '':>12} "
+                     f"{contribution['antal']:>12.4f} {contribution['forsaljningspris']:>17.2f} {contribution['omkostnadsbelopp']:>17.2f}")
+    logging.info("-" * 120)
+    antal = sum(contribution['antal'] for contribution in contributions)
+    forsaljningspris = sum(contribution['forsaljningspris'] for contribution in contributions)
+    omkostnadsbelopp = sum(contribution['omkostnadsbelopp'] for contribution in contributions)
+    logging.info(f"{'Total':<72} {antal:>12.4f} {forsaljningspris:>17.2f} {omkostnadsbelopp:>17.2f}")
+    logging.info(f"{'BLANKETTER.SRU':<72} {get_k4_d_antal(antal, result['beteckning'], year):>12} "
+                 f"{round(forsaljningspris):>17} {round(omkostnadsbelopp):>17}")
+    logging.info("=" * 120)
+    if args.get('output'):
+        with open(args['output'], 'w') as file:
+            json.dump(result, file, indent=4)
+
+def handle_serve(args):
+    from k4sru.server import serve
+    year = args['year']
+    checkpoint = args.get('checkpoint') or f'output/serve_{year}.json'
+    serve(year, args['host'], args['port'], args.get('socket'), checkpoint, args['checkpoint_interval'], args.get('indata'))
 
 def main():
     parser = create_cli_parser()
@@ -140,7 +616,31 @@ def main():
         sys.exit(1)
 
     if args['command'] == 'k4sru':
+        if not args.get('indata') and not args.get('store'):
+            parser.error('k4sru requires --indata or --store')
+        if args.get('symbols') and not args.get('store'):
+            parser.error('--symbols requires --store')
         handle_k4sru(args)
+    elif args['command'] == 'generate':
+        handle_generate(args)
+    elif args['command'] == 'bench':
+        handle_bench(args)
+    elif args['command'] == 'equivalence':
+        handle_equivalence(args)
+    elif args['command'] == 'watch':
+        handle_watch(args)
+    elif args['command'] == 'asof':
+        handle_asof(args)
+    elif args['command'] == 'whatif':
+        handle_whatif(args)
+    elif args['command'] == 'harvest':
+        handle_harvest(args)
+    elif args['command'] == 'reconcile':
+        handle_reconcile(args)
+    elif args['command'] == 'explain':
+        handle_explain(args)
+    elif args['command'] == 'serve':
+        handle_serve(args)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
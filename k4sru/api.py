@@ -0,0 +1,94 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# In-process API for notebooks. Runs the engine on already parsed trades and currency rates
+# and returns the K4 rows, the final portfolio and the win rate journal as columnar structures
+# without reading or writing any files.
+#
+#   from k4sru.api import compute_k4
+#   result = compute_k4(trades, rates, 2025)
+#   result['k4']          # pandas.DataFrame, NumPy structured array or dict of lists
+
+import copy
+from .data import process_trades, build_win_rate_journal, journal_by_entry_date
+from .columnar import k4_columns, journal_columns, portfolio_columns, resolve_column_types, K4_COLUMNS, JOURNAL_COLUMNS, PORTFOLIO_COLUMNS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+def to_columnar(schema, columns, output='auto'):
+    """Convert columns to a DataFrame, a NumPy structured array or a dict of lists.
+
+    Args:
+        schema: List of (name, type) tuples
+        columns: Column name -> list of values
+        output: 'frame', 'array', 'dict' or 'auto' (the richest type that is importable)
+    """
+    if output == 'auto':
+        output = 'frame' if pandas is not None else 'array' if numpy is not None else 'dict'
+
+    if output == 'frame':
+        if pandas is None:
+            raise ValueError("pandas is not installed")
+        return pandas.DataFrame({name: columns[name] for name, _ in schema})
+    if output == 'array':
+        if numpy is None:
+            raise ValueError("numpy is not installed")
+        # Strings are returned as unicode columns rather than the UTF-8 bytes used on disk
+        dtype = [(name, 'U' + t[1:] if t.startswith('S') else t) for name, t in resolve_column_types(schema, columns)]
+        return numpy.array(list(zip(*(columns[name] for name, _ in schema))), dtype=dtype)
+    return {name: columns[name] for name, _ in schema}
+
+def compute_k4(trades, rates, year, stocks_data=None, currency_rates=None, output='auto'):
+    """Run the tax engine in-process.
+
+    Args:
+        trades: List of trade dictionaries in the IBKR flex format (as returned by read_input_file)
+        rates: List of currency rate dictionaries in the IBKR flex format
+        year: The tax year for which to generate the report
+        stocks_data: Optional portfolio at the start of the year, it is not modified
+        currency_rates: Optional predefined currency rates keyed by (date, currency)
+        output: 'frame', 'array', 'dict' or 'auto', see to_columnar
+
+    Returns:
+        dict: 'k4' rows, final 'portfolio', round-trip 'journal' (by entry date) and the raw
+              'stocks_data', 'k4_data', 'currency_rates' and 'statistics_data' engine state
+    """
+    stocks_data = copy.deepcopy(stocks_data) if stocks_data else {}
+    # The engine scales option prices in place, so work on copies
+    trades = [dict(trade) for trade in trades]
+    k4_data = {}
+    statistics_data = []
+    predefined_rates = currency_rates or {}
+    currency_rates = {}
+
+    k4_rows = process_trades(trades, rates, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates)
+    journal = journal_by_entry_date(build_win_rate_journal(statistics_data), year)
+
+    return {
+        'k4': to_columnar(K4_COLUMNS, k4_columns(k4_rows), output),
+        'portfolio': to_columnar(PORTFOLIO_COLUMNS, portfolio_columns(stocks_data), output),
+        'journal': to_columnar(JOURNAL_COLUMNS, journal_columns(journal), output),
+        'stocks_data': stocks_data,
+        'k4_data': k4_data,
+        'currency_rates': currency_rates,
+        'statistics_data': statistics_data,
+    }
@@ -0,0 +1,264 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Benchmark of the k4sru pipeline on synthetic trade histories.
+#
+# For each size a synthetic flex CSV file is generated in a temporary directory and the pipeline
+# is run on it with each stage timed: parse, dedup, rates, sort, engine, post_process, sru and
+# statistics. Every registered alternative engine is then checked against the reference engine
+# on the same trades, see equivalence.py. Before the sizes, the cold start of the command line is
+# measured with `python -X importtime irs.py --help` and checked against an import time budget.
+# The results are written as JSON:
+#
+#   {"python": "3.12.1", "year": 2025,
+#    "startup": {"import_ms": 9.1, "wall_seconds": 0.03, "budget_ms": 30.0, "within_budget": true,
+#                "modules": [["argparse", 5.2], ...]},
+#    "results": [
+#       {"trades": 1000, "file_bytes": 153204, "generate_seconds": 0.01,
+#        "stages": {"parse": 0.004, ...}, "total_seconds": 0.05, "trades_per_second": 20000.0,
+#        "equivalence": {"reference": {...}, "store": {"equivalent": true, "differences": [],
+#                        "seconds": 0.03, "speedup": 0.9}}}]}
+
+import contextlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from .data import process_transactions, print_statistics, read_input_file
+from .equivalence import check_equivalence
+from .sru import generate_blanketter_sru, OUTPUT_DIR
+from .synthetic import generate_flex_csv
+
+# Maximum import time of `irs.py --help` in milliseconds, interpreter startup (site) excluded
+DEFAULT_STARTUP_BUDGET_MS = 30.0
+
+IRS_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'irs.py')
+
+STAGES = ['parse', 'dedup', 'rates', 'sort', 'engine', 'post_process', 'sru', 'statistics']
+
+# Tax payer information written to the SRU file of the benchmark runs
+BENCH_CONFIG = {
+    'orgnr': '123456789012',
+    'namn': 'Benchmark',
+    'adress': 'Street 123',
+    'postnr': '12345',
+    'postort': 'City Name',
+    'email': 'benchmark@example.com',
+}
+
+def stage_timer(timings):
+    """Create a stage hook that adds the wall time of each stage to timings.
+
+    Args:
+        timings: Stage name -> seconds, updated in place
+    """
+    @contextlib.contextmanager
+    def stage(name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+    return stage
+
+def run_pipeline(filenames, year, config, stage, workers=None):
+    """Run the k4sru pipeline in the current directory, writing to the output directory.
+
+    Args:
+        filenames: List of input files
+        year: The tax year
+        config: Tax payer information for the SRU file
+        stage: Stage hook, see process_transactions
+        workers: Maximum number of worker processes used to parse the input files
+
+    Returns:
+        dict: Number of 'k4_rows' and 'journal' entries
+    """
+    stocks_data = {}
+    k4_data = {}
+    currency_rates = {}
+    statistics_data = []
+    transactions = process_transactions(filenames, year, stocks_data, k4_data, currency_rates, statistics_data, workers, stage)
+    with stage('sru'):
+        generate_blanketter_sru(config, transactions, False, year)
+    with stage('statistics'):
+        journal = print_statistics(statistics_data, k4_data, year)
+    return {'k4_rows': len(transactions), 'journal': len(journal)}
+
+def parse_importtime(output):
+    """Parse the output of python -X importtime.
+
+    Returns:
+        dict: Top level module -> cumulative import time in microseconds
+    """
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # Nested imports are indented, their time is included in the top level module
+        if not name.startswith('  ', 1):
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+def measure_startup(args=('--help',), runs=5):
+    """Measure the cold start of the command line.
+
+    Args:
+        args: Arguments of irs.py
+        runs: Number of runs, the median is reported
+
+    Returns:
+        dict: 'import_ms' (without the interpreter startup), 'wall_seconds' and the slowest top
+              level 'modules' as [name, milliseconds] of the median run
+    """
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-X', 'importtime', IRS_SCRIPT, *args],
+                                   capture_output=True, text=True)
+        wall_seconds = time.perf_counter() - start
+        modules = parse_importtime(completed.stderr)
+        for name in ('site', 'encodings'):
+            modules.pop(name, None)
+        samples.append((sum(modules.values()) / 1000, wall_seconds, modules))
+    import_ms, _, modules = sorted(samples, key=lambda sample: sample[0])[len(samples) // 2]
+    return {
+        'command': ' '.join(['irs.py', *args]),
+        'import_ms': import_ms,
+        'wall_seconds': statistics.median(sample[1] for sample in samples),
+        'modules': [[name, cumulative / 1000] for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:10]],
+    }
+
+def check_startup(budget_ms=DEFAULT_STARTUP_BUDGET_MS, runs=5):
+    """Measure the cold start of the command line and check it against the import time budget.
+
+    Returns:
+        dict: Result of measure_startup with 'budget_ms' and 'within_budget'
+    """
+    result = measure_startup(runs=runs)
+    result['budget_ms'] = budget_ms
+    result['within_budget'] = result['import_ms'] <= budget_ms
+    if result['within_budget']:
+        logging.info(f"Startup: {result['import_ms']:.1f} ms imports, budget {budget_ms:.1f} ms")
+    else:
+        logging.error(f"Startup: {result['import_ms']:.1f} ms imports exceeds the budget of {budget_ms:.1f} ms, slowest: " +
+                      ', '.join(f"{name} {ms:.1f} ms" for name, ms in result['modules'][:5]))
+    return result
+
+@contextlib.contextmanager
+def quiet_logging(level=logging.ERROR):
+    """Raise the logging level, the engine logs every trade at INFO and margin loans at WARNING."""
+    logger = logging.getLogger()
+    previous = logger.level
+    logger.setLevel(level)
+    try:
+        yield
+    finally:
+        logger.setLevel(previous)
+
+def benchmark_size(count, year, workdir, workers=None, engines=None, **generator_options):
+    """Generate a synthetic history with count trades and time the pipeline on it.
+
+    Args:
+        count: Number of trades
+        year: The tax year
+        workdir: Directory for the generated file
+        workers: Maximum number of worker processes used to parse the input files
+        engines: Names of the engines to check against the reference engine, all registered
+                 engines if None, no check if empty
+        generator_options: Options passed to generate_flex_csv
+
+    Returns:
+        dict: Benchmark result of this size
+    """
+    filename = os.path.join(workdir, f'synthetic_{count}.csv')
+    start = time.perf_counter()
+    generate_flex_csv(filename, count, year, **generator_options)
+    generate_seconds = time.perf_counter() - start
+
+    timings = {}
+    with quiet_logging():
+        counts = run_pipeline([filename], year, BENCH_CONFIG, stage_timer(timings), workers)
+    total = sum(timings.values())
+    result = {
+        'trades': count,
+        'file_bytes': os.path.getsize(filename),
+        'generate_seconds': generate_seconds,
+        'stages': {name: timings.get(name, 0.0) for name in STAGES},
+        'total_seconds': total,
+        'trades_per_second': count / total if total > 0 else 0.0,
+    }
+    result.update(counts)
+    if engines is None or engines:
+        with quiet_logging():
+            _, trades, rates = read_input_file(filename)
+            result['equivalence'] = check_equivalence(trades, rates, year, engines, config=BENCH_CONFIG)
+    os.remove(filename)
+    return result
+
+def run_benchmark(sizes, year, output, workers=None, engines=None, startup_budget_ms=DEFAULT_STARTUP_BUDGET_MS, **generator_options):
+    """Run the benchmark for each size and write the results as JSON.
+
+    The pipeline runs in a temporary directory, so the output directory of the current
+    directory is not touched except for the results file.
+
+    Args:
+        sizes: List of trade counts
+        year: The tax year of the synthetic trades
+        output: Path to the JSON results file
+        workers: Maximum number of worker processes used to parse the input files
+        engines: Names of the engines to check against the reference engine, see benchmark_size
+        startup_budget_ms: Import time budget of the command line, the startup is not checked if None
+        generator_options: Options passed to generate_flex_csv
+
+    Returns:
+        dict: The benchmark results
+    """
+    output = os.path.abspath(output)
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'year': year,
+        'generator': generator_options,
+        'results': [],
+    }
+    if startup_budget_ms is not None:
+        results['startup'] = check_startup(startup_budget_ms)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            for count in sizes:
+                result = benchmark_size(count, year, workdir, workers, engines, **generator_options)
+                results['results'].append(result)
+                logging.info(f"{count:>10} trades: {result['total_seconds']:.3f} s, {result['trades_per_second']:.0f} trades/s " +
+                             ' '.join(f"{name}={seconds:.3f}" for name, seconds in result['stages'].items()))
+                for name, check in result.get('equivalence', {}).items():
+                    if name != 'reference':
+                        logging.info(f"{count:>10} trades: engine {name} " +
+                                     (f"equivalent, {check['speedup']:.2f}x" if check['equivalent'] else "NOT equivalent to the reference engine"))
+        finally:
+            os.chdir(cwd)
+
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=4)
+    logging.info(f"Benchmark results saved to {output}")
+    return results
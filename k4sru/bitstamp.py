@@ -0,0 +1,128 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Streaming reader for Bitstamp transaction exports. Both export layouts are supported:
+#
+# Legacy export:
+#   Type,Datetime,Account,Amount,Value,Rate,Fee,Sub Type
+#   Market,"Jan. 05, 2021, 09:15 AM",Main Account,0.10000000 BTC,3000.00 USD,30000.00 USD,15.00 USD,Buy
+#
+# Current export:
+#   ID,Account,Object,Type,Subtype,Datetime,Amount,Amount currency,Value,Value currency,Rate,Rate currency,Fee,Fee currency,Order ID
+#   123,Main Account,Order,Market,Buy,2025-01-05T09:15:00Z,0.10000000,BTC,3000.00,USD,30000.00,USD,15.00,USD,456
+#
+# Each fill is converted to a trade in the IBKR flex format. Quantities are copied as exact
+# decimal strings (8 decimals for BTC) and are only converted to float by the engine, whose K4
+# quantity is rounded back to Decimal12_8 by get_k4_d_antal. Deposits, withdrawals and other
+# non-trade rows are skipped.
+
+import csv
+import logging
+from datetime import datetime, timezone
+from .streams import open_input, input_name
+
+BITSTAMP_EXCHANGE = 'BITSTAMP'
+
+def is_bitstamp_header(fields):
+    """Check if the CSV header fields are from a Bitstamp transaction export.
+
+    Args:
+        fields: List of column names
+    """
+    return 'Datetime' in fields and ('Sub Type' in fields or ('Subtype' in fields and 'Amount currency' in fields))
+
+def parse_bitstamp_datetime(value):
+    """Convert a Bitstamp date/time to the 'YYYYMMDD;HHMMSS' format used by the engine.
+
+    Args:
+        value: Date/time such as 'Jan. 05, 2021, 09:15 AM' or '2025-01-05T09:15:00Z'
+    """
+    value = value.strip()
+    if value[:4].isdigit():
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00').replace(' ', 'T', 1))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+    else:
+        # Month abbreviations are written as 'Jan.', 'May' and 'Sept.'
+        value = value.replace('.', '').replace('Sept', 'Sep')
+        parsed = datetime.strptime(value, '%b %d, %Y, %I:%M %p')
+    return parsed.strftime('%Y%m%d;%H%M%S')
+
+def split_amount(value):
+    """Split a legacy amount such as '0.10000000 BTC' into ('0.10000000', 'BTC')."""
+    amount, _, currency = value.strip().partition(' ')
+    return amount, currency
+
+def negate(amount):
+    """Negate a decimal string without converting it to float."""
+    amount = amount.strip()
+    if amount.startswith('-'):
+        return amount[1:]
+    return '-' + amount if amount.strip('0.') else amount
+
+def iter_bitstamp_csv(file):
+    """Stream the fills of a Bitstamp transaction export as IBKR flex trades.
+
+    Args:
+        file: Text file object with the Bitstamp CSV export
+
+    Yields:
+        dict: Trade dictionaries in the IBKR flex CSV format
+    """
+    for row in csv.DictReader(file):
+        if 'Sub Type' in row:
+            side = row['Sub Type']
+            quantity, symbol = split_amount(row['Amount'])
+            price, currency = split_amount(row['Rate'])
+            fee, _ = split_amount(row['Fee']) if row['Fee'] else ('0', '')
+            trade_id = ''
+        else:
+            side = row['Subtype']
+            quantity, symbol = row['Amount'], row['Amount currency']
+            price, currency = row['Rate'], row['Rate currency'] or row['Value currency']
+            fee = row['Fee'] or '0'
+            trade_id = row.get('ID', '')
+
+        if side not in ('Buy', 'Sell'):
+            logging.debug("Skipping Bitstamp %s row from %s", row.get('Type'), row['Datetime'])
+            continue
+
+        yield {
+            'DateTime': parse_bitstamp_datetime(row['Datetime']),
+            'Symbol': symbol,
+            'Buy/Sell': side.upper(),
+            'Quantity': quantity if side == 'Buy' else negate(quantity),
+            'TradePrice': price,
+            # Fees are positive in the export, IBKR commissions are negative
+            'IBCommission': negate(fee),
+            'CurrencyPrimary': currency,
+            'Description': symbol,
+            'ISIN': '',
+            'Exchange': BITSTAMP_EXCHANGE,
+            'TradeID': trade_id,
+        }
+
+def read_bitstamp_csv(filename):
+    """Read a Bitstamp transaction export.
+
+    Args:
+        filename: Path, '-' for standard input or binary file object, optionally gzip, xz or zstd compressed
+
+    Returns:
+        list: Trade dictionaries in the IBKR flex format
+    """
+    with open_input(filename, newline='') as file:
+        trades = list(iter_bitstamp_csv(file))
+    logging.info(f"{len(trades)} Bitstamp trades have been read from {input_name(filename)}.")
+    return trades
@@ -0,0 +1,172 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Content-addressed result cache of k4sru runs.
+#
+# The key of a run is the SHA-256 of everything the outputs depend on:
+#
+#   ENGINE_VERSION, the tax year and --longnames
+#   the content of the configuration file
+#   the content of each input file, in command line order (the file names do not matter)
+#   the content of input_portfolio_<year>.json and input_currency_rates_<year>.json, if present
+#
+# Each entry is a directory <cache dir>/<key>/ with a copy of INFO.SRU, BLANKETTER.SRU,
+# output_portfolio_<year>.json and trading_statistics_<year>.csv. On a hit the files are copied
+# back to the output directory, with the time on the #IDENTITET line of BLANKETTER.SRU set to
+# the time of the restore. The modification time of an entry is its last use; when the entries
+# exceed the size limit the least recently used ones are removed.
+#
+# ENGINE_VERSION must be increased when a change of the engine or the SRU rendering changes the
+# outputs for the same inputs.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from datetime import datetime
+from .data import expand_input_files
+from .sru import OUTPUT_DIR
+
+ENGINE_VERSION = 1
+
+def result_files(year):
+    """Get the names of the output files of a k4sru run, relative to the output directory."""
+    return ['INFO.SRU', 'BLANKETTER.SRU', f'output_portfolio_{year}.json', f'trading_statistics_{year}.csv']
+
+def file_digest(path):
+    """Get the SHA-256 hex digest of the content of a file, None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+def result_key(config_path, filenames, year, longnames):
+    """Compute the cache key of a k4sru run.
+
+    Args:
+        config_path: Path to the configuration file
+        filenames: List of input file names and glob patterns
+        year: The tax year
+        longnames: Use long names in the SRU file
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    parts = {
+        'engine_version': ENGINE_VERSION,
+        'year': year,
+        'longnames': bool(longnames),
+        'config': file_digest(config_path),
+        'inputs': [file_digest(filename) for filename in expand_input_files(filenames)],
+        'portfolio': file_digest(f'input/input_portfolio_{year}.json'),
+        'rates': file_digest(f'input/input_currency_rates_{year}.json'),
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def restamp_identitet(filename):
+    """Set the time on the #IDENTITET lines of an SRU file to now."""
+    with open(filename) as file:
+        content = file.read()
+    now = datetime.now().strftime('%Y%m%d %H%M%S')
+    content = re.sub(r'^(#IDENTITET \S*) \d{8} \d{6}$', lambda match: f'{match.group(1)} {now}', content, flags=re.MULTILINE)
+    with open(filename, 'w') as file:
+        file.write(content)
+
+def restore_result(cache_dir, key, year):
+    """Copy the outputs of a cached run to the output directory.
+
+    Args:
+        cache_dir: Path to the cache directory
+        key: Cache key, see result_key
+        year: The tax year
+
+    Returns:
+        bool: True on a hit, False if the run is not cached
+    """
+    entry = os.path.join(cache_dir, key)
+    names = result_files(year)
+    if not all(os.path.isfile(os.path.join(entry, name)) for name in names):
+        return False
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    for name in names:
+        shutil.copyfile(os.path.join(entry, name), OUTPUT_DIR + name)
+    restamp_identitet(OUTPUT_DIR + 'BLANKETTER.SRU')
+    # The modification time of the entry is its last use
+    os.utime(entry)
+    logging.info(f"Restored the outputs from the result cache ({key[:12]})")
+    return True
+
+def entry_size(entry):
+    return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+def store_result(cache_dir, key, year, max_bytes):
+    """Copy the outputs of a run to the cache and evict the least recently used entries.
+
+    Args:
+        cache_dir: Path to the cache directory
+        key: Cache key, see result_key
+        year: The tax year
+        max_bytes: Maximum total size of the cache entries
+    """
+    entry = os.path.join(cache_dir, key)
+    # Written to a temporary directory first, a concurrent run never sees a partial entry
+    partial = f'{entry}.tmp{os.getpid()}'
+    os.makedirs(partial, exist_ok=True)
+    for name in result_files(year):
+        shutil.copyfile(OUTPUT_DIR + name, os.path.join(partial, name))
+    if entry_size(partial) > max_bytes:
+        logging.info("The outputs are larger than the result cache, not cached")
+        shutil.rmtree(partial)
+        return
+    if os.path.isdir(entry):
+        shutil.rmtree(entry)
+    os.rename(partial, entry)
+    logging.debug(f"Stored the outputs in the result cache ({key[:12]})")
+    evict(cache_dir, max_bytes, keep=key)
+
+def evict(cache_dir, max_bytes, keep=None):
+    """Remove the least recently used cache entries until their total size is at most max_bytes.
+
+    Args:
+        cache_dir: Path to the cache directory
+        max_bytes: Maximum total size of the cache entries
+        keep: Key of an entry that is never removed
+
+    Returns:
+        list: Keys of the removed entries
+    """
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, key)
+        if os.path.isdir(entry) and '.tmp' not in key:
+            entries.append((os.path.getmtime(entry), key, entry_size(entry)))
+    total = sum(size for _, _, size in entries)
+    removed = []
+    for _, key, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, key))
+        total -= size
+        removed.append(key)
+    if removed:
+        logging.info(f"Evicted {len(removed)} entries from the result cache")
+    return removed
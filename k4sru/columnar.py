@@ -0,0 +1,268 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Columnar export of the K4 rows, the win rate journal and the portfolio.
+#
+# When pyarrow is installed the tables are written as Arrow IPC files (.arrow) that can be
+# memory-mapped with pyarrow.memory_map() / pandas.read_feather(). Otherwise a fixed-width
+# binary file (.col) is written with the following layout (all integers little-endian):
+#
+#   offset 0   8 bytes   magic b'IRSCOL1\n'
+#   offset 8   4 bytes   uint32 length N of the JSON header
+#   offset 12  N bytes   UTF-8 JSON header:
+#                          {"table": "k4", "rows": 3, "record_size": 120, "data_offset": 256,
+#                           "columns": [{"name": "beteckning", "type": "S32", "offset": 0}, ...]}
+#   data_offset          rows * record_size bytes, one packed record per row
+#
+# Column types are NumPy dtype strings: 'f8' (float64), 'i8' (int64), '?' (bool) and 'S<n>'
+# (UTF-8 bytes, NUL padded to n bytes). data_offset is 8-byte aligned, so the data block can
+# be opened without parsing, e.g.
+#
+#   dtype = numpy.dtype({'names': [...], 'formats': [...], 'offsets': [...], 'itemsize': record_size})
+#   rows = numpy.memmap(path, dtype=dtype, mode='r', offset=data_offset, shape=(rows,))
+
+import json
+import logging
+import math
+import mmap
+import struct
+import sys
+from .sru import OUTPUT_DIR
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+COLUMNAR_MAGIC = b'IRSCOL1\n'
+
+# Column name and type for each exported table. String widths are derived from the data.
+K4_COLUMNS = [
+    ('beteckning', 'S'),
+    ('beskrivning', 'S'),
+    ('antal', 'f8'),
+    ('forsaljningspris', 'i8'),
+    ('omkostnadsbelopp', 'i8'),
+]
+
+JOURNAL_COLUMNS = [
+    ('date', 'S'),
+    ('entry_date', 'S'),
+    ('symbol', 'S'),
+    ('description', 'S'),
+    ('profit_loss', 'f8'),
+    ('profit_loss_percentage', 'f8'),
+    ('duration', 'i8'),
+    ('win', '?'),
+]
+
+PORTFOLIO_COLUMNS = [
+    ('symbol', 'S'),
+    ('entry_date', 'S'),
+    ('quantity', 'f8'),
+    ('totalprice', 'f8'),
+    ('avgprice', 'f8'),
+    ('totalpriceusd', 'f8'),
+    ('avgpriceusd', 'f8'),
+]
+
+STRUCT_CODES = {'f8': 'd', 'i8': 'q', '?': '?'}
+
+def k4_columns(k4_rows):
+    """Convert post-processed K4 rows to columns.
+
+    Args:
+        k4_rows: List of K4 rows as returned by post_process_trading_data
+
+    Returns:
+        dict: Column name -> list of values
+    """
+    return {
+        'beteckning': [row['beteckning'] for row in k4_rows],
+        'beskrivning': [row['beskrivning'] for row in k4_rows],
+        # Decimal12_8 quantities (BTC) are formatted as strings by get_k4_d_antal
+        'antal': [float(row['antal']) for row in k4_rows],
+        'forsaljningspris': [int(row['forsaljningspris']) for row in k4_rows],
+        'omkostnadsbelopp': [int(row['omkostnadsbelopp']) for row in k4_rows],
+    }
+
+def journal_columns(journal):
+    """Convert the win rate journal to columns.
+
+    Args:
+        journal: List of journal entries as returned by print_win_rate_statistics
+    """
+    return {name: [entry[name] for entry in journal] for name, _ in JOURNAL_COLUMNS}
+
+def portfolio_columns(stocks_data):
+    """Convert the portfolio to columns. Closed positions are left out, as in save_stocks_data.
+
+    Args:
+        stocks_data: Dictionary of stock data keyed by symbol
+    """
+    positions = [(symbol, data) for symbol, data in stocks_data.items() if data['quantity'] != 0]
+    return {
+        'symbol': [symbol for symbol, _ in positions],
+        'entry_date': [data.get('entry_date', '') for _, data in positions],
+        'quantity': [float(data['quantity']) for _, data in positions],
+        'totalprice': [float(data['totalprice']) for _, data in positions],
+        'avgprice': [float(data['avgprice']) for _, data in positions],
+        # USD statistics are only kept for stocks bought in a foreign currency
+        'totalpriceusd': [float(data.get('totalpriceusd', math.nan)) for _, data in positions],
+        'avgpriceusd': [float(data.get('avgpriceusd', math.nan)) for _, data in positions],
+    }
+
+def resolve_column_types(schema, columns):
+    """Resolve the width of string columns from the data.
+
+    Returns:
+        list: (name, type) tuples where string columns have the type 'S<width>'
+    """
+    resolved = []
+    for name, column_type in schema:
+        if column_type == 'S':
+            width = max((len(value.encode('utf-8')) for value in columns[name]), default=0)
+            column_type = f'S{max(width, 1)}'
+        resolved.append((name, column_type))
+    return resolved
+
+def write_fixed_width(filename, table, schema, columns):
+    """Write columns to a fixed-width binary file, see the layout at the top of this module.
+
+    Args:
+        filename: Path to the output file
+        table: Table name stored in the header
+        schema: List of (name, type) tuples
+        columns: Column name -> list of values
+    """
+    resolved = resolve_column_types(schema, columns)
+    row_format = '<' + ''.join(STRUCT_CODES.get(t, t[1:] + 's') for _, t in resolved)
+    record = struct.Struct(row_format)
+    rows = len(columns[schema[0][0]])
+
+    header_columns = []
+    offset = 0
+    for name, column_type in resolved:
+        header_columns.append({'name': name, 'type': column_type, 'offset': offset})
+        offset += struct.calcsize('<' + STRUCT_CODES.get(column_type, column_type[1:] + 's'))
+
+    header = {'table': table, 'rows': rows, 'record_size': record.size, 'data_offset': 0, 'columns': header_columns}
+    # The data offset is part of the header, so iterate until its length is stable
+    while True:
+        header_bytes = json.dumps(header).encode('utf-8')
+        data_offset = -(-(len(COLUMNAR_MAGIC) + 4 + len(header_bytes)) // 8) * 8
+        if header['data_offset'] == data_offset:
+            break
+        header['data_offset'] = data_offset
+
+    encoders = [(lambda v: v.encode('utf-8')) if t.startswith('S') else (lambda v: v) for _, t in resolved]
+    values = [columns[name] for name, _ in resolved]
+    with open(filename, 'wb') as file:
+        file.write(COLUMNAR_MAGIC)
+        file.write(struct.pack('<I', len(header_bytes)))
+        file.write(header_bytes)
+        file.write(b'\0' * (data_offset - len(COLUMNAR_MAGIC) - 4 - len(header_bytes)))
+        for row in zip(*values):
+            file.write(record.pack(*(encode(v) for encode, v in zip(encoders, row))))
+
+def read_fixed_width(filename):
+    """Read a fixed-width binary file written by write_fixed_width.
+
+    The file is memory-mapped and the records are unpacked directly from the mapping.
+
+    Returns:
+        tuple: (header, columns) where columns maps column name -> list of values
+    """
+    with open(filename, 'rb') as file:
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{filename} is not a columnar export file.")
+        (header_length,) = struct.unpack('<I', file.read(4))
+        header = json.loads(file.read(header_length))
+        row_format = '<' + ''.join(STRUCT_CODES.get(c['type'], c['type'][1:] + 's') for c in header['columns'])
+        names = [c['name'] for c in header['columns']]
+        columns = {name: [] for name in names}
+        if header['rows'] == 0:
+            return header, columns
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = header['data_offset'] + header['rows'] * header['record_size']
+            with memoryview(data)[header['data_offset']:end] as records:
+                for row in struct.iter_unpack(row_format, records):
+                    for name, column, value in zip(names, header['columns'], row):
+                        if column['type'].startswith('S'):
+                            value = value.rstrip(b'\0').decode('utf-8')
+                        columns[name].append(value)
+    return header, columns
+
+def write_arrow(filename, schema, columns):
+    """Write columns to an Arrow IPC file.
+
+    Args:
+        filename: Path to the output file
+        schema: List of (name, type) tuples
+        columns: Column name -> list of values
+    """
+    arrow_types = {'S': pyarrow.string(), 'f8': pyarrow.float64(), 'i8': pyarrow.int64(), '?': pyarrow.bool_()}
+    table = pyarrow.table({name: pyarrow.array(columns[name], type=arrow_types[t]) for name, t in schema})
+    with pyarrow.OSFile(filename, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def resolve_columnar_format(columnar_format):
+    """Resolve the columnar format before anything is written, stop if it cannot be written.
+
+    Args:
+        columnar_format: 'arrow', 'fixed' or 'auto' (Arrow when pyarrow is installed)
+
+    Returns:
+        str: 'arrow' or 'fixed'
+    """
+    if columnar_format == 'auto':
+        return 'arrow' if pyarrow is not None else 'fixed'
+    if columnar_format == 'arrow' and pyarrow is None:
+        logging.error("Arrow export requested but pyarrow is not installed, install pyarrow or use --columnar fixed")
+        sys.exit(1)
+    return columnar_format
+
+def export_columnar(year, k4_rows, journal, stocks_data, columnar_format='auto'):
+    """Export the K4 rows, the journal and the portfolio in a columnar format.
+
+    Args:
+        year: The tax year, used in the file names
+        k4_rows: List of post-processed K4 rows
+        journal: List of journal entries (by entry date)
+        stocks_data: Dictionary of stock data at the end of the year
+        columnar_format: 'arrow', 'fixed' or 'auto' (Arrow when pyarrow is installed)
+
+    Returns:
+        list: Paths of the written files
+    """
+    columnar_format = resolve_columnar_format(columnar_format)
+
+    tables = [
+        ('k4', K4_COLUMNS, k4_columns(k4_rows)),
+        ('journal', JOURNAL_COLUMNS, journal_columns(journal)),
+        ('portfolio', PORTFOLIO_COLUMNS, portfolio_columns(stocks_data)),
+    ]
+    filenames = []
+    for table, schema, columns in tables:
+        if columnar_format == 'arrow':
+            filename = f'{OUTPUT_DIR}{table}_{year}.arrow'
+            write_arrow(filename, schema, columns)
+        else:
+            filename = f'{OUTPUT_DIR}{table}_{year}.col'
+            write_fixed_width(filename, table, schema, columns)
+        filenames.append(filename)
+        logging.info(f"Saved columnar {table} data for {year} to {filename}")
+    return filenames
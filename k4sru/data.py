@@ -15,11 +15,20 @@
 import logging
 import sys
 import csv
+import contextlib
+import glob
 import json
+import os
+import time
+from collections import Counter
 from datetime import datetime
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 from pprint import pformat
 from .sru import CURRENCY_CODES, OUTPUT_DIR
+from .parsers import iter_input
+from .streams import STDIN, open_input, input_name
+from . import metrics
+from . import lineage
 
 # Base currency for all calculations
 BASE_CURRENCY = "SEK"
@@ -63,6 +72,7 @@ def process_k4_entry(symbol, description, quantity, trade_price, commission, avg
         date: Date of the transaction
     """
     logging.info("    ==> Processing k4 entry: %s (%s), %s, %s, %s, %s, %s, %s, %s", symbol, description, quantity, trade_price, commission, avg_price, currency, date, entry_date)
+    metrics.branch('k4.base' if currency == BASE_CURRENCY else 'k4.foreign')
     if currency == BASE_CURRENCY:
         if symbol not in k4_data:
             k4_data[symbol] = {
@@ -82,6 +92,7 @@ def process_k4_entry(symbol, description, quantity, trade_price, commission, avg
             profit_loss = (-quantity * trade_price - commission) - (-quantity * avg_price)
             profit_loss_percentage = (profit_loss / (-quantity * avg_price)) * 100 if (-quantity * avg_price) != 0 else 0
             update_statistics_data(statistics_data, date, symbol, description, initial_quantity, quantity, profit_loss, profit_loss_percentage, entry_date)
+        lineage.record(symbol, description, -quantity, -quantity * trade_price - commission, -quantity * avg_price)
 
         logging.info("    ==> K4 Tax event - Profit/Loss: %.2f (%.2f%%)", profit_loss, profit_loss_percentage)
     else:
@@ -104,6 +115,7 @@ def process_k4_entry(symbol, description, quantity, trade_price, commission, avg
             profit_loss = (-quantity * trade_price - commission) * currency_rate - (-quantity * avg_price)
             profit_loss_percentage = (profit_loss / (-quantity * avg_price)) * 100 if (-quantity * avg_price) != 0 else 0
             update_statistics_data(statistics_data, date, symbol, description, initial_quantity, quantity, profit_loss, profit_loss_percentage, entry_date)
+        lineage.record(symbol, description, -quantity, (-quantity * trade_price - commission) * currency_rate, -quantity * avg_price)
 
         logging.info("    ==> K4 Tax event - Profit/Loss: %.2f (%.2f%%)", profit_loss, profit_loss_percentage)
 
@@ -236,10 +248,12 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
         #    logging.debug(f"   Updated currency rate for {date} {base}: {currency_rates[(date, base)]}")
 
         logging.debug(f"   Action (1/1): Buy {base} for {quote}")
+        metrics.branch('UC-2' if '.' in symbol else 'UC-1')
 
         if base not in stocks_data:
             # First buy entry for this stock
             logging.debug("      first buy entry for %s", base)
+            metrics.branch('buy_base.first')
             stocks_data[base] = {
                 'entry_date': date,
                 'quantity': quantity,
@@ -248,6 +262,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
             stocks_data[base]['avgprice'] = stocks_data[base]['totalprice'] / stocks_data[base]['quantity']
         elif stocks_data[base]['quantity'] >= 0:
             # Normal case, long position
+            metrics.branch('buy_base.long')
             # Update entry_date if a new position is opened in stock that was already held previously
             if stocks_data[base]['quantity'] == 0:
                 stocks_data[base]['entry_date'] = date
@@ -257,6 +272,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
         elif stocks_data[base]['quantity'] + quantity >= 0:
             # Cover margin loan with new buy entry
             logging.debug("      buying (covering) %s %s, total margin loan %s ", quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('buy_base.cover')
             credit = stocks_data[base]['quantity']  # negative value
             surplus = credit + quantity
             # Since the transaction includes both a covering of a short and the opening of a long position, and only one commission applies,
@@ -295,6 +311,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
         else:
             # Cover part of margin loan with new buy entry
             logging.debug("      buying (covering partial) %s %s, total margin loan %s ", quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('buy_base.partial_cover')
             commission_per_share = commission / quantity
             unit_price = trade_price + commission_per_share
             entry_date = stocks_data[base]['entry_date'] if 'entry_date' in stocks_data[base] else date
@@ -330,11 +347,12 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
             base = symbol
             quote = currency
 
-        if ' ' in base and any(c.isdigit() for c in base):
+        if is_option(base):
             logging.info(f"    buy entry {base} is an options contract")
 
         currency_rate = get_currency_rate(date, currency, currency_rates)
         logging.debug(f"   Action (1/2): Sell {currency} for {BASE_CURRENCY}")
+        metrics.branch('UC-4' if '.' in symbol else 'UC-3')
 
         if currency not in stocks_data:
             logging.debug("      first sell entry for %s", base)
@@ -347,6 +365,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
 
         if stocks_data[currency]['quantity'] - (quantity * trade_price + commission) >= 0:
             # Sell currency e.g. USD
+            metrics.branch('buy_foreign.currency_sell')
             entry_date = stocks_data[currency]['entry_date'] if 'entry_date' in stocks_data[currency] else date
             process_k4_entry(
                 symbol=currency,
@@ -366,6 +385,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
             process_currency_sell(currency, quantity*trade_price+commission, currency_rate, stocks_data, date)
         elif stocks_data[currency]['quantity'] >= 0:
             logging.warning("      (margin loan new) selling %s %s, but only %s available ", quantity*trade_price+commission, currency, stocks_data[currency]['quantity'])
+            metrics.branch('buy_foreign.currency_margin_loan_new')
             # Sell currency e.g. USD
             total_balance = stocks_data[currency]['quantity']
             credit = (quantity * trade_price + commission) - total_balance
@@ -393,6 +413,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
             process_currency_sell(currency, credit, currency_rate, stocks_data, date)
         else:
             logging.warning("      (margin loan add) new margin loan %s %s, added to existing loan %s ", quantity*trade_price+commission, currency, stocks_data[currency]['quantity'])
+            metrics.branch('buy_foreign.currency_margin_loan_add')
             process_currency_sell(currency, quantity * trade_price + commission, currency_rate, stocks_data, date)
 
 
@@ -400,6 +421,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
 
         if base not in stocks_data:
             logging.debug("      first buy entry for %s", base)
+            metrics.branch('buy_foreign.first')
             stocks_data[base] = {
                 'entry_date': date,
                 'quantity': quantity,
@@ -409,6 +431,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
             usd_statistics_first_buy(stocks_data, base, (quantity * trade_price + commission))
         elif stocks_data[base]['quantity'] >= 0:
             # Update entry_date if a new position is opened in stock that was already held previously
+            metrics.branch('buy_foreign.long')
             if stocks_data[base]['quantity'] == 0:
                 stocks_data[base]['entry_date'] = date
             stocks_data[base]['quantity'] += quantity
@@ -418,6 +441,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
         elif stocks_data[base]['quantity'] + quantity >= 0:
             # Cover margin loan with new buy entry
             logging.debug("      buying (covering) %s %s, total margin loan %s ", quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('buy_foreign.cover')
             credit = stocks_data[base]['quantity'] # negative value
             surplus = credit + quantity
             # Since the transaction includes both a covering of a short and the opening of a long position, and only one commission applies,
@@ -456,6 +480,7 @@ def process_buy_entry(symbol, description, quantity, trade_price, commission, cu
         else:
             # Cover part of margin loan with new buy entry
             logging.debug("      buying (covering partial) %s %s, total margin loan %s ", quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('buy_foreign.partial_cover')
             commission_per_share = commission / quantity
             unit_price = (trade_price + commission_per_share) * currency_rate
             entry_date = stocks_data[base]['entry_date'] if 'entry_date' in stocks_data[base] else date
@@ -515,6 +540,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
     #logging.debug(f'   Split symbol into base: {base} and quote: {quote}')
     if base not in stocks_data:
         logging.warning(f"    First sell entry for {base}, initializing stocks_data")
+        metrics.branch('sell.first')
         stocks_data[base] = {
             'quantity': 0,
             'totalprice': 0,
@@ -528,8 +554,10 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
         #       Transactions: Sell USD
 
         logging.debug(f"   Action (1/1): Sell {base} for {quote}")
+        metrics.branch('UC-6' if '.' in symbol else 'UC-5')
         if stocks_data[base]['quantity'] + quantity >= 0:
             # Normal case, selling shares from long position
+            metrics.branch('sell_base.long')
             entry_date = stocks_data[base]['entry_date'] if 'entry_date' in stocks_data[base] else date
             process_k4_entry(
                 symbol=base,
@@ -559,6 +587,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
         elif stocks_data[base]['quantity'] > 0:
             # New margin loan, selling more shares than available
             logging.warning("      (new margin loan) selling %s %s, but only %s available ", -quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('sell_base.short_new')
             total_balance = stocks_data[base]['quantity']
             credit = total_balance + quantity
             # Since the transaction includes both a realized sale and the opening of a short position, and only one commission applies,
@@ -589,6 +618,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
         else:
             # Add to margin loan, selling more shares than available
             logging.debug("      (margin loan add) new margin loan %s %s, added to existing loan %s ", -quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('sell_base.short_add')
             stocks_data[base]['quantity'] += quantity
             stocks_data[base]['totalprice'] += quantity * trade_price + commission
             stocks_data[base]['avgprice'] = stocks_data[base]['totalprice'] / stocks_data[base]['quantity']
@@ -603,6 +633,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
 
         currency_rate = get_currency_rate(date, currency, currency_rates)
         logging.debug(f"   Action (1/2): Buy {currency} for {quote}")
+        metrics.branch('UC-8' if '.' in symbol else 'UC-7')
         if currency not in stocks_data:
             logging.debug("      first buy entry for %s", base)
             stocks_data[currency] = {
@@ -615,9 +646,11 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
         if stocks_data[currency]['quantity'] >= 0:
             # Quantity is negative for sell entries, commission is turned positive in process_input_data.
             # Total amount of currency received is quantity * trade_price + commission e.g. -10 * 10 + 1 = -99
+            metrics.branch('sell_foreign.currency_buy')
             process_currency_buy(currency, quantity * trade_price + commission, currency_rate, stocks_data, date)
         elif stocks_data[currency]['quantity'] + (-quantity * trade_price - commission) >= 0:
             logging.debug("      paying back %s %s, of total margin loan %s %s", -(quantity * trade_price + commission), currency, stocks_data[currency]['quantity'], currency)
+            metrics.branch('sell_foreign.currency_margin_loan_payback')
             credit = stocks_data[currency]['quantity'] # negative value
             surplus = credit + -(quantity * trade_price + commission)
             entry_date = stocks_data[currency]['entry_date'] if 'entry_date' in stocks_data[currency] else date
@@ -641,6 +674,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
             process_currency_buy(currency, -surplus, currency_rate, stocks_data, date)
         else:
             logging.debug("      covering (partial) %s %s, of total margin loan %s %s", -(quantity * trade_price + commission), currency, stocks_data[currency]['quantity'], currency)
+            metrics.branch('sell_foreign.currency_margin_loan_partial_cover')
             cover_amount = (quantity * trade_price + commission) # Keep the amount negative for processing
             entry_date = stocks_data[currency]['entry_date'] if 'entry_date' in stocks_data[currency] else date
             process_k4_entry(
@@ -665,6 +699,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
 
         if stocks_data[base]['quantity'] + quantity >= 0:
             # Normal case, selling shares from long position
+            metrics.branch('sell_foreign.long')
             entry_date = stocks_data[base]['entry_date'] if 'entry_date' in stocks_data[base] else date
             process_k4_entry(
                 symbol=base,
@@ -695,6 +730,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
         elif stocks_data[base]['quantity'] > 0:
             # New margin loan, selling more shares than available
             logging.warning("      (new margin loan) selling %s %s, but only %s available ", -quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('sell_foreign.short_new')
             total_balance = stocks_data[base]['quantity']
             credit = total_balance + quantity
             # Since the transaction includes both a realized sale and the opening of a short position, and only one commission applies,
@@ -725,6 +761,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
         else:
             # Add to margin loan, selling more shares than available
             logging.debug("      (margin loan add) new margin loan %s %s, added to existing loan %s ", -quantity, base, stocks_data[base]['quantity'])
+            metrics.branch('sell_foreign.short_add')
             stocks_data[base]['quantity'] += quantity
             stocks_data[base]['totalprice'] += (quantity * trade_price + commission) * currency_rate
             stocks_data[base]['avgprice'] = stocks_data[base]['totalprice'] / stocks_data[base]['quantity']
@@ -736,6 +773,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
     # that was set to handle float errors with fractional shares.
     if base == 'BTC' and abs(stocks_data[base]['quantity']) < 0.002:
         logging.warning("Sell entry processed for %s with satoshis, quantity: %s", base, stocks_data[base]['quantity'])
+        metrics.branch('sell.btc_dust')
         stocks_data[base]['quantity'] = 0
         stocks_data[base]['avgprice'] = 0
         if stocks_data[base]['totalprice'] < 100.0:
@@ -745,6 +783,7 @@ def process_sell_entry(symbol, description, quantity, trade_price, commission, c
 
     if 0 < abs(stocks_data[base]['quantity']) < 0.0001:  # handle float error with fractional shares
         logging.debug("   Rounding error when processing %s, quantity: %s", base, stocks_data[base]['quantity'])
+        metrics.branch('sell.rounding')
         stocks_data[base]['quantity'] = 0
         stocks_data[base]['avgprice'] = 0
         # Delete entry_date from stocks_data
@@ -771,10 +810,13 @@ def process_input_data(data, stocks_data, k4_data, currency_rates, statistics_da
         commission = -float(entry['IBCommission']) # Input is negative in IBKR CSV file
         currency = entry['CurrencyPrimary']
 
+        sample_start = metrics.start_trade()
+        lineage.start_trade(entry)
         if entry['Buy/Sell'] == 'BUY':
             process_buy_entry(symbol, description, quantity, trade_price, commission, currency, date, stocks_data, k4_data, currency_rates, statistics_data)
         elif entry['Buy/Sell'] == 'SELL':
             process_sell_entry(symbol, description, quantity, trade_price, commission, currency, date, stocks_data, k4_data, currency_rates, statistics_data)
+        metrics.end_trade(sample_start)
 
 def process_trading_data(data, stocks_data, k4_data, currency_rates, statistics_data):
     """Process the trading data for K4 tax reporting.
@@ -787,108 +829,155 @@ def process_trading_data(data, stocks_data, k4_data, currency_rates, statistics_
     output = sorted(k4_data.values(), key=lambda x: x['beteckning'])
     return output
 
-def verify_input_fields(required_fields, data):
-    """Verify the input fields in the transaction data.
+def expand_input_files(patterns):
+    """Expand file names and glob patterns to a list of input files.
 
     Args:
-        required_fields: List of required fields that should be present in each transaction entry
-        data: List of dictionaries containing transaction data
+        patterns: List of file names and glob patterns
 
     Returns:
-        bool: True if the data is valid, False otherwise
+        list: File names in command line order, sorted within each pattern
     """
-    for entry in data:
-        missing = [field for field in required_fields if field not in entry]
-        if missing:
-            logging.error("Missing required fields in entry: %s", entry)
-            logging.error("Missing fields: %s", missing)
-            return False
-    return True
-
-def verify_input_data(lines):
-    """Verify the input data for Interactive Brokers transactions.
+    filenames = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logging.error("No input files match %s", pattern)
+            sys.exit(1)
+        filenames.extend(match for match in matches if match not in filenames)
+    return filenames
+
+def read_input_file(filename):
+    """Read trades and currency rates from an input file of any registered format.
 
     Args:
-        data: List of dictionaries containing transaction data
+        filename: Path to the input file or '-' for standard input
 
     Returns:
-        bool: True if the data is valid, False otherwise
+        tuple: (filename, trades, rates)
     """
+    trades = []
+    rates = []
+    for kind, record in iter_input(filename):
+        if kind == 'trade':
+            trades.append(record)
+        else:
+            rates.append(record)
+    logging.info(f"{len(trades)} stock trades and {len(rates)} currency rates have been read from {input_name(filename)}.")
+    return filename, trades, rates
 
-    # Find where the currency rates section starts
-    try:
-        # Find the index where the currency rates section starts
-        # This is determined by the first line that has fewer fields than the first line
-        # of the trades section, which is assumed to be the longest line.
-        split_index = next(i for i, line in enumerate(lines) if len(line.strip().split(',')) < len(lines[0].strip().split(',')))
-    except StopIteration:
-        logging.error("No currency rates section found in the input data.")
-        sys.exit(1)
+def read_input_file_timed(filename):
+    """Read an input file like read_input_file and measure where and when it was parsed.
 
-    # Read trades
-    trades_reader = list(csv.DictReader(lines[:split_index]))
+    Returns:
+        tuple: (filename, trades, rates, (pid, start, end)) with the wall clock start and end in seconds
+    """
+    start = time.time()
+    result = read_input_file(filename)
+    return result + ((os.getpid(), start, time.time()),)
 
-    # Mandatory fields in the IBKR CSV file:
-    # "DateTime","Symbol","Buy/Sell","Quantity","TradePrice","IBCommission","CurrencyPrimary","Description","ISIN","Exchange"
-    # Not used fields: "ISIN", "Exchange"
-    required_fields = ['DateTime', 'Symbol', 'Buy/Sell', 'Quantity', 'TradePrice', 'IBCommission', 'CurrencyPrimary', 'Description', 'ISIN', 'Exchange']
-    if not verify_input_fields(required_fields, trades_reader):
-        logging.error("Trade data verification failed.")
-        sys.exit(1)
+def read_input_files(patterns, workers=None, file_spans=None):
+    """Read all input files, in parallel worker processes when there is more than one file.
 
-    # Read currency rates
-    rates_reader = list(csv.DictReader(lines[split_index:]))
+    Args:
+        patterns: List of file names, glob patterns and '-' for standard input
+        workers: Maximum number of worker processes, the number of CPUs if None
+        file_spans: Optional list, a {'file', 'pid', 'start', 'end'} dictionary is appended for each
+                    parsed file with the process that parsed it and the wall clock times in seconds
 
-    # Mandatory fields in the currency rates section:
-    # "Date/Time","FromCurrency","ToCurrency","Rate"
-    required_fields_rates = ['Date/Time', 'FromCurrency', 'ToCurrency', 'Rate']
-    if not verify_input_fields(required_fields_rates, rates_reader):
-        logging.error("Currency rates data verification failed.")
+    Returns:
+        list: (filename, trades, rates) tuples in command line order
+    """
+    filenames = expand_input_files(patterns)
+    if filenames.count(STDIN) > 1:
+        logging.error("Standard input can only be read once")
         sys.exit(1)
+    read = read_input_file if file_spans is None else read_input_file_timed
+    # Standard input is inherited, not shared, by the worker processes so it is read here
+    files = [filename for filename in filenames if filename != STDIN]
+    workers = min(len(files), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        results = [read(filename) for filename in filenames]
+    else:
+        # Imported on first use, a single input file is parsed in this process
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {filename: executor.submit(read, filename) for filename in files}
+            stdin_result = read(STDIN) if STDIN in filenames else None
+            results = [stdin_result if filename == STDIN else futures[filename].result() for filename in filenames]
+
+    if file_spans is None:
+        return results
+    for filename, _, _, (pid, start, end) in results:
+        file_spans.append({'file': input_name(filename), 'pid': pid, 'start': start, 'end': end})
+    return [result[:3] for result in results]
+
+def canonical_number(value):
+    """Format a number without trailing zeros so that e.g. "2", "2.0" and 2.0 compare equal.
 
-    return trades_reader, rates_reader
+    Args:
+        value: Number or numeric string
+    """
+    try:
+        return f"{Decimal(str(value)).normalize():f}"
+    except InvalidOperation:
+        return str(value)
 
-def read_csv_ibkr(filename):
-    """Read CSV file with Interactive Brokers transactions.
+def trade_identity(trade):
+    """Get the canonical identity of a trade, used to find the same fill in overlapping exports.
 
     Args:
-        filename: Path to the CSV file
+        trade: Trade dictionary in the IBKR flex format
 
     Returns:
-        tuple: (stock_trades, forex_trades, currency_rates) where each is a list of dictionaries
+        tuple: (date, symbol, side, quantity, price, commission, exchange)
     """
+    return (trade['DateTime'],
+            trade['Symbol'],
+            trade['Buy/Sell'],
+            canonical_number(trade['Quantity']),
+            canonical_number(trade['TradePrice']),
+            canonical_number(trade['IBCommission']),
+            trade.get('Exchange', ''))
 
-    with open(filename, 'r') as csvfile:
-        lines = csvfile.readlines()
-        trades_reader, rates_reader = verify_input_data(lines)
-
-    logging.info(f"{len(trades_reader)} stock trades and {len(rates_reader)} currency rates have been read from {filename}.")
-    return trades_reader, rates_reader
-
+def deduplicate_trades(sources):
+    """Combine trades from several sources and drop fills that are repeated in an overlapping source.
 
-def read_csv_bitstamp(filename):
-    """Read CSV file with Bitstamp transactions. The file is expected to be in IBRK format.
+    A fill is identified by trade_identity. Identical fills within one source are kept, so a fill
+    occurring n times in the source where it occurs most often is kept n times.
 
     Args:
-        filename: Path to the CSV file
+        sources: List of (name, trades) tuples
 
     Returns:
-        tuple: (stock_trades, forex_trades, currency_rates) where each is a list of dictionaries
+        tuple: (trades, duplicates) where duplicates is a list of (name, trade) tuples
     """
-    with open(filename, 'r') as csvfile:
-        lines = csvfile.readlines()
-        trades_reader = list(csv.DictReader(lines))
-        logging.debug(f"Processed {len(trades_reader)} Bitstamp trades")
-        logging.debug("==> Bitstamp trades:\n%s", pformat(trades_reader, indent=4))
-
-    return trades_reader
+    kept = Counter()
+    trades = []
+    duplicates = []
+    for name, source_trades in sources:
+        seen = Counter()
+        for trade in source_trades:
+            identity = trade_identity(trade)
+            seen[identity] += 1
+            if seen[identity] > kept[identity]:
+                kept[identity] += 1
+                trades.append(trade)
+            else:
+                duplicates.append((name, trade))
 
+    if duplicates:
+        logging.warning("%s duplicate trades found in overlapping input files have been removed:", len(duplicates))
+        for name, trade in duplicates:
+            logging.warning("    duplicate in %s: %s %s %s %s @ %s", name, trade['DateTime'], trade['Buy/Sell'], trade['Quantity'], trade['Symbol'], trade['TradePrice'])
+    return trades, duplicates
 
-def process_currency_rates(rates, currency_rates, year):
+def process_currency_rates(rates, currency_rates, year, predefined_rates=None):
     """Process currency exchange rates from the CSV file.
 
     Args:
         rates: List of dictionaries containing currency rate data
+        predefined_rates: Predefined rates keyed by (date, currency), read from input_currency_rates_<year>.json if None
     """
     for rate in rates:
         if rate['FromCurrency'] == 'SEK':
@@ -913,7 +1002,7 @@ def process_currency_rates(rates, currency_rates, year):
             currency_rates[key] = usdsek * value
 
     # Load predefined currency rates and merge with the processed rates above
-    currency_rates_init = init_currency_rates(year)
+    currency_rates_init = init_currency_rates(year) if predefined_rates is None else predefined_rates
 
     # Merge the two dictionaries
     for key, value in currency_rates_init.items():
@@ -965,7 +1054,7 @@ def get_k4_d_antal(antal, beteckning, year):
         beteckning: The symbol of the stock or currency
         year: The tax year for which to generate the report
     """
-    if int(year) >= 2025 and beteckning == "BTC":
+    if year >= 2025 and beteckning == "BTC":
         return round_to_decimal12_8(antal)
     else:
         return round(antal)
@@ -1015,7 +1104,7 @@ def init_currency_rates(year):
         year: The year to initialize the currency rates for
     """
     try:
-        with open(f'input/input_currency_rates_{year}.json', 'r') as file:
+        with open_input(f'input/input_currency_rates_{year}.json') as file:
             currency_rates_raw = json.load(file)
             # Convert string keys back to tuple keys
             currency_rates = {tuple(key.split("_")): value for key, value in currency_rates_raw.items()}
@@ -1135,7 +1224,7 @@ def print_win_rate_journal(title, journal):
     total_trades = len(journal)
     total_wins = sum(1 for entry in journal if entry['win'])
     total_losses = total_trades - total_wins
-    win_rate = (total_wins / total_trades * 100)
+    win_rate = (total_wins / total_trades * 100) if total_trades > 0 else 0
     # Calculate average gain and the average loss over all trades
     average_gain = sum(entry['profit_loss_percentage'] for entry in journal if entry['win']) / total_wins if total_wins > 0 else 0
     average_loss = sum(entry['profit_loss_percentage'] for entry in journal if not entry['win']) / total_losses if total_losses > 0 else 0
@@ -1235,6 +1324,34 @@ def print_win_rate_statistics(statistics_data, year):
 
     Args:
         statistics_data: List of statistics data
+
+    Returns:
+        list: Win rate journal ordered by entry date
+    """
+    journal = build_win_rate_journal(statistics_data)
+
+    print_win_rate_journal(f"Win Rate Journal (by close date)", journal)
+    print_monthly_tracker("Monthly Tracker (by close date)", journal)
+    print_trading_summary("Trading Summary (by close date)",journal)
+
+    journal_entry_date = journal_by_entry_date(journal, year)
+
+    print_win_rate_journal(f"Win Rate Journal (by entry date)", journal_entry_date)
+    print_monthly_tracker("Monthly Tracker (by entry date)", journal_entry_date)
+    print_trading_summary("Trading Summary (by entry date)", journal_entry_date)
+
+    save_statistics_data(year, journal_entry_date)
+
+    return journal_entry_date
+
+def build_win_rate_journal(statistics_data):
+    """Build the win rate journal from the statistics data. Each entry is a closed position.
+
+    Args:
+        statistics_data: List of statistics data
+
+    Returns:
+        list: Journal entries ordered by close date
     """
     journal = []
     positions = {}
@@ -1244,7 +1361,7 @@ def print_win_rate_statistics(statistics_data, year):
         if symbol == 'BTC':
             continue
         # Check if the symbol is an options contract
-        if ' ' in symbol and any(c.isdigit() for c in symbol):
+        if is_option(symbol):
             continue  # Skip options contracts
         # Skip currencies
         if symbol in ['USD', 'EUR', 'SEK', 'DKK']:
@@ -1314,17 +1431,24 @@ def print_win_rate_statistics(statistics_data, year):
                 positions[symbol]['profit_loss'] += profit_loss
                 positions[symbol]['profit_loss_percentage'].append((delta, profit_loss_percentage))
 
-    print_win_rate_journal(f"Win Rate Journal (by close date)", journal)
-    print_monthly_tracker("Monthly Tracker (by close date)", journal)
-    print_trading_summary("Trading Summary (by close date)",journal)
+    return journal
+
+def journal_by_entry_date(journal, year):
+    """Create journal where date entry is the entry date.
+
+    Args:
+        journal: Journal entries ordered by close date
+        year: The tax year, positions opened in other years are left out
 
-    # Create journal where date entry is the entry date
+    Returns:
+        list: Journal entries ordered by entry date
+    """
     journal_entry_date = []
     for entry in journal:
         # Extract year from entry_date (format: YYYYMMDD;HHMMSS)
-        entry_year = entry['entry_date'][:4]
+        entry_year = int(entry['entry_date'][:4])
         # Only include entries from the current year
-        if entry_year == str(year):
+        if entry_year == year:
             new_entry = entry.copy()
             new_entry['date'] = entry['entry_date']
             journal_entry_date.append(new_entry)
@@ -1345,56 +1469,131 @@ def print_win_rate_statistics(statistics_data, year):
     #    })
 
     # Order by entry date
-    journal_entry_date = sorted(journal_entry_date, key=lambda x: x['date'])
-
-    print_win_rate_journal(f"Win Rate Journal (by entry date)", journal_entry_date)
-    print_monthly_tracker("Monthly Tracker (by entry date)", journal_entry_date)
-    print_trading_summary("Trading Summary (by entry date)", journal_entry_date)
-
-    save_statistics_data(year, journal_entry_date)
+    return sorted(journal_entry_date, key=lambda x: x['date'])
 
 def print_statistics(statistics_data, k4_data, year):
     """Print the statistics data to the console.
 
     Args:
         statistics_data: List of statistics data
+
+    Returns:
+        list: Win rate journal ordered by entry date
     """
     print_k4_statistics(k4_data)
-    print_win_rate_statistics(statistics_data, year)
+    return print_win_rate_statistics(statistics_data, year)
 
-def process_transactions(filename_ibkr, filename_bitstamp, year, stocks_data, k4_data, currency_rates, statistics_data):
-    """Process the input file and generate tax reports.
+def no_stage(name):
+    """Default stage hook, see process_transactions."""
+    return contextlib.nullcontext()
+
+def combine_stages(*stages):
+    """Combine several stage hooks into one, the hooks are entered in order.
 
     Args:
-        filename: Path to the input CSV file
+        stages: Stage hooks, see process_transactions
+
+    Returns:
+        function: Stage hook
     """
-    trades, currency_rates_csv = read_csv_ibkr(filename_ibkr)
+    @contextlib.contextmanager
+    def stage(name):
+        with contextlib.ExitStack() as stack:
+            for hook in stages:
+                stack.enter_context(hook(name))
+            yield
+    return stage
+
+def process_transactions(filenames, year, stocks_data, k4_data, currency_rates, statistics_data, workers=None, stage=no_stage, file_spans=None,
+                         snapshot_index=None):
+    """Process the input files and generate tax reports.
 
-    # Read Bitstamp trades
-    trades_bitstamp = []
-    if filename_bitstamp:
-        trades_bitstamp = read_csv_bitstamp(filename_bitstamp)
+    Args:
+        filenames: List of input file names and glob patterns
+        workers: Maximum number of worker processes used to parse the input files
+        stage: Function returning a context manager wrapping each pipeline stage, called with the
+               stage name ('parse', 'dedup', 'rates', 'sort', 'engine' or 'post_process')
+        file_spans: Optional list receiving the parse span of each input file, see read_input_files
+        snapshot_index: Optional snapshot index receiving engine snapshots, see snapshots.py
+    """
+    with stage('parse'):
+        sources = read_input_files(filenames, workers, file_spans)
+
+    # Combine trades from all sources, fills present in overlapping sources are only counted once
+    with stage('dedup'):
+        lineage.add_sources([(filename, source_trades) for filename, source_trades, _ in sources])
+        trades, _ = deduplicate_trades([(filename, source_trades) for filename, source_trades, _ in sources])
+        currency_rates_csv = [rate for _, _, rates in sources for rate in rates]
+    if not currency_rates_csv:
+        logging.error("No currency rates section found in the input data.")
+        sys.exit(1)
+
+    return process_trades(trades, currency_rates_csv, year, stocks_data, k4_data, currency_rates, statistics_data, stage=stage,
+                          snapshot_index=snapshot_index)
+
+def is_option(symbol):
+    """Check if a symbol is an options contract, e.g. 'IBIT  250117C00050000' (underlying and contract).
+
+    Args:
+        symbol: Trade symbol
+    """
+    return ' ' in symbol and any(c.isdigit() for c in symbol)
+
+def trade_keys(symbol, currency):
+    """Get the stocks_data and k4_data keys a trade of a symbol can change."""
+    return {symbol, symbol.split('.')[0], currency}
 
-    # Combine trades from both sources
-    trades.extend(trades_bitstamp)
+def sort_trades(trades):
+    """Sort the trades in the order they are processed by the engine.
+
+    Args:
+        trades: List of trade dictionaries, option prices are multiplied by 100 in place
 
+    Returns:
+        list: Sorted trades
+    """
     # Create a sorting key function that puts forex trades before stock trades on the same date
     # and puts BUY entries before SELL entries for options
     def sort_key_combined(trade):
         date = trade['DateTime']
         is_forex = 1 if '.' in trade['Symbol'] else 2
-        if ' ' in trade['Symbol'] and any(c.isdigit() for c in trade['Symbol']):
+        if is_option(trade['Symbol']):
             # For options, multiply the trade price by 100 as the quantity is in lots
             trade['TradePrice'] = float(trade['TradePrice']) * 100
             return (trade['Symbol'], 1 if trade['Buy/Sell'] == 'BUY' else 2)
         else:
             return (date, is_forex, 3)
 
-    process_currency_rates(currency_rates_csv, currency_rates, year)
+    return sorted(trades, key=sort_key_combined)
+
+def process_trades(trades, currency_rates_csv, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates=None, stage=no_stage,
+                   snapshot_index=None):
+    """Process parsed trades and currency rates and generate the K4 rows.
+
+    Args:
+        trades: List of trade dictionaries from all sources
+        currency_rates_csv: List of currency rate dictionaries
+        year: The tax year for which to generate the report
+        predefined_rates: Predefined rates keyed by (date, currency), read from input_currency_rates_<year>.json if None
+        stage: Stage hook, see process_transactions
+        snapshot_index: Optional snapshot index receiving engine snapshots, see snapshots.py
+
+    Returns:
+        list: Post-processed K4 rows
+    """
+    with stage('rates'):
+        process_currency_rates(currency_rates_csv, currency_rates, year, predefined_rates)
 
     # Combine and sort trades
-    sorted_trades = sorted(trades, key=sort_key_combined)
+    with stage('sort'):
+        sorted_trades = sort_trades(trades)
 
-    processed_data = process_trading_data(sorted_trades, stocks_data, k4_data, currency_rates, statistics_data)
+    with stage('engine'):
+        if snapshot_index is None:
+            processed_data = process_trading_data(sorted_trades, stocks_data, k4_data, currency_rates, statistics_data)
+        else:
+            from .snapshots import record_snapshots
+            processed_data = record_snapshots(snapshot_index, sorted_trades, stocks_data, k4_data, currency_rates, statistics_data)
 
-    return post_process_trading_data(processed_data, year)
+    with stage('post_process'):
+        return post_process_trading_data(processed_data, year)
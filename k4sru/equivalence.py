@@ -0,0 +1,245 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Differential harness comparing alternative engines with the reference engine.
+#
+# An engine has the signature of process_trades:
+#
+#   engine(trades, currency_rates_csv, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates)
+#
+# and returns the post-processed K4 rows. Each engine gets its own copy of the trades, the
+# currency rates and the initial portfolio, and its k4_data, final stocks_data, statistics data
+# and rendered BLANKETTER.SRU are compared with those of the reference engine (process_trades).
+# Numbers are compared with an absolute tolerance per section, the #IDENTITET line of the SRU
+# file (which holds the time of the run) is masked.
+#
+# The reference engine processes every trade of the input, like k4sru, so trades of earlier years
+# count towards the cost basis. The store engine only loads the tax year from the store, so it is
+# reported as not equivalent on input with trades outside the year.
+#
+# New engines are added with register_engine(), the bench command checks every registered engine.
+
+import copy
+import logging
+import math
+import re
+import sys
+import time
+from decimal import Decimal
+from .data import process_trades, init_currency_rates
+from .sru import render_blanketter_sru
+from .store import open_store, store_trades, store_rates, load_trades, load_rates, year_range
+from .options import DEFAULT_TOLERANCES
+
+REFERENCE_ENGINE = 'reference'
+
+# Maximum number of differences reported per engine
+MAX_DIFFERENCES = 20
+
+# Engine name -> engine function
+ENGINES = {}
+
+def register_engine(name, engine):
+    """Register an engine to compare with the reference engine.
+
+    Args:
+        name: Name of the engine
+        engine: Function with the signature of process_trades
+    """
+    ENGINES[name] = engine
+
+def store_engine(trades, currency_rates_csv, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates=None):
+    """Process the trades through an in-memory trade store, see process_store_transactions."""
+    conn = open_store(':memory:')
+    store_trades(conn, trades)
+    store_rates(conn, currency_rates_csv)
+    trades = list(load_trades(conn, year))
+    rates = list(load_rates(conn, year))
+    conn.close()
+    return process_trades(trades, rates, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates)
+
+register_engine(REFERENCE_ENGINE, process_trades)
+register_engine('store', store_engine)
+
+def mask_identitet(sru):
+    """Mask the time of the run on the #IDENTITET line of an SRU file."""
+    return re.sub(r'^(#IDENTITET \S*) .*$', r'\1 <masked>', sru, flags=re.MULTILINE)
+
+def run_engine(engine, trades, rates, year, portfolio=None, predefined_rates=None, config=None):
+    """Run an engine on copies of the input.
+
+    Args:
+        engine: Engine function
+        trades: List of trade dictionaries
+        rates: List of currency rate dictionaries
+        year: The tax year
+        portfolio: Initial stocks_data, empty if None
+        predefined_rates: Predefined rates keyed by (date, currency)
+        config: Tax payer information for the SRU file
+
+    Returns:
+        dict: 'k4_data', 'stocks_data', 'statistics', 'sru' and the run time in 'seconds'
+    """
+    stocks_data = copy.deepcopy(portfolio or {})
+    k4_data = {}
+    currency_rates = {}
+    statistics_data = []
+    trades = copy.deepcopy(trades)
+    rates = copy.deepcopy(rates)
+    start = time.perf_counter()
+    k4_rows = engine(trades, rates, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates or {})
+    seconds = time.perf_counter() - start
+    return {
+        'k4_data': k4_data,
+        'stocks_data': stocks_data,
+        'statistics': statistics_data,
+        'sru': mask_identitet(render_blanketter_sru(config or {}, k4_rows, False, year)),
+        'seconds': seconds,
+    }
+
+def is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+def numbers_equal(expected, actual, tolerance):
+    expected = float(expected)
+    actual = float(actual)
+    if math.isnan(expected) or math.isnan(actual):
+        return math.isnan(expected) and math.isnan(actual)
+    return math.isclose(expected, actual, rel_tol=0, abs_tol=tolerance)
+
+def compare_values(path, expected, actual, tolerance, differences):
+    """Compare two nested values, appending a description of each difference.
+
+    Args:
+        path: Path of the values, used in the descriptions
+        expected: Value of the reference engine
+        actual: Value of the compared engine
+        tolerance: Absolute tolerance of numbers
+        differences: List of differences, updated in place
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in expected:
+            if key not in actual:
+                differences.append(f"{path}[{key!r}]: missing")
+            else:
+                compare_values(f"{path}[{key!r}]", expected[key], actual[key], tolerance, differences)
+        for key in actual:
+            if key not in expected:
+                differences.append(f"{path}[{key!r}]: unexpected")
+    elif isinstance(expected, (list, tuple)) and isinstance(actual, (list, tuple)):
+        if len(expected) != len(actual):
+            differences.append(f"{path}: length {len(actual)} != {len(expected)}")
+        for i, (expected_item, actual_item) in enumerate(zip(expected, actual)):
+            compare_values(f"{path}[{i}]", expected_item, actual_item, tolerance, differences)
+    elif is_number(expected) and is_number(actual):
+        if not numbers_equal(expected, actual, tolerance):
+            differences.append(f"{path}: {actual!r} != {expected!r}")
+    elif expected != actual:
+        differences.append(f"{path}: {actual!r} != {expected!r}")
+
+def parse_number(token):
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+def compare_sru(expected, actual, tolerance, differences):
+    """Compare two rendered SRU files line by line, numeric fields with a tolerance."""
+    expected_lines = expected.splitlines()
+    actual_lines = actual.splitlines()
+    if len(expected_lines) != len(actual_lines):
+        differences.append(f"sru: {len(actual_lines)} lines != {len(expected_lines)}")
+    for number, (expected_line, actual_line) in enumerate(zip(expected_lines, actual_lines), 1):
+        if expected_line == actual_line:
+            continue
+        expected_tokens = expected_line.split(' ')
+        actual_tokens = actual_line.split(' ')
+        equal = len(expected_tokens) == len(actual_tokens) and tolerance > 0
+        for expected_token, actual_token in zip(expected_tokens, actual_tokens):
+            if not equal:
+                break
+            if expected_token != actual_token:
+                expected_number = parse_number(expected_token)
+                actual_number = parse_number(actual_token)
+                equal = (expected_number is not None and actual_number is not None and
+                         numbers_equal(expected_number, actual_number, tolerance))
+        if not equal:
+            differences.append(f"sru line {number}: {actual_line!r} != {expected_line!r}")
+
+def compare_results(reference, candidate, tolerances=None):
+    """Compare the results of two engine runs.
+
+    Args:
+        reference: Result of the reference engine, see run_engine
+        candidate: Result of the compared engine
+        tolerances: Section -> absolute tolerance, missing sections use DEFAULT_TOLERANCES
+
+    Returns:
+        list: Descriptions of the differences, empty if the results are equivalent
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    differences = []
+    for section in ('k4_data', 'stocks_data', 'statistics'):
+        compare_values(section, reference[section], candidate[section], tolerances[section], differences)
+    compare_sru(reference['sru'], candidate['sru'], tolerances['sru'], differences)
+    return differences
+
+def check_equivalence(trades, rates, year, engines=None, portfolio=None, predefined_rates=None, config=None, tolerances=None):
+    """Run the reference engine and the given engines on the same input and compare the results.
+
+    Args:
+        trades: List of trade dictionaries
+        rates: List of currency rate dictionaries
+        year: The tax year
+        engines: Names of the engines to compare, all registered engines if None
+        portfolio: Initial stocks_data, empty if None
+        predefined_rates: Predefined rates keyed by (date, currency), read from input_currency_rates_<year>.json if None
+        config: Tax payer information for the SRU file
+        tolerances: Section -> absolute tolerance, see compare_results
+
+    Returns:
+        dict: Engine name -> {'equivalent', 'differences', 'seconds', 'speedup'}
+    """
+    if predefined_rates is None:
+        predefined_rates = init_currency_rates(year)
+    names = [name for name in (engines or ENGINES) if name != REFERENCE_ENGINE]
+    for name in names:
+        if name not in ENGINES:
+            logging.error(f"Unknown engine {name}, registered engines: {', '.join(ENGINES)}")
+            sys.exit(1)
+
+    start, end = year_range(year)
+    outside = sum(1 for trade in trades if not start <= trade['DateTime'] < end)
+    if outside:
+        logging.warning(f"{outside} trades outside {year}: the reference engine processes them like k4sru, "
+                        f"engines loading only the tax year (store) are not equivalent on this input")
+
+    reference = run_engine(ENGINES[REFERENCE_ENGINE], trades, rates, year, portfolio, predefined_rates, config)
+    report = {REFERENCE_ENGINE: {'equivalent': True, 'differences': [], 'seconds': reference['seconds'], 'speedup': 1.0}}
+    for name in names:
+        candidate = run_engine(ENGINES[name], trades, rates, year, portfolio, predefined_rates, config)
+        differences = compare_results(reference, candidate, tolerances)
+        report[name] = {
+            'equivalent': not differences,
+            'differences': differences[:MAX_DIFFERENCES],
+            'seconds': candidate['seconds'],
+            'speedup': reference['seconds'] / candidate['seconds'] if candidate['seconds'] > 0 else 0.0,
+        }
+        if differences:
+            logging.error(f"Engine {name} differs from the reference engine in {len(differences)} places:")
+            for difference in differences[:MAX_DIFFERENCES]:
+                logging.error(f"  {difference}")
+        else:
+            logging.info(f"Engine {name} is equivalent to the reference engine ({report[name]['speedup']:.2f}x)")
+    return report
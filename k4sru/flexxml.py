@@ -0,0 +1,134 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Streaming reader for IBKR Flex XML statements.
+#
+#   <FlexQueryResponse>
+#     <FlexStatements>
+#       <FlexStatement accountId="U1234567" ...>
+#         <Trades>
+#           <Trade dateTime="20250225;030616" symbol="RHMd" buySell="BUY" quantity="2" tradePrice="985.4"
+#                  ibCommission="-3" currency="EUR" description="RHEINMETALL AG" isin="DE0007030009"
+#                  exchange="IBIS" tradeID="123456789" levelOfDetail="EXECUTION" />
+#         </Trades>
+#         <ConversionRates>
+#           <ConversionRate reportDate="20250225" fromCurrency="EUR" toCurrency="USD" rate="1.0515" />
+#         </ConversionRates>
+#       </FlexStatement>
+#     </FlexStatements>
+#   </FlexQueryResponse>
+#
+# The records are produced in the same format as the IBKR flex CSV records of ibkr.py, with the stable IBKR trade id
+# added as 'TradeID'.
+
+import logging
+from .streams import open_input, input_name
+
+# Flex XML attribute -> IBKR flex CSV column
+TRADE_ATTRIBUTES = {
+    'dateTime': 'DateTime',
+    'symbol': 'Symbol',
+    'buySell': 'Buy/Sell',
+    'quantity': 'Quantity',
+    'tradePrice': 'TradePrice',
+    'ibCommission': 'IBCommission',
+    'currency': 'CurrencyPrimary',
+    'description': 'Description',
+    'isin': 'ISIN',
+    'exchange': 'Exchange',
+    'tradeID': 'TradeID',
+}
+
+RATE_ATTRIBUTES = {
+    'reportDate': 'Date/Time',
+    'fromCurrency': 'FromCurrency',
+    'toCurrency': 'ToCurrency',
+    'rate': 'Rate',
+}
+
+def is_flex_xml_header(header):
+    """Check if the first line of an input is the start of a Flex XML statement.
+
+    Args:
+        header: The first line of the input
+    """
+    return header.lstrip('\ufeff').lstrip().startswith(('<?xml', '<FlexQueryResponse'))
+
+def normalize_flex_datetime(value):
+    """Normalize a Flex date/time to the 'YYYYMMDD;HHMMSS' format used by the engine.
+
+    Args:
+        value: Date/time such as '20250225;030616', '2025-02-25, 03:06:16' or '20250225'
+    """
+    value = value.replace('-', '').replace(':', '')
+    return ';'.join(value.replace(',', ' ').replace(';', ' ').split())
+
+def iter_flex_xml(source):
+    """Stream trades and currency rates from a Flex XML statement.
+
+    Elements are released as soon as they have been read, so memory use does not grow with
+    the size of the statement.
+
+    Args:
+        source: Path or binary file object with the Flex XML statement
+
+    Yields:
+        tuple: ('trade', dict) or ('rate', dict) in the IBKR flex CSV format
+    """
+    # Imported on first use, most runs read CSV input
+    import xml.etree.ElementTree as ET
+    stack = []
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag == 'Trade':
+            attributes = elem.attrib
+            # Orders and closed lots repeat the executions, only executions are processed
+            if attributes.get('levelOfDetail', 'EXECUTION') == 'EXECUTION':
+                if attributes.get('buySell') in ('BUY', 'SELL'):
+                    trade = {column: attributes.get(name, '') for name, column in TRADE_ATTRIBUTES.items()}
+                    trade['DateTime'] = normalize_flex_datetime(trade['DateTime'])
+                    yield 'trade', trade
+                else:
+                    logging.debug("Skipping cancelled trade %s", attributes.get('tradeID'))
+        elif elem.tag == 'ConversionRate':
+            rate = {column: elem.attrib.get(name, '') for name, column in RATE_ATTRIBUTES.items()}
+            rate['Date/Time'] = normalize_flex_datetime(rate['Date/Time'])
+            yield 'rate', rate
+        # Release the element, it is the first remaining child since earlier siblings are gone
+        if stack:
+            stack[-1].remove(elem)
+
+def read_flex_xml(filename):
+    """Read a Flex XML statement with Interactive Brokers transactions.
+
+    Args:
+        filename: Path, '-' for standard input or binary file object, optionally gzip, xz or zstd compressed
+
+    Returns:
+        tuple: (trades, currency_rates) where each is a list of dictionaries
+    """
+    trades = []
+    rates = []
+    with open_input(filename, binary=True) as file:
+        for kind, record in iter_flex_xml(file):
+            if kind == 'trade':
+                trades.append(record)
+            else:
+                rates.append(record)
+
+    logging.info(f"{len(trades)} stock trades and {len(rates)} currency rates have been read from {input_name(filename)}.")
+    return trades, rates
@@ -0,0 +1,315 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tax-loss harvesting (irs harvest): which open positions to sell, and how much, given a price snapshot.
+#
+# The capital income of the K4 rows respects the section split of the form:
+#
+#   A (shares)                   gains and losses are netted, a net loss is deductible to 70 %
+#   C (currencies), D (other)    the gain of a row is taxed, the loss of a row is deductible to 70 %
+#
+# and the tax is 30 % of the capital income. The solver has two modes:
+#
+#   target       sell to bring the capital income of the year to a target, with the least proceeds
+#                (losses if the income is above the target, gains if it is below)
+#   loss budget  realize at most this much loss (SEK) with the largest tax reduction, all losses if
+#                no budget is given
+#
+# Both are linear programs over the sold quantities with a piecewise linear objective. Selling
+# a unit of a position changes the income by its unrealized profit times a rate, 1.0 or 0.7,
+# which depends on how much of the section net (A) or of the row (C, D) has been used. Each
+# section or row is a stream of pieces of constant rate, and the pieces are taken greedily,
+# best first. For losses the rates of a stream only decrease, so the greedy order is optimal.
+# For gains that first cancel an earlier loss the greedy order is a good heuristic.
+#
+# The selected trades are then run through the engine on a copy of the state, which gives the
+# projected K4 rows. That includes side effects the unit model leaves out, e.g. the proceeds
+# of a foreign sale paying back a margin loan in that currency.
+
+import copy
+import heapq
+import logging
+import time
+from collections import ChainMap
+from .data import process_sell_entry, post_process_trading_data, is_option, BASE_CURRENCY
+from .sru import k4_section
+from .prices import sek_rate
+from .whatif import latest_rate, quiet_engine
+
+# Share of a loss that is deductible, and the tax rate of capital income
+LOSS_DEDUCTION = 0.7
+TAX_RATE = 0.3
+
+def capital_income(k4_rows):
+    """Get the capital income of K4 rows with the section rules, see the module comment.
+
+    Args:
+        k4_rows: K4 rows with 'beteckning', 'forsaljningspris' and 'omkostnadsbelopp'
+
+    Returns:
+        float: Capital income in SEK
+    """
+    net_a = 0
+    income = 0
+    for row in k4_rows:
+        profit = row['forsaljningspris'] - row['omkostnadsbelopp']
+        if k4_section(row['beteckning']) == 'A':
+            net_a += profit
+        else:
+            income += profit if profit >= 0 else LOSS_DEDUCTION * profit
+    return income + (net_a if net_a >= 0 else LOSS_DEDUCTION * net_a)
+
+def summarize(k4_rows):
+    """Get the profit/loss, capital income and tax of K4 rows."""
+    income = capital_income(k4_rows)
+    return {
+        'profit_loss': sum(row['forsaljningspris'] - row['omkostnadsbelopp'] for row in k4_rows),
+        'capital_income': income,
+        'tax': income * TAX_RATE,
+    }
+
+def find_candidates(base, prices, date):
+    """Get the open long positions that can be sold at the snapshot prices.
+
+    Args:
+        base: Base state, see whatif.new_base_state
+        prices: Prices, see prices.read_prices
+        date: Date of the sales
+
+    Returns:
+        tuple: (list of candidate dictionaries, list of symbols without a price)
+    """
+    candidates = []
+    skipped = []
+    for symbol, data in base['stocks_data'].items():
+        quantity = data['quantity']
+        # Short positions and margin loans are bought back, not harvested
+        if quantity <= 0:
+            continue
+        entry = prices.get(symbol)
+        section = k4_section(symbol)
+        try:
+            if section == 'C':
+                # A currency balance is sold for SEK at its SEK rate
+                trade_symbol, currency = f'{symbol}.{BASE_CURRENCY}', BASE_CURRENCY
+                price = sek_rate(prices, symbol, lambda currency: latest_rate(base, currency, date))
+                rate = 1.0
+            elif entry is None:
+                price = None
+            else:
+                trade_symbol, currency = symbol, entry['currency']
+                # The engine works with option prices per lot, see sort_trades
+                price = entry['price'] * 100 if is_option(symbol) else entry['price']
+                rate = sek_rate(prices, currency, lambda currency: latest_rate(base, currency, date))
+        except ValueError:
+            price = None
+        if price is None:
+            skipped.append(symbol)
+            continue
+        unit_value = price * rate
+        candidates.append({
+            'symbol': trade_symbol,
+            'position': symbol,
+            'section': section,
+            'quantity': quantity,
+            'price': price,
+            'currency': currency,
+            'rate': rate,
+            'unit_value': unit_value,
+            'unit_profit': unit_value - data['avgprice'],
+            'description': base['last_trades'].get(symbol, (None, None, symbol))[2],
+            # Whole shares and option lots, fractions of currencies and BTC
+            'fractional': section == 'C' or symbol == 'BTC',
+        })
+    return candidates, skipped
+
+def efficiency(candidate):
+    """Get the profit or loss of a candidate per SEK sold, a worthless position comes first."""
+    if candidate['unit_value'] <= 0:
+        return float('inf')
+    return abs(candidate['unit_profit']) / candidate['unit_value']
+
+def build_streams(candidates, k4_data, losses):
+    """Split the candidates into streams of pieces of constant income rate.
+
+    Args:
+        candidates: Candidates with a loss (losses=True) or a gain (losses=False)
+        k4_data: Realized K4 data of the year
+        losses: Whether the candidates are sold at a loss
+
+    Returns:
+        list: Streams, lists of (rate, units, candidate index) in the order they must be taken
+    """
+    # The first rate applies until the section net (A) or the row (C, D) changes sign
+    first_rate, second_rate = (1.0, LOSS_DEDUCTION) if losses else (LOSS_DEDUCTION, 1.0)
+    sign = 1 if losses else -1
+    streams = []
+    shares = []
+    for i, candidate in enumerate(candidates):
+        if candidate['section'] == 'A':
+            shares.append(i)
+            continue
+        row = k4_data.get(candidate['position'])
+        capacity = max(sign * (row['forsaljningspris'] - row['omkostnadsbelopp']), 0) if row else 0
+        streams.append(split_stream([i], candidates, capacity, first_rate, second_rate))
+    net_a = sum(row['forsaljningspris'] - row['omkostnadsbelopp'] for row in k4_data.values() if k4_section(row['beteckning']) == 'A')
+    # Within the section the positions with the largest profit or loss per SEK sold come first
+    shares.sort(key=lambda i: -efficiency(candidates[i]))
+    if shares:
+        streams.append(split_stream(shares, candidates, max(sign * net_a, 0), first_rate, second_rate))
+    return streams
+
+def split_stream(indexes, candidates, capacity, first_rate, second_rate):
+    """Split the positions of a stream into pieces, the first capacity SEK at the first rate."""
+    pieces = []
+    for i in indexes:
+        units = candidates[i]['quantity']
+        amount = abs(candidates[i]['unit_profit'])
+        if capacity > 0 and amount > 0:
+            first_units = min(units, capacity / amount)
+            pieces.append((first_rate, first_units, i))
+            capacity -= first_units * amount
+            units -= first_units
+        if units > 0:
+            pieces.append((second_rate, units, i))
+    return pieces
+
+def select(candidates, streams, need, key, measure):
+    """Take pieces of the streams greedily, best key first, until need is used up.
+
+    Args:
+        candidates: Candidate dictionaries
+        streams: Streams of pieces, see build_streams
+        need: Amount to reach, None for no limit
+        key: Function of (rate, candidate) giving the priority tuple of a piece, higher first
+        measure: Function of (rate, candidate) giving the amount of need used per unit
+
+    Returns:
+        dict: Candidate index -> units
+    """
+    heap = []
+    for s, stream in enumerate(streams):
+        if stream:
+            rate, _, i = stream[0]
+            heapq.heappush(heap, (tuple(-k for k in key(rate, candidates[i])), s, 0))
+    selected = {}
+    remaining = need
+    while heap and (remaining is None or remaining > 1e-9):
+        _, s, p = heapq.heappop(heap)
+        rate, units, i = streams[s][p]
+        if remaining is not None:
+            per_unit = measure(rate, candidates[i])
+            if per_unit > 0:
+                units = min(units, remaining / per_unit)
+                remaining -= units * per_unit
+        selected[i] = selected.get(i, 0) + units
+        if p + 1 < len(streams[s]):
+            rate, _, i = streams[s][p + 1]
+            heapq.heappush(heap, (tuple(-k for k in key(rate, candidates[i])), s, p + 1))
+    return selected
+
+def round_units(candidate, units, up):
+    """Round the units of a candidate to whole shares or lots, never beyond the position."""
+    if candidate['fractional']:
+        return min(units, candidate['quantity'])
+    whole = int(units) + (1 if up and units - int(units) > 1e-9 else 0)
+    return min(whole, candidate['quantity'])
+
+def project(base, trades, date):
+    """Run the trades through the engine on a copy of the base state.
+
+    Returns:
+        tuple: (stocks_data, k4_data) after the trades
+    """
+    stocks_data = copy.deepcopy(base['stocks_data'])
+    k4_data = copy.deepcopy(base['k4_data'])
+    day = date.split(';')[0]
+    # The rates of the snapshot are used for the sales
+    overrides = {(day, trade['currency']): trade['rate'] for trade in trades if trade['currency'] != BASE_CURRENCY}
+    currency_rates = ChainMap(overrides, base['currency_rates'])
+    with quiet_engine():
+        for trade in trades:
+            process_sell_entry(trade['symbol'], trade['description'], -trade['quantity'], trade['price'], 0, trade['currency'],
+                               date, stocks_data, k4_data, currency_rates, [])
+    return stocks_data, k4_data
+
+def harvest(base, prices, target=None, loss_budget=None, date=None):
+    """Choose the positions and quantities to sell.
+
+    Args:
+        base: Base state, see whatif.new_base_state
+        prices: Prices, see prices.read_prices
+        target: Target capital income of the year in SEK
+        loss_budget: Maximum loss to realize in SEK, ignored if target is given; all losses if both are None
+        date: Date of the sales in 'YYYYMMDD;HHMMSS' format, the time of the last trade if None
+
+    Returns:
+        dict: 'trades', projected 'k4_rows', 'before' and 'after' (profit_loss, capital_income and
+              tax), 'skipped' positions without a price and the solver time in 'seconds'
+    """
+    start = time.perf_counter()
+    date = date or base['last_datetime']
+    candidates, skipped = find_candidates(base, prices, date)
+    before = summarize(base['k4_data'].values())
+
+    if target is not None:
+        need = target - before['capital_income']
+        losses = need < 0
+        # The least proceeds for the income change: the largest change per SEK sold first
+        key = lambda rate, candidate: (rate * efficiency(candidate),)
+        measure = lambda rate, candidate: rate * abs(candidate['unit_profit'])
+        need = abs(need)
+        round_up = True
+    else:
+        losses = True
+        need = loss_budget
+        # The largest tax reduction for the loss, then the least proceeds
+        key = lambda rate, candidate: (rate, efficiency(candidate))
+        measure = lambda rate, candidate: abs(candidate['unit_profit'])
+        round_up = False
+    chosen = [candidate for candidate in candidates if (candidate['unit_profit'] < 0) == losses and candidate['unit_profit'] != 0]
+    streams = build_streams(chosen, base['k4_data'], losses)
+    selected = select(chosen, streams, need, key, measure)
+
+    trades = []
+    for i in sorted(selected, key=lambda i: chosen[i]['symbol']):
+        candidate = chosen[i]
+        units = round_units(candidate, selected[i], round_up)
+        if units <= 0:
+            continue
+        trades.append({
+            'symbol': candidate['symbol'],
+            'description': candidate['description'],
+            'section': candidate['section'],
+            'quantity': units,
+            'price': candidate['price'] / 100 if is_option(candidate['symbol']) else candidate['price'],
+            'currency': candidate['currency'],
+            'rate': candidate['rate'],
+            'proceeds': units * candidate['unit_value'],
+            'profit_loss': units * candidate['unit_profit'],
+        })
+    engine_trades = [dict(trade, price=trade['price'] * 100 if is_option(trade['symbol']) else trade['price']) for trade in trades]
+    _, k4_data = project(base, engine_trades, date)
+    rows = sorted(k4_data.values(), key=lambda row: row['beteckning'])
+    k4_rows = [dict(row, section=k4_section(row['beteckning'])) for row in post_process_trading_data(rows, base['year'])]
+    seconds = time.perf_counter() - start
+    logging.info(f"Selected {len(trades)} of {len(candidates)} positions in {seconds:.3f} s")
+    return {
+        'trades': trades,
+        'k4_rows': k4_rows,
+        'before': before,
+        'after': summarize(rows),
+        'skipped': skipped,
+        'seconds': seconds,
+    }
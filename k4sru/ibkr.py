@@ -0,0 +1,98 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Streaming reader for IBKR flex CSV files. The trades section is followed by an optional
+# currency rates section:
+#
+#   "DateTime","Symbol","Buy/Sell","Quantity","TradePrice","IBCommission","CurrencyPrimary","Description","ISIN","Exchange"
+#   "20250225;030616","RHMd","BUY","2","985.4","-3","EUR","RHEINMETALL AG","DE0007030009","IBIS"
+#   "Date/Time","FromCurrency","ToCurrency","Rate"
+#   "20250225","EUR","USD","1.0515"
+
+import csv
+import logging
+import sys
+
+# Mandatory fields in the IBKR CSV file, "ISIN" and "Exchange" are not used by the engine
+TRADE_FIELDS = ['DateTime', 'Symbol', 'Buy/Sell', 'Quantity', 'TradePrice', 'IBCommission', 'CurrencyPrimary', 'Description', 'ISIN', 'Exchange']
+
+# Mandatory fields in the currency rates section
+RATE_FIELDS = ['Date/Time', 'FromCurrency', 'ToCurrency', 'Rate']
+
+def is_ibkr_header(fields):
+    """Check if the CSV header fields are from an IBKR flex CSV file.
+
+    Args:
+        fields: List of column names
+    """
+    return 'DateTime' in fields and 'IBCommission' in fields
+
+def split_input_sections(lines):
+    """Split the lines of an IBKR flex CSV file into the trades and currency rates sections while streaming.
+
+    The currency rates section starts at the first line that has fewer fields than the first line
+    of the trades section, which is assumed to be the longest line. The rates generator must only
+    be consumed after the trades generator has been exhausted.
+
+    Args:
+        lines: Iterable of lines, e.g. a text file object
+
+    Returns:
+        tuple: (trade_lines, rate_lines) generators, rate_lines yields nothing if there is no rates section
+    """
+    lines = iter(lines)
+    header = next(lines, '')
+    width = len(header.strip().split(','))
+    rates_header = []
+
+    def trade_lines():
+        yield header
+        for line in lines:
+            if len(line.strip().split(',')) < width:
+                rates_header.append(line)
+                return
+            yield line
+
+    def rate_lines():
+        if rates_header:
+            yield rates_header[0]
+            yield from lines
+
+    return trade_lines(), rate_lines()
+
+def check_fields(required_fields, entry, section):
+    """Stop with an error if a required field is missing in an entry."""
+    missing = [field for field in required_fields if field not in entry]
+    if missing:
+        logging.error("Missing required fields in entry: %s", entry)
+        logging.error("Missing fields: %s", missing)
+        logging.error("%s data verification failed.", section)
+        sys.exit(1)
+
+def iter_ibkr_csv(file):
+    """Stream the trades and currency rates of an IBKR flex CSV file.
+
+    Args:
+        file: Text file object with the IBKR flex CSV file
+
+    Yields:
+        tuple: ('trade', dict) for each trade followed by ('rate', dict) for each currency rate
+    """
+    trade_lines, rate_lines = split_input_sections(file)
+    for trade in csv.DictReader(trade_lines):
+        check_fields(TRADE_FIELDS, trade, 'Trade')
+        yield 'trade', trade
+    for rate in csv.DictReader(rate_lines):
+        check_fields(RATE_FIELDS, rate, 'Currency rates')
+        yield 'rate', rate
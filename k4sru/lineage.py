@@ -0,0 +1,184 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Audit lineage of the K4 rows (k4sru --lineage, irs explain).
+#
+# When enabled, process_input_data tells the lineage which trade is processed and
+# process_k4_entry records each amount it adds to a K4 row, so the contributions of a row sum
+# to the row exactly. A trade is identified by its input file and its number in that file
+# (1-based, the trade on line n + 1 of an IBKR CSV file is trade n). Trades read from a trade
+# store have no file. The lineage is module state like metrics.py, enabled with enable(); when
+# disabled start_trade() and record() return immediately.
+#
+# The lineage file is compressed per K4 row, so a row is explained by reading one block:
+#
+#   offset 0   8 bytes   magic b'IRSLIN1\n'
+#   offset 8   4 bytes   uint32 little-endian length N of the JSON header
+#   offset 12  N bytes   UTF-8 JSON header:
+#                          {"version": 1, "year": 2025, "sources": ["input/ibkr_2025.csv", ...],
+#                           "rows": {"RHMd": {"beskrivning": "...", "offset": 0, "length": 312, "entries": 2}, ...}}
+#   12 + N               the blocks, offset relative to the end of the header
+#
+# A block is a zlib-compressed JSON list of contributions, each a list of LINEAGE_FIELDS. The
+# trade price is the price used by the engine, per lot for options.
+
+import json
+import logging
+import struct
+import sys
+import zlib
+from .streams import input_name
+
+LINEAGE_MAGIC = b'IRSLIN1\n'
+LINEAGE_VERSION = 1
+
+# Fields of a contribution in a lineage block
+LINEAGE_FIELDS = ['source', 'trade', 'date', 'side', 'symbol', 'quantity', 'price', 'commission', 'currency',
+                  'antal', 'forsaljningspris', 'omkostnadsbelopp']
+
+enabled = False
+sources = []
+trade_sources = {}
+current_trade = None
+rows = {}
+descriptions = {}
+
+def enable():
+    """Enable the lineage and reset it."""
+    global enabled
+    reset()
+    enabled = True
+
+def disable():
+    """Disable the lineage, the recorded contributions are kept."""
+    global enabled
+    enabled = False
+
+def reset():
+    """Clear the sources and the recorded contributions."""
+    global current_trade
+    sources.clear()
+    trade_sources.clear()
+    rows.clear()
+    descriptions.clear()
+    current_trade = None
+
+def add_sources(parsed):
+    """Number the trades of the parsed input files.
+
+    Args:
+        parsed: List of (filename, trades) tuples in command line order
+    """
+    if not enabled:
+        return
+    for filename, trades in parsed:
+        source = len(sources)
+        sources.append(input_name(filename))
+        for number, trade in enumerate(trades, 1):
+            # The trade dictionaries are kept through deduplication and sorting
+            trade_sources[id(trade)] = (source, number)
+
+def start_trade(trade):
+    """Set the trade whose K4 amounts are recorded next."""
+    global current_trade
+    if enabled:
+        current_trade = trade
+
+def record(symbol, description, antal, forsaljningspris, omkostnadsbelopp):
+    """Record an amount added to the K4 row of a symbol by the current trade."""
+    if not enabled:
+        return
+    trade = current_trade or {}
+    source, number = trade_sources.get(id(trade), (None, None))
+    rows.setdefault(symbol, []).append([
+        source, number, trade.get('DateTime'), trade.get('Buy/Sell'), trade.get('Symbol'), trade.get('Quantity'),
+        trade.get('TradePrice'), trade.get('IBCommission'), trade.get('CurrencyPrimary'),
+        antal, forsaljningspris, omkostnadsbelopp,
+    ])
+    descriptions.setdefault(symbol, description)
+
+def save_lineage(filename, year):
+    """Write the recorded lineage to a lineage file.
+
+    Args:
+        filename: Path to the lineage file
+        year: The tax year
+    """
+    blocks = []
+    index = {}
+    offset = 0
+    for symbol in sorted(rows):
+        block = zlib.compress(json.dumps(rows[symbol], separators=(',', ':')).encode(), 6)
+        index[symbol] = {'beskrivning': descriptions.get(symbol, symbol), 'offset': offset, 'length': len(block), 'entries': len(rows[symbol])}
+        blocks.append(block)
+        offset += len(block)
+    header = json.dumps({'version': LINEAGE_VERSION, 'year': year, 'sources': sources, 'rows': index}).encode()
+    with open(filename, 'wb') as file:
+        file.write(LINEAGE_MAGIC)
+        file.write(struct.pack('<I', len(header)))
+        file.write(header)
+        for block in blocks:
+            file.write(block)
+    logging.info(f"Lineage of {len(index)} K4 rows and {sum(len(entries) for entries in rows.values())} contributions saved to {filename}")
+
+def read_lineage_header(file, filename):
+    """Read the header of an open lineage file, see the module comment."""
+    if file.read(len(LINEAGE_MAGIC)) != LINEAGE_MAGIC:
+        logging.error(f"{filename} is not a lineage file")
+        sys.exit(1)
+    (length,) = struct.unpack('<I', file.read(4))
+    header = json.loads(file.read(length))
+    if header.get('version') != LINEAGE_VERSION:
+        logging.error(f"Unsupported lineage file version {header.get('version')} in {filename}")
+        sys.exit(1)
+    header['data_offset'] = len(LINEAGE_MAGIC) + 4 + length
+    return header
+
+def explain(filename, row):
+    """Get the contributions of a K4 row from a lineage file.
+
+    Args:
+        filename: Path to the lineage file
+        row: Beteckning of the K4 row, or its beskrivning (--longnames)
+
+    Returns:
+        dict: 'beteckning', 'beskrivning', 'year', 'sources' and 'contributions', a list of
+              dictionaries with the LINEAGE_FIELDS where 'source' is the input file name;
+              None if the lineage has no such row
+    """
+    try:
+        with open(filename, 'rb') as file:
+            header = read_lineage_header(file, filename)
+            index = header['rows']
+            symbol = row if row in index else next((symbol for symbol, entry in index.items() if entry['beskrivning'] == row), None)
+            if symbol is None:
+                return None
+            file.seek(header['data_offset'] + index[symbol]['offset'])
+            entries = json.loads(zlib.decompress(file.read(index[symbol]['length'])))
+    except FileNotFoundError:
+        logging.error(f"Lineage file {filename} not found, create it with k4sru --lineage")
+        sys.exit(1)
+    contributions = []
+    for entry in entries:
+        contribution = dict(zip(LINEAGE_FIELDS, entry))
+        source = contribution['source']
+        contribution['source'] = header['sources'][source] if source is not None else None
+        contributions.append(contribution)
+    return {
+        'beteckning': symbol,
+        'beskrivning': index[symbol]['beskrivning'],
+        'year': header['year'],
+        'sources': header['sources'],
+        'contributions': contributions,
+    }
@@ -0,0 +1,162 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Engine hot-path metrics (--metrics).
+#
+# The engine calls branch() with a label for every code path it takes:
+#
+#   UC-1 .. UC-8                        use case of the trade, see process_buy_entry/process_sell_entry
+#   buy_base.*, buy_foreign.*           first, long, cover, partial_cover (the bought asset)
+#   buy_foreign.currency_*              currency_sell, margin_loan_new, margin_loan_add (the paid currency)
+#   sell.first                          sell without a previous position
+#   sell_base.*, sell_foreign.*         long, short_new, short_add (the sold asset)
+#   sell_foreign.currency_*             currency_buy, margin_loan_payback, margin_loan_partial_cover
+#   sell.btc_dust, sell.rounding        position reset after fractional rounding errors
+#   k4.base, k4.foreign                 K4 entries in SEK and in a foreign currency
+#
+# Hits are counted for every trade. The latency of every sample_every:th trade is measured and
+# added to the histogram of each branch the trade went through. The metrics are module state,
+# enabled with enable(); when disabled branch() returns immediately.
+
+import json
+import time
+from collections import Counter
+
+# Upper bounds of the latency histogram buckets in nanoseconds: 250 ns .. 64 ms, then +Inf
+BUCKET_BOUNDS_NS = [250 * 2 ** i for i in range(19)]
+
+enabled = False
+sample_every = 1
+counts = Counter()
+histograms = {}
+call_labels = None
+calls = 0
+
+def enable(sample=1):
+    """Enable the metrics and reset them.
+
+    Args:
+        sample: Measure the latency of every sample:th trade
+    """
+    global enabled, sample_every
+    reset()
+    enabled = True
+    sample_every = max(1, int(sample))
+
+def disable():
+    """Disable the metrics, the collected values are kept."""
+    global enabled
+    enabled = False
+
+def reset():
+    """Clear all collected metrics."""
+    global call_labels, calls
+    counts.clear()
+    histograms.clear()
+    call_labels = None
+    calls = 0
+
+def branch(label):
+    """Count a hit of an engine branch."""
+    if enabled:
+        counts[label] += 1
+        if call_labels is not None:
+            call_labels.append(label)
+
+def start_trade():
+    """Start measuring the processing of a trade.
+
+    Returns:
+        int: Start time in nanoseconds if the trade is sampled, otherwise None
+    """
+    global calls, call_labels
+    if not enabled:
+        return None
+    calls += 1
+    if calls % sample_every:
+        return None
+    call_labels = []
+    return time.perf_counter_ns()
+
+def end_trade(start):
+    """Add the latency of a sampled trade to the histograms of the branches it went through.
+
+    Args:
+        start: Value returned by start_trade
+    """
+    global call_labels
+    if start is None:
+        return
+    elapsed = time.perf_counter_ns() - start
+    bucket = next((i for i, bound in enumerate(BUCKET_BOUNDS_NS) if elapsed <= bound), len(BUCKET_BOUNDS_NS))
+    for label in set(call_labels):
+        histogram = histograms.get(label)
+        if histogram is None:
+            histogram = histograms[label] = {'buckets': [0] * (len(BUCKET_BOUNDS_NS) + 1), 'sum_ns': 0, 'count': 0}
+        histogram['buckets'][bucket] += 1
+        histogram['sum_ns'] += elapsed
+        histogram['count'] += 1
+    call_labels = None
+
+def snapshot():
+    """Get the collected metrics.
+
+    Returns:
+        dict: 'trades', 'sample_every', 'bucket_bounds_ns', hit 'counts' and latency 'histograms' per branch
+    """
+    return {
+        'trades': calls,
+        'sample_every': sample_every,
+        'bucket_bounds_ns': BUCKET_BOUNDS_NS,
+        'counts': dict(sorted(counts.items())),
+        'histograms': {label: {'buckets': list(h['buckets']), 'sum_ns': h['sum_ns'], 'count': h['count']}
+                       for label, h in sorted(histograms.items())},
+    }
+
+def format_prometheus(data):
+    """Format a metrics snapshot in the Prometheus text exposition format."""
+    lines = [
+        '# HELP irs_engine_trades_total Trades processed by the engine',
+        '# TYPE irs_engine_trades_total counter',
+        f"irs_engine_trades_total {data['trades']}",
+        '# HELP irs_engine_branch_hits_total Hits per engine branch',
+        '# TYPE irs_engine_branch_hits_total counter',
+    ]
+    for label, value in data['counts'].items():
+        lines.append(f'irs_engine_branch_hits_total{{branch="{label}"}} {value}')
+    lines.append('# HELP irs_engine_branch_latency_seconds Latency of the (sampled) trades going through each engine branch')
+    lines.append('# TYPE irs_engine_branch_latency_seconds histogram')
+    for label, histogram in data['histograms'].items():
+        cumulative = 0
+        for bound, value in zip(data['bucket_bounds_ns'] + ['+Inf'], histogram['buckets']):
+            cumulative += value
+            le = bound if bound == '+Inf' else f'{bound / 1e9:g}'
+            lines.append(f'irs_engine_branch_latency_seconds_bucket{{branch="{label}",le="{le}"}} {cumulative}')
+        lines.append(f'irs_engine_branch_latency_seconds_sum{{branch="{label}"}} {histogram["sum_ns"] / 1e9:g}')
+        lines.append(f'irs_engine_branch_latency_seconds_count{{branch="{label}"}} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+def save_metrics(filename):
+    """Write the collected metrics, in the Prometheus text format if the file name ends with .prom
+    or .txt, otherwise as JSON.
+
+    Args:
+        filename: Path to the metrics file
+    """
+    data = snapshot()
+    with open(filename, 'w') as file:
+        if filename.endswith(('.prom', '.txt')):
+            file.write(format_prometheus(data))
+        else:
+            json.dump(data, file, indent=4)
@@ -0,0 +1,101 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Option values and option parsers shared by the command line and the k4sru modules.
+#
+# irs.py imports this module to build the argument parser before it knows which command runs, so
+# it must not import anything beyond the standard library basics. The modules using the values
+# import them from here.
+
+# Tax year of every subcommand when --year is not given
+DEFAULT_YEAR = 2025
+
+# Profile mode -> (track memory, run cProfile), see profiling.py
+PROFILE_MODES = {
+    'time': (False, False),
+    'memory': (True, False),
+    'full': (True, True),
+}
+
+# Trade counts of the bench command
+DEFAULT_SIZES = [1000, 100000, 1000000, 10000000]
+
+# Section -> absolute tolerance of numbers, see equivalence.py
+DEFAULT_TOLERANCES = {
+    'k4_data': 1e-6,
+    'stocks_data': 1e-6,
+    'statistics': 1e-6,
+    'sru': 0,
+}
+
+# Result cache of the k4sru command, see cache.py; disabled unless --cache-size is given
+DEFAULT_CACHE_DIR = 'output/cache/'
+DEFAULT_CACHE_SIZE_MB = 0
+
+# Engine snapshot interval of the k4sru --snapshots option, see snapshots.py
+DEFAULT_SNAPSHOT_TRADES = 1000
+DEFAULT_SNAPSHOT_DAYS = 30
+
+def parse_currency_mix(value):
+    """Parse a currency mix such as 'USD=0.6,EUR=0.3,SEK=0.1'.
+
+    Returns:
+        dict: Currency -> weight
+    """
+    mix = {}
+    for part in value.split(','):
+        currency, _, weight = part.partition('=')
+        mix[currency.strip().upper()] = float(weight) if weight else 1.0
+    return mix
+
+def parse_tolerance(value):
+    """Parse a tolerance option such as 'k4_data=0.01'.
+
+    Returns:
+        tuple: (section, tolerance)
+    """
+    section, _, tolerance = value.partition('=')
+    if section not in DEFAULT_TOLERANCES or not tolerance:
+        raise ValueError(f"expected <section>=<tolerance> with section one of {', '.join(DEFAULT_TOLERANCES)}")
+    return section, float(tolerance)
+
+def parse_timestamp(value):
+    """Parse a timestamp such as '2025-06-30', '20250630' or '2025-06-30 15:30:00' to the trade
+    DateTime format. A date without a time is the end of that day.
+
+    Returns:
+        str: Timestamp in 'YYYYMMDD;HHMMSS' format
+    """
+    digits = ''.join(c for c in value if c.isdigit())
+    if len(digits) == 8:
+        return digits + ';235959'
+    if len(digits) == 14:
+        return digits[:8] + ';' + digits[8:]
+    raise ValueError("expected a date YYYY-MM-DD or a time YYYY-MM-DD HH:MM:SS")
+
+def parse_sell(value):
+    """Parse a whatif sell option such as 'AAOI:100', 'AAOI:50%:41.5' or 'AAOI:all'.
+
+    Returns:
+        dict: Scenario
+    """
+    parts = value.split(':')
+    if len(parts) < 2 or len(parts) > 3 or not parts[0]:
+        raise ValueError("expected <symbol>:<quantity|all|percent%>[:<price>]")
+    scenario = {'symbol': parts[0], 'quantity': parts[1]}
+    if not (parts[1] == 'all' or parts[1].endswith('%')):
+        scenario['quantity'] = float(parts[1])
+    if len(parts) == 3:
+        scenario['price'] = float(parts[2])
+    return scenario
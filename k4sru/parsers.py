@@ -0,0 +1,109 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Registry of input parsers. The parser of an input is chosen by content sniffing, the file
+# name is not used.
+#
+# A parser is registered with a name, a sniffing function and a parse function:
+#
+#   sniff(header) -> bool   header is the first line of the (decompressed) input as a string
+#   parse(stream) -> iter   stream is a binary file object positioned at the start of the input,
+#                           yields ('trade', dict) and ('rate', dict) records in the IBKR flex format
+#
+# A new broker format only needs a parser module calling register_parser before the input files
+# are read; parsers registered at runtime are inherited by the worker processes when they are
+# forked.
+
+import csv
+import io
+import logging
+import sys
+from .streams import open_input, input_name, peek_line
+from .ibkr import is_ibkr_header, iter_ibkr_csv
+from .flexxml import is_flex_xml_header, iter_flex_xml
+from .bitstamp import is_bitstamp_header, iter_bitstamp_csv
+
+# Parser name -> (sniff, parse), sniffed in registration order
+PARSERS = {}
+
+def register_parser(name, sniff, parse):
+    """Register an input parser, replacing any parser registered with the same name.
+
+    Args:
+        name: Name of the input format, e.g. 'ibkr'
+        sniff: Function returning True if the first line of an input is in this format
+        parse: Generator function yielding ('trade', dict) and ('rate', dict) records from a binary stream
+    """
+    PARSERS.pop(name, None)
+    PARSERS[name] = (sniff, parse)
+
+def find_parser(header):
+    """Find the parser of an input from its first line.
+
+    Args:
+        header: The first line of the (decompressed) input
+
+    Returns:
+        str: Name of the matching parser, None if no parser matches
+    """
+    for name, (sniff, _) in PARSERS.items():
+        if sniff(header):
+            return name
+    return None
+
+def iter_input(source):
+    """Stream the trades and currency rates of an input of any registered format.
+
+    The input is opened once and read sequentially, so '-' (standard input) and named pipes
+    are supported.
+
+    Args:
+        source: Path, '-' for standard input or binary file object, optionally compressed
+
+    Yields:
+        tuple: ('trade', dict) and ('rate', dict) records in the IBKR flex format
+    """
+    with open_input(source, binary=True) as stream:
+        header, stream = peek_line(stream)
+        name = find_parser(header.decode('utf-8', errors='replace'))
+        if name is None:
+            logging.error("Unknown input format in %s", input_name(source))
+            sys.exit(1)
+        logging.debug("Reading %s as %s", input_name(source), name)
+        yield from PARSERS[name][1](stream)
+
+def csv_fields(header):
+    """Split a CSV header line into column names."""
+    return next(csv.reader([header]), [])
+
+def text_stream(stream):
+    """Decode a binary stream for the csv module."""
+    return io.TextIOWrapper(stream, newline='')
+
+def sniff_ibkr(header):
+    return is_ibkr_header(csv_fields(header))
+
+def parse_ibkr(stream):
+    return iter_ibkr_csv(text_stream(stream))
+
+def sniff_bitstamp(header):
+    return is_bitstamp_header(csv_fields(header))
+
+def parse_bitstamp(stream):
+    for trade in iter_bitstamp_csv(text_stream(stream)):
+        yield 'trade', trade
+
+register_parser('flexxml', is_flex_xml_header, iter_flex_xml)
+register_parser('ibkr', sniff_ibkr, parse_ibkr)
+register_parser('bitstamp', sniff_bitstamp, parse_bitstamp)
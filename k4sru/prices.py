@@ -0,0 +1,114 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Local price snapshot files (--prices).
+#
+# A CSV file with a Symbol, Price and optional Currency (default SEK) column:
+#
+#   Symbol,Price,Currency
+#   AAOI,24.10,USD
+#   RHMd,1650.5,EUR
+#   USD,9.52,SEK
+#   EUR,11.05,SEK
+#
+# or a JSON object with the same content, {"AAOI": {"price": 24.10, "currency": "USD"}, ...}, where
+# a plain number is a price in SEK. Option prices are per share, as quoted. The SEK rate of a
+# currency is its own price row, e.g. USD,9.52,SEK.
+
+import bisect
+import csv
+import json
+import logging
+import sys
+from .data import BASE_CURRENCY
+
+def read_prices(filename):
+    """Read a price snapshot file.
+
+    Args:
+        filename: Path to a CSV or JSON price file
+
+    Returns:
+        dict: Symbol -> {'price', 'currency'}
+    """
+    prices = {}
+    try:
+        with open(filename, newline='') as file:
+            if filename.endswith('.json'):
+                for symbol, value in json.load(file).items():
+                    if isinstance(value, dict):
+                        prices[symbol] = {'price': float(value['price']), 'currency': value.get('currency') or BASE_CURRENCY}
+                    else:
+                        prices[symbol] = {'price': float(value), 'currency': BASE_CURRENCY}
+            else:
+                for row in csv.DictReader(file):
+                    prices[row['Symbol'].strip()] = {'price': float(row['Price']), 'currency': (row.get('Currency') or BASE_CURRENCY).strip()}
+    except FileNotFoundError:
+        logging.error(f"Price file {filename} not found")
+        sys.exit(1)
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        logging.error(f"Invalid price file {filename}: {e}")
+        sys.exit(1)
+    logging.info(f"Loaded {len(prices)} prices from {filename}")
+    return prices
+
+def sek_rate(prices, currency, fallback=None):
+    """Get the SEK rate of a currency from the price file.
+
+    Args:
+        prices: Prices, see read_prices
+        currency: Currency code
+        fallback: Function returning the rate of a currency missing in the price file, or None
+
+    Returns:
+        float: SEK per unit of the currency, None if unknown
+    """
+    if currency == BASE_CURRENCY:
+        return 1.0
+    entry = prices.get(currency)
+    if entry is not None and entry['currency'] == BASE_CURRENCY:
+        return entry['price']
+    return fallback(currency) if fallback else None
+
+def index_rate_dates(currency_rates):
+    """Get the sorted dates of each currency in a currency rate index, see latest_rate.
+
+    Returns:
+        dict: Currency -> sorted list of dates in 'YYYYMMDD' format
+    """
+    rate_dates = {}
+    for date, currency in currency_rates:
+        rate_dates.setdefault(currency, []).append(date)
+    for dates in rate_dates.values():
+        dates.sort()
+    return rate_dates
+
+def latest_rate(currency_rates, rate_dates, currency, date):
+    """Get the rate of a currency on a date, or the latest earlier rate if the date has none.
+
+    Args:
+        currency_rates: Currency rate index keyed by (date, currency)
+        rate_dates: Sorted dates per currency, see index_rate_dates
+        currency: Currency code
+        date: Date in 'YYYYMMDD' or 'YYYYMMDD;HHMMSS' format
+
+    Returns:
+        float: SEK per unit of the currency
+    """
+    day = date.split(';')[0]
+    dates = rate_dates.get(currency, [])
+    i = bisect.bisect_right(dates, day)
+    if i == 0:
+        raise ValueError(f"no {currency} rate on or before {day}")
+    return currency_rates[(dates[i - 1], currency)]
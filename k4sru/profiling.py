@@ -0,0 +1,126 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-stage profiler for the k4sru pipeline (--profile).
+#
+# Each stage is timed, and depending on the mode the peak memory allocated during the stage is
+# tracked with tracemalloc and the stage is run under cProfile. The summary table is logged and
+# written to output/profile_<year>.txt, the cProfile statistics of each stage are written to
+# output/profile_<year>_<stage>.prof (view with e.g. `python -m pstats` or snakeviz).
+#
+# Stages must not be nested, cProfile only supports one active profiler at a time.
+
+import contextlib
+import cProfile
+import logging
+import pstats
+import time
+import tracemalloc
+from .sru import OUTPUT_DIR
+from .options import PROFILE_MODES
+
+def stage_profiler(results, mode='full'):
+    """Create a stage hook that profiles each stage.
+
+    Args:
+        results: Stage name -> {'seconds', 'peak_bytes', 'calls', 'stats'}, updated in place
+        mode: 'time', 'memory' (time and tracemalloc peak) or 'full' (time, tracemalloc and cProfile)
+    """
+    track_memory, run_cprofile = PROFILE_MODES[mode]
+
+    @contextlib.contextmanager
+    def stage(name):
+        entry = results.setdefault(name, {'seconds': 0.0, 'peak_bytes': None, 'calls': 0, 'stats': None})
+        if track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile() if run_cprofile else None
+        start = time.perf_counter()
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            entry['seconds'] += time.perf_counter() - start
+            entry['calls'] += 1
+            if track_memory:
+                peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes
+                entry['peak_bytes'] = max(entry['peak_bytes'] or 0, peak_bytes)
+            if profile:
+                if entry['stats'] is None:
+                    entry['stats'] = pstats.Stats(profile)
+                else:
+                    entry['stats'].add(profile)
+    return stage
+
+def format_bytes(value):
+    """Format a number of bytes as B, KiB, MiB or GiB."""
+    if value is None:
+        return '-'
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GiB"
+
+def format_profile_summary(results):
+    """Format the profile results as a table.
+
+    Returns:
+        list: Lines of the table
+    """
+    total = sum(entry['seconds'] for entry in results.values())
+    lines = []
+    lines.append("=" * 72)
+    lines.append(f"{'Stage':<24} {'Time (s)':>12} {'Share':>8} {'Peak memory':>14} {'Calls':>8}")
+    lines.append("-" * 72)
+    for name, entry in results.items():
+        share = entry['seconds'] / total * 100 if total > 0 else 0
+        lines.append(f"{name:<24} {entry['seconds']:>12.4f} {share:>7.1f}% {format_bytes(entry['peak_bytes']):>14} {entry['calls']:>8}")
+    lines.append("-" * 72)
+    lines.append(f"{'Total':<24} {total:>12.4f}")
+    lines.append("=" * 72)
+    return lines
+
+def save_profile_report(results, year):
+    """Log the profile summary and write it and the cProfile statistics to the output directory.
+
+    Args:
+        results: Profile results from stage_profiler
+        year: The tax year, used in the file names
+
+    Returns:
+        list: Paths of the written files
+    """
+    lines = format_profile_summary(results)
+    logging.info("Profile")
+    for line in lines:
+        logging.info(line)
+
+    summary_file = f'{OUTPUT_DIR}profile_{year}.txt'
+    with open(summary_file, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+    written = [summary_file]
+
+    for name, entry in results.items():
+        if entry['stats'] is not None:
+            prof_file = f'{OUTPUT_DIR}profile_{year}_{name}.prof'
+            entry['stats'].dump_stats(prof_file)
+            written.append(prof_file)
+    logging.info(f"Profile saved to {', '.join(written)}")
+    return written
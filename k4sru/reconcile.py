@@ -0,0 +1,172 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Reconciliation of the computed positions with broker open-positions exports (irs reconcile).
+#
+# A broker export is a CSV file with a Symbol and a Quantity (or Position) column, and optional
+# ISIN and ReportDate (or Date) columns, e.g. the IBKR Open Positions flex query:
+#
+#   "ReportDate","Symbol","ISIN","Quantity"
+#   "20250630","RHMd","DE0007030009","4"
+#   "20250630","IBIT  250117C00050000","","2"
+#
+# Rows without a date are the positions at the end of the tax year. Each report date is compared
+# with the engine state at the end of that day, taken from a snapshot index (see snapshots.py),
+# so an export of every month-end finds the first month where the replay diverges.
+#
+# The comparison is a hash join: the computed positions are a dict keyed by symbol, and a broker
+# row is looked up by its symbol, or by its ISIN through the ISIN -> symbol map of the traded
+# symbols. Each side is read once, so a date is checked in time linear in the positions.
+# Whitespace in symbols is collapsed, IBKR pads the underlying of an option symbol.
+
+import csv
+import logging
+import sys
+from .data import read_input_files, deduplicate_trades, process_currency_rates, sort_trades, init_stocks_data
+from .snapshots import new_snapshot_index, record_snapshots, state_as_of
+from .sru import k4_section
+from .whatif import quiet_engine
+
+# Quantities closer than this are equal (fractions of BTC and currencies)
+QUANTITY_TOLERANCE = 1e-6
+
+def normalize_symbol(symbol):
+    return ' '.join(symbol.split())
+
+def read_broker_positions(filename, year):
+    """Read a broker open-positions export.
+
+    Args:
+        filename: Path to the CSV file
+        year: The tax year, the date of rows without a date is December 31
+
+    Returns:
+        dict: Date 'YYYYMMDD' -> symbol -> {'quantity', 'isin'}
+    """
+    reports = {}
+    try:
+        with open(filename, newline='') as file:
+            reader = csv.DictReader(file)
+            fields = reader.fieldnames or []
+            quantity_field = 'Quantity' if 'Quantity' in fields else 'Position'
+            date_field = 'ReportDate' if 'ReportDate' in fields else 'Date' if 'Date' in fields else None
+            if 'Symbol' not in fields or quantity_field not in fields:
+                logging.error(f"{filename} must have a Symbol and a Quantity or Position column")
+                sys.exit(1)
+            for row in reader:
+                date = (row.get(date_field) or '').replace('-', '')[:8] if date_field else ''
+                positions = reports.setdefault(date or f'{year}1231', {})
+                symbol = normalize_symbol(row['Symbol'])
+                entry = positions.setdefault(symbol, {'quantity': 0.0, 'isin': (row.get('ISIN') or '').strip()})
+                # An export split by account or lot has several rows of a symbol
+                entry['quantity'] += float(row[quantity_field])
+    except FileNotFoundError:
+        logging.error(f"Broker positions file {filename} not found")
+        sys.exit(1)
+    except ValueError as e:
+        logging.error(f"Invalid quantity in {filename}: {e}")
+        sys.exit(1)
+    return reports
+
+def isin_symbols(trades):
+    """Get the ISIN -> symbol map of the traded symbols."""
+    symbols = {}
+    for trade in trades:
+        isin = trade.get('ISIN')
+        if isin:
+            symbols[isin] = normalize_symbol(trade['Symbol'])
+    return symbols
+
+def reconcile_positions(computed, broker, isins, currencies=False):
+    """Compare the computed positions with the broker positions of a date.
+
+    Args:
+        computed: Stocks data of the engine
+        broker: Broker positions, symbol -> {'quantity', 'isin'}
+        isins: ISIN -> symbol map, see isin_symbols
+        currencies: Also compare currency balances, which position exports usually leave out
+
+    Returns:
+        list: Differences sorted by symbol, dictionaries with 'symbol', 'isin', 'status'
+              ('mismatch', 'missing_computed' or 'missing_broker'), 'broker', 'computed' and 'difference'
+    """
+    # Build side: the open computed positions keyed by symbol
+    positions = {}
+    for symbol, data in computed.items():
+        if data['quantity'] != 0 and (currencies or k4_section(symbol) != 'C'):
+            positions[normalize_symbol(symbol)] = data['quantity']
+    matched = set()
+    differences = []
+    # Probe side: each broker row, by symbol and then by ISIN
+    for symbol, entry in broker.items():
+        symbol = normalize_symbol(symbol)
+        if not currencies and k4_section(symbol) == 'C':
+            continue
+        key = symbol if symbol in positions else isins.get(entry['isin'], symbol)
+        quantity = positions.get(key)
+        if quantity is not None:
+            matched.add(key)
+        if quantity is None and abs(entry['quantity']) <= QUANTITY_TOLERANCE:
+            continue
+        if quantity is not None and abs(quantity - entry['quantity']) <= QUANTITY_TOLERANCE:
+            continue
+        differences.append({
+            'symbol': key,
+            'isin': entry['isin'],
+            'status': 'missing_computed' if quantity is None else 'mismatch',
+            'broker': entry['quantity'],
+            'computed': quantity or 0,
+            'difference': (quantity or 0) - entry['quantity'],
+        })
+    for symbol, quantity in positions.items():
+        if symbol not in matched:
+            differences.append({'symbol': symbol, 'isin': '', 'status': 'missing_broker', 'broker': 0,
+                                'computed': quantity, 'difference': quantity})
+    return sorted(differences, key=lambda difference: difference['symbol'])
+
+def build_snapshot_index(filenames, year, workers=None):
+    """Run the engine over the input files with snapshots, see snapshots.record_snapshots.
+
+    Returns:
+        dict: Snapshot index
+    """
+    sources = read_input_files(filenames, workers)
+    trades, _ = deduplicate_trades([(filename, source_trades) for filename, source_trades, _ in sources])
+    currency_rates = {}
+    process_currency_rates([rate for _, _, rates in sources for rate in rates], currency_rates, year, None)
+    index = new_snapshot_index(year)
+    record_snapshots(index, sort_trades(trades), init_stocks_data(year), {}, currency_rates, [])
+    return index
+
+def reconcile(index, reports, currencies=False):
+    """Compare the engine state at the end of each report date with the broker positions.
+
+    Args:
+        index: Snapshot index, see snapshots.py
+        reports: Date -> broker positions, see read_broker_positions
+        currencies: Also compare currency balances
+
+    Returns:
+        dict: 'dates', a list of {'date', 'positions', 'differences'} in date order, and
+              'first_divergent_date', None if every date agrees
+    """
+    isins = isin_symbols(index['trades'] + index['options'])
+    dates = []
+    for date in sorted(reports):
+        with quiet_engine():
+            stocks_data, _ = state_as_of(index, f'{date};235959')
+        differences = reconcile_positions(stocks_data, reports[date], isins, currencies)
+        dates.append({'date': date, 'positions': len(reports[date]), 'differences': differences})
+    first = next((entry['date'] for entry in dates if entry['differences']), None)
+    return {'dates': dates, 'first_divergent_date': first}
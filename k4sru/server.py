@@ -0,0 +1,427 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Local daemon keeping the engine state of a tax year in memory (irs serve).
+#
+# New fills and currency rates are posted as JSON in the IBKR flex format and processed by the
+# engine right away, so K4 and portfolio queries are answered without parsing or replaying the
+# history. The state is written to a checkpoint file periodically, on POST /checkpoint and on
+# shutdown, and loaded again on start.
+#
+#   POST /trades      [{"DateTime": "20250225;030616", "Symbol": "AAOI", "Buy/Sell": "BUY", ...}, ...]
+#   POST /rates       [{"Date/Time": "20250225", "FromCurrency": "SEK", "ToCurrency": "USD", "Rate": "0.0934"}, ...]
+#   GET  /k4          realized K4 rows so far with the total profit/loss and tax
+#   GET  /portfolio   open positions, ?symbol=AAOI for a single symbol
+#   POST /checkpoint  write the checkpoint now
+#
+# Fills must arrive in chronological order: a fill older than the last processed fill is
+# rejected (409), as the engine result depends on the order. A fill is identified by its IBKR
+# 'TradeID' when it has one. A fill without a TradeID is identified by trade_identity() and its
+# occurrence number within the request, like in deduplicate_trades, and a warning is returned when
+# such a fill is ignored: two real fills with the same time, symbol, quantity and price posted in
+# separate requests cannot be told apart without the TradeID. A fill already processed is ignored,
+# so a batch can be posted again after a timeout. A batch is processed atomically, if a fill fails
+# (400/422) none of the batch is kept.
+#
+# A batch is processed in engine order (sort_trades), which puts its options after its dated
+# trades. k4sru processes the options after all dated trades of the year, so an option posted
+# before later stock or currency fills in the same currency is processed earlier than k4sru would,
+# and the balance of the currency can differ. Post the options after the dated trades to get the
+# k4sru result.
+#
+# The engine works on a stage of the state: only the stocks_data and k4_data entries the batch can
+# change (see trade_keys, like the fork of whatif.py) are copied, the other entries are shared, and
+# the stage is merged into the state when the whole batch succeeded.
+
+import json
+import logging
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import ChainMap, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from .data import (BASE_CURRENCY, process_input_data, process_currency_rates, sort_trades, trade_identity, trade_keys, is_option,
+                   read_input_files, deduplicate_trades, init_stocks_data, init_currency_rates)
+from .ibkr import TRADE_FIELDS, RATE_FIELDS
+
+CHECKPOINT_VERSION = 2
+
+class RequestError(ValueError):
+    """A request that cannot be processed, with the HTTP status to answer."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def new_state(year, stocks_data=None, predefined_rates=None):
+    """Create the engine state of a tax year.
+
+    Args:
+        year: The tax year
+        stocks_data: Portfolio at the start of the year
+        predefined_rates: Predefined rates keyed by (date, currency)
+
+    Returns:
+        dict: Engine state
+    """
+    return {
+        'year': year,
+        'stocks_data': stocks_data or {},
+        'k4_data': {},
+        'statistics_data': [],
+        'currency_rates': {},
+        # Raw flex rate rows keyed by (date, from, to), the rate index is rebuilt from them
+        'rate_rows': {},
+        'predefined_rates': predefined_rates or {},
+        'seen': set(),
+        'last_datetime': '',
+        'trades': 0,
+        'dirty': False,
+    }
+
+def add_rates(state, rates):
+    """Add currency rates in the flex format and rebuild the rate index.
+
+    process_currency_rates converts the EUR and DKK rates of the whole index, so the index is
+    rebuilt from all rate rows rather than updated.
+
+    Returns:
+        int: Number of rate rows in the state
+    """
+    for rate in rates:
+        missing = [field for field in RATE_FIELDS if field not in rate]
+        if missing:
+            raise RequestError(400, f"Missing fields {missing} in rate {rate}")
+    rows = dict(state['rate_rows'])
+    for rate in rates:
+        rows[(rate['Date/Time'].split(';')[0], rate['FromCurrency'], rate['ToCurrency'])] = {field: str(rate[field]) for field in RATE_FIELDS}
+    currency_rates = {}
+    try:
+        process_currency_rates(rows.values(), currency_rates, state['year'], state['predefined_rates'])
+    except KeyError as e:
+        raise RequestError(422, f"EUR and DKK rates need the SEK/USD rate of the same date, missing {e}")
+    state['rate_rows'] = rows
+    # The engine holds no reference to the index between requests, so it can be replaced
+    state['currency_rates'] = currency_rates
+    state['dirty'] = True
+    return len(rows)
+
+def add_trades(state, trades):
+    """Process new fills in the flex format.
+
+    Args:
+        state: Engine state
+        trades: List of trade dictionaries in chronological order
+
+    Returns:
+        dict: Number of 'accepted' and 'duplicates' fills, and 'warnings' about fills without a
+              TradeID that were ignored as already processed
+    """
+    batch = []
+    seen = set()
+    occurrences = Counter()
+    warnings = []
+    last_datetime = state['last_datetime']
+    for trade in trades:
+        missing = [field for field in TRADE_FIELDS if field not in trade]
+        if missing:
+            raise RequestError(400, f"Missing fields {missing} in trade {trade}")
+        trade_id = str(trade.get('TradeID') or '')
+        trade = {field: str(trade[field]) for field in TRADE_FIELDS}
+        if trade_id:
+            trade['TradeID'] = trade_id
+            identity = ('TradeID', trade_id)
+        else:
+            identity = trade_identity(trade)
+            occurrences[identity] += 1
+            identity += (occurrences[identity],)
+        if identity in state['seen'] or identity in seen:
+            if not trade_id:
+                warning = (f"Ignored {trade['Buy/Sell']} {trade['Quantity']} {trade['Symbol']} @ {trade['TradePrice']} at {trade['DateTime']}, "
+                           f"identical to a processed fill; post the TradeID to keep identical fills")
+                logging.warning(warning)
+                warnings.append(warning)
+            continue
+        if trade['DateTime'] < last_datetime and not is_option(trade['Symbol']):
+            raise RequestError(409, f"Trade {trade['Symbol']} at {trade['DateTime']} is older than the last processed trade at {last_datetime}")
+        currency = trade['CurrencyPrimary']
+        date = trade['DateTime'].split(';')[0]
+        if currency != BASE_CURRENCY and (date, currency) not in state['currency_rates']:
+            raise RequestError(422, f"No {currency} rate for {date}, post the rates of the day first")
+        if not is_option(trade['Symbol']):
+            last_datetime = max(last_datetime, trade['DateTime'])
+        seen.add(identity)
+        batch.append(trade)
+
+    if batch:
+        # Process on a stage so that a failing fill leaves the state untouched, see the module comment
+        keys = set().union(*(trade_keys(trade['Symbol'], trade['CurrencyPrimary']) for trade in batch))
+        staged_stocks = {key: dict(state['stocks_data'][key]) for key in keys if key in state['stocks_data']}
+        staged_k4 = {key: dict(state['k4_data'][key]) for key in keys if key in state['k4_data']}
+        statistics_data = []
+        try:
+            process_input_data(sort_trades(batch), ChainMap(staged_stocks, state['stocks_data']), ChainMap(staged_k4, state['k4_data']),
+                               state['currency_rates'], statistics_data)
+        except SystemExit:
+            raise RequestError(422, "The trades could not be processed, see the server log")
+        except ValueError as e:
+            raise RequestError(400, f"Invalid trade: {e}")
+        state['stocks_data'].update(staged_stocks)
+        state['k4_data'].update(staged_k4)
+        state['statistics_data'].extend(statistics_data)
+        state['last_datetime'] = last_datetime
+        state['seen'].update(seen)
+        state['trades'] += len(batch)
+        state['dirty'] = True
+    return {'accepted': len(batch), 'duplicates': len(trades) - len(batch), 'warnings': warnings}
+
+def k4_preview(state):
+    """Get the realized K4 rows so far.
+
+    Returns:
+        dict: 'year', 'trades', 'rows' (the K4 data per symbol), 'profit_loss' and 'tax' (30 %) in SEK
+    """
+    rows = sorted(state['k4_data'].values(), key=lambda row: row['beteckning'])
+    profit_loss = sum(row['forsaljningspris'] - row['omkostnadsbelopp'] for row in rows)
+    return {
+        'year': state['year'],
+        'trades': state['trades'],
+        'rows': rows,
+        'profit_loss': profit_loss,
+        'tax': profit_loss * 0.3,
+    }
+
+def portfolio(state, symbol=None):
+    """Get the open positions, see save_stocks_data.
+
+    Returns:
+        dict: Symbol -> position
+    """
+    positions = {name: data for name, data in state['stocks_data'].items() if data['quantity'] != 0}
+    if symbol is not None:
+        return {symbol: positions[symbol]} if symbol in positions else {}
+    return positions
+
+def save_checkpoint(state, filename):
+    """Write the engine state to a checkpoint file, replacing it atomically.
+
+    Returns:
+        float: Seconds it took to write the checkpoint
+    """
+    start = time.perf_counter()
+    checkpoint = {
+        'version': CHECKPOINT_VERSION,
+        'year': state['year'],
+        'stocks_data': state['stocks_data'],
+        'k4_data': state['k4_data'],
+        'statistics_data': state['statistics_data'],
+        'rate_rows': list(state['rate_rows'].values()),
+        'seen': sorted(state['seen']),
+        'last_datetime': state['last_datetime'],
+        'trades': state['trades'],
+    }
+    temporary = f'{filename}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(temporary, filename)
+    state['dirty'] = False
+    seconds = time.perf_counter() - start
+    logging.info(f"Checkpoint with {state['trades']} trades saved to {filename} in {seconds * 1000:.1f} ms")
+    return seconds
+
+def load_checkpoint(filename, predefined_rates=None):
+    """Load the engine state from a checkpoint file.
+
+    Returns:
+        dict: Engine state, see new_state
+    """
+    with open(filename) as file:
+        checkpoint = json.load(file)
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')} in {filename}")
+    state = new_state(checkpoint['year'], checkpoint['stocks_data'], predefined_rates)
+    state['k4_data'] = checkpoint['k4_data']
+    state['statistics_data'] = [tuple(entry) for entry in checkpoint['statistics_data']]
+    state['seen'] = {tuple(identity) for identity in checkpoint['seen']}
+    state['last_datetime'] = checkpoint['last_datetime']
+    state['trades'] = checkpoint['trades']
+    add_rates(state, checkpoint['rate_rows'])
+    state['dirty'] = False
+    logging.info(f"Checkpoint with {state['trades']} trades loaded from {filename}")
+    return state
+
+def init_state(year, checkpoint=None, filenames=None):
+    """Create the engine state from the checkpoint if it exists, otherwise from the input files.
+
+    Args:
+        year: The tax year
+        checkpoint: Path to the checkpoint file
+        filenames: Input files processed when there is no checkpoint
+
+    Returns:
+        dict: Engine state
+    """
+    predefined_rates = init_currency_rates(year)
+    if checkpoint and os.path.exists(checkpoint):
+        return load_checkpoint(checkpoint, predefined_rates)
+    state = new_state(year, init_stocks_data(year), predefined_rates)
+    if filenames:
+        sources = read_input_files(filenames)
+        trades, _ = deduplicate_trades([(filename, source_trades) for filename, source_trades, _ in sources])
+        add_rates(state, [rate for _, _, rates in sources for rate in rates])
+        # Exports are not in chronological order. Options are ordered by symbol by the engine and
+        # keep their export order here, see sort_trades
+        trades.sort(key=lambda trade: '' if is_option(trade['Symbol']) else trade['DateTime'])
+        add_trades(state, trades)
+    return state
+
+def make_handler(state, lock, checkpoint=None):
+    """Create the request handler class serving the engine state.
+
+    Args:
+        state: Engine state
+        lock: Lock serializing the access to the state
+        checkpoint: Path to the checkpoint file for POST /checkpoint
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def address_string(self):
+            # Unix socket clients have no address
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+        def log_message(self, format, *args):
+            logging.debug("%s - %s", self.address_string(), format % args)
+
+        def send_json(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                data = json.loads(self.rfile.read(length) or b'[]')
+            except json.JSONDecodeError as e:
+                raise RequestError(400, f"Invalid JSON: {e}")
+            if isinstance(data, dict):
+                data = [data]
+            if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+                raise RequestError(400, "Expected a JSON object or a list of objects")
+            return data
+
+        def handle_request(self, method):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            start = time.perf_counter()
+            try:
+                with lock:
+                    if method == 'GET' and url.path == '/k4':
+                        result = k4_preview(state)
+                    elif method == 'GET' and url.path == '/portfolio':
+                        result = portfolio(state, query.get('symbol', [None])[0])
+                    elif method == 'POST' and url.path == '/trades':
+                        result = add_trades(state, self.read_json())
+                    elif method == 'POST' and url.path == '/rates':
+                        result = {'rates': add_rates(state, self.read_json())}
+                    elif method == 'POST' and url.path == '/checkpoint':
+                        if not checkpoint:
+                            raise RequestError(400, "The server runs without a checkpoint file")
+                        result = {'checkpoint': checkpoint, 'seconds': save_checkpoint(state, checkpoint)}
+                    else:
+                        raise RequestError(404, f"Unknown endpoint {method} {url.path}")
+            except RequestError as e:
+                logging.warning(f"{method} {url.path}: {e}")
+                self.send_json(e.status, {'error': str(e)})
+                return
+            except ValueError as e:
+                # A field that is not a number, e.g. the rate of POST /rates
+                logging.warning(f"{method} {url.path}: {e}")
+                self.send_json(400, {'error': str(e)})
+                return
+            logging.debug(f"{method} {url.path} answered in {(time.perf_counter() - start) * 1000:.2f} ms")
+            self.send_json(200, result)
+
+        def do_GET(self):
+            self.handle_request('GET')
+
+        def do_POST(self):
+            self.handle_request('POST')
+
+    return Handler
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def create_server(handler, host='127.0.0.1', port=8765, socket_path=None):
+    """Create a threading HTTP server on a TCP port or a Unix socket."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+def checkpoint_periodically(state, lock, checkpoint, interval, stop):
+    """Write the checkpoint every interval seconds when the state has changed, until stop is set."""
+    while not stop.wait(interval):
+        with lock:
+            if state['dirty']:
+                save_checkpoint(state, checkpoint)
+
+def stop_on_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+def serve(year, host='127.0.0.1', port=8765, socket_path=None, checkpoint=None, interval=60, filenames=None):
+    """Run the daemon until it is interrupted.
+
+    Args:
+        year: The tax year
+        host: Host name or address to listen on
+        port: TCP port to listen on
+        socket_path: Unix socket to listen on instead of the TCP port
+        checkpoint: Path to the checkpoint file, no checkpoints if None
+        interval: Seconds between the periodic checkpoints
+        filenames: Input files processed on start when there is no checkpoint
+    """
+    try:
+        state = init_state(year, checkpoint, filenames)
+    except (RequestError, ValueError) as e:
+        logging.error(f"Cannot initialize the engine state: {e}")
+        sys.exit(1)
+    lock = threading.Lock()
+    server = create_server(make_handler(state, lock, checkpoint), host, port, socket_path)
+    stop = threading.Event()
+    if checkpoint:
+        threading.Thread(target=checkpoint_periodically, args=(state, lock, checkpoint, interval, stop), daemon=True).start()
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    logging.info(f"Serving {state['year']} with {state['trades']} trades on {socket_path or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Shutting down")
+    finally:
+        stop.set()
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+        if checkpoint and state['dirty']:
+            with lock:
+                save_checkpoint(state, checkpoint)
@@ -0,0 +1,244 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Positions "as of" any time of the tax year from periodic engine snapshots (k4sru --snapshots, irs asof).
+#
+# During a run the engine state (stocks_data) is recorded every N trades or D days into a snapshot
+# index, together with the sorted trades and the currency rate index:
+#
+#   trades          trades in engine order up to the first option (sorted by DateTime)
+#   options         the option trades, which the engine processes last in (symbol, side) order
+#   snapshot_trades number of trades processed before each snapshot, ascending, starting at 0
+#   snapshots       the stocks_data entries after snapshot_trades[i] trades: every base_every-th
+#                   snapshot (starting with the first) is a full base, the others only hold the
+#                   entries changed since the previous snapshot (see trade_keys)
+#   currency_rates  the currency rate index, keyed by 'YYYYMMDD_<currency>' in the file
+#
+# In the file the trades and options are lists of values in the order of 'trade_fields'.
+#
+# The state as of a timestamp is the state of a run with the trades up to that timestamp: the
+# trades are cut with a binary search on their times, the nearest snapshot before the cut is found
+# with a binary search and rebuilt from its base, and only the trades between the snapshot and the
+# cut are replayed, followed by the option trades up to the timestamp. A sorted subset of the
+# trades is a subsequence of the sorted trades, so this gives the same state as truncating the
+# input and running it again.
+#
+# Like that run, the options are replayed after all dated trades up to the timestamp and not at
+# their own time: the currency balance as of a date between an option trade and a later trade in
+# the same currency includes the option trade after that later trade.
+
+import bisect
+import json
+import logging
+import sys
+from datetime import date
+from .data import process_input_data, process_trading_data, is_option, trade_keys
+from .ibkr import TRADE_FIELDS
+from .options import DEFAULT_SNAPSHOT_TRADES, DEFAULT_SNAPSHOT_DAYS
+
+SNAPSHOT_VERSION = 2
+
+# Every this many snapshots a full base is stored, the others only hold the changed entries
+SNAPSHOT_BASE_EVERY = 10
+
+def new_snapshot_index(year, every_trades=DEFAULT_SNAPSHOT_TRADES, every_days=DEFAULT_SNAPSHOT_DAYS, base_every=SNAPSHOT_BASE_EVERY):
+    """Create an empty snapshot index.
+
+    Args:
+        year: The tax year
+        every_trades: Take a snapshot every this many trades, 0 to disable
+        every_days: Take a snapshot every this many days, 0 to disable
+        base_every: Store a full base every this many snapshots
+
+    Returns:
+        dict: Snapshot index, filled by record_snapshots
+    """
+    return {
+        'year': year,
+        'every_trades': every_trades,
+        'every_days': every_days,
+        'base_every': base_every,
+        'trades': [],
+        'datetimes': [],
+        'options': [],
+        'snapshot_trades': [],
+        'snapshots': [],
+        'currency_rates': {},
+    }
+
+def trade_date(trade):
+    value = trade['DateTime']
+    return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+def snapshot_points(trades, every_trades, every_days):
+    """Get the trade positions at which a snapshot is taken.
+
+    Args:
+        trades: Trades sorted by DateTime
+        every_trades: Take a snapshot every this many trades, 0 to disable
+        every_days: Take a snapshot every this many days, 0 to disable
+
+    Returns:
+        list: Number of trades processed before each snapshot, starting at 0
+    """
+    points = [0]
+    if not trades:
+        return points
+    last_day = trade_date(trades[0])
+    for i, trade in enumerate(trades):
+        if i == points[-1]:
+            continue
+        day = trade_date(trade) if every_days else None
+        if (every_trades and i - points[-1] >= every_trades) or (every_days and (day - last_day).days >= every_days):
+            points.append(i)
+            last_day = day
+    return points
+
+def record_snapshots(index, sorted_trades, stocks_data, k4_data, currency_rates, statistics_data):
+    """Process the sorted trades like process_trading_data, taking snapshots into the index.
+
+    Args:
+        index: Snapshot index, see new_snapshot_index
+        sorted_trades: Trades in engine order, see sort_trades
+
+    Returns:
+        list: K4 data sorted by beteckning
+    """
+    first_option = next((i for i, trade in enumerate(sorted_trades) if is_option(trade['Symbol'])), len(sorted_trades))
+    trades = sorted_trades[:first_option]
+    points = snapshot_points(trades, index['every_trades'], index['every_days'])
+    snapshots = []
+    previous = 0
+    for number, point in enumerate(points):
+        segment = trades[previous:point]
+        process_input_data(segment, stocks_data, k4_data, currency_rates, statistics_data)
+        if number % index['base_every'] == 0:
+            keys = stocks_data.keys()
+        else:
+            keys = set().union(*(trade_keys(trade['Symbol'], trade['CurrencyPrimary']) for trade in segment))
+        # The entries hold numbers and dates only, a shallow copy is a full copy
+        snapshots.append({key: dict(stocks_data[key]) for key in keys if key in stocks_data})
+        previous = point
+    output = process_trading_data(trades[previous:] + sorted_trades[first_option:], stocks_data, k4_data, currency_rates, statistics_data)
+
+    index['trades'] = trades
+    index['datetimes'] = [trade['DateTime'] for trade in trades]
+    index['options'] = sorted_trades[first_option:]
+    index['snapshot_trades'] = points
+    index['snapshots'] = snapshots
+    index['currency_rates'] = dict(currency_rates)
+    logging.info(f"Recorded {len(snapshots)} engine snapshots of {len(sorted_trades)} trades, {sum(len(snapshot) for snapshot in snapshots)} entries")
+    return output
+
+def snapshot_state(index, slot):
+    """Rebuild the stocks_data of a snapshot from its base and the changes after it.
+
+    Args:
+        index: Snapshot index
+        slot: Number of the snapshot
+
+    Returns:
+        dict: Stocks data, a copy that can be changed
+    """
+    base = slot - slot % index['base_every']
+    stocks_data = {}
+    for snapshot in index['snapshots'][base:slot + 1]:
+        stocks_data.update((key, dict(data)) for key, data in snapshot.items())
+    return stocks_data
+
+def state_as_of(index, timestamp):
+    """Get the engine state after the trades up to a timestamp.
+
+    Args:
+        index: Snapshot index
+        timestamp: Timestamp in 'YYYYMMDD;HHMMSS' format, see parse_timestamp
+
+    Returns:
+        tuple: (stocks_data, number of replayed trades)
+    """
+    cut = bisect.bisect_right(index['datetimes'], timestamp)
+    slot = bisect.bisect_right(index['snapshot_trades'], cut) - 1
+    stocks_data = snapshot_state(index, slot)
+    replay = index['trades'][index['snapshot_trades'][slot]:cut]
+    replay += [trade for trade in index['options'] if trade['DateTime'] <= timestamp]
+    process_input_data(replay, stocks_data, {}, index['currency_rates'], [])
+    return stocks_data, len(replay)
+
+def positions_as_of(index, timestamp, symbols=None):
+    """Get the positions and average prices after the trades up to a timestamp.
+
+    Args:
+        index: Snapshot index
+        timestamp: Timestamp in 'YYYYMMDD;HHMMSS' format
+        symbols: Symbols to include, all open positions if None
+
+    Returns:
+        dict: Symbol -> {'quantity', 'avgprice', 'totalprice'}, a symbol without a position has quantity 0
+    """
+    stocks_data, replayed = state_as_of(index, timestamp)
+    logging.debug(f"State as of {timestamp} from a snapshot and {replayed} replayed trades")
+    if symbols is None:
+        symbols = sorted(symbol for symbol, data in stocks_data.items() if data['quantity'] != 0)
+    positions = {}
+    for symbol in symbols:
+        data = stocks_data.get(symbol, {})
+        positions[symbol] = {
+            'quantity': data.get('quantity', 0),
+            'avgprice': data.get('avgprice', 0),
+            'totalprice': data.get('totalprice', 0),
+        }
+    return positions
+
+def save_snapshot_index(filename, index):
+    """Write the snapshot index to a JSON file."""
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'year': index['year'],
+        'every_trades': index['every_trades'],
+        'every_days': index['every_days'],
+        'base_every': index['base_every'],
+        'trade_fields': TRADE_FIELDS,
+        'trades': [[trade[field] for field in TRADE_FIELDS] for trade in index['trades']],
+        'options': [[trade[field] for field in TRADE_FIELDS] for trade in index['options']],
+        'snapshot_trades': index['snapshot_trades'],
+        'snapshots': index['snapshots'],
+        'currency_rates': {'_'.join(key): rate for key, rate in index['currency_rates'].items()},
+    }
+    with open(filename, 'w') as file:
+        json.dump(data, file)
+    logging.info(f"Snapshot index with {len(index['snapshots'])} snapshots saved to {filename}")
+
+def load_snapshot_index(filename):
+    """Read a snapshot index from a JSON file.
+
+    Returns:
+        dict: Snapshot index
+    """
+    try:
+        with open(filename) as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        logging.error(f"Snapshot index {filename} not found, create it with k4sru --snapshots")
+        sys.exit(1)
+    if data.get('version') != SNAPSHOT_VERSION:
+        logging.error(f"Unsupported snapshot index version {data.get('version')} in {filename}")
+        sys.exit(1)
+    index = new_snapshot_index(data['year'], data['every_trades'], data['every_days'], data['base_every'])
+    index['trades'] = [dict(zip(data['trade_fields'], values)) for values in data['trades']]
+    index['datetimes'] = [trade['DateTime'] for trade in index['trades']]
+    index['options'] = [dict(zip(data['trade_fields'], values)) for values in data['options']]
+    index['snapshot_trades'] = data['snapshot_trades']
+    index['snapshots'] = data['snapshots']
+    index['currency_rates'] = {tuple(key.split('_')): rate for key, rate in data['currency_rates'].items()}
+    return index
@@ -314,6 +314,16 @@ def generate_summary(codes, summa_forsaljningspris, summa_omkostnadsbelopp):
                     f"#UPPGIFT {codes['summa_forlust']} 0\n")
     return summary
 
+def k4_section(symbol):
+    """Get the K4 section of a symbol: 'A' for shares, 'C' for currencies and 'D' for other assets (options, BTC)."""
+    # Imported here, data.py imports this module
+    from .data import is_option
+    if symbol in CURRENCY_CODES:
+        return 'C'
+    if is_option(symbol) or symbol == "BTC":
+        return 'D'
+    return 'A'
+
 def generate_k4_blocks(k4_combined_transactions, longnames):
     """Process K4 transactions into SRU file format.
 
@@ -347,7 +357,8 @@ def generate_k4_blocks(k4_combined_transactions, longnames):
         beskrivning = data['beskrivning']
         forsaljningspris = data['forsaljningspris']
         omkostnadsbelopp = data['omkostnadsbelopp']
-        if symbol not in CURRENCY_CODES and not (' ' in symbol and any(c.isdigit() for c in symbol)) and symbol != "BTC": # Aktier
+        section = k4_section(symbol)
+        if section == 'A': # Aktier
             k4_a_counter += 1
             logging.debug(f"Aktie: {symbol} row {k4_a_counter}")
             k4_a_rows += generate_row(k4_a_counter, K4_FIELD_CODES_A, symbol, beskrivning, data, longnames)
@@ -362,7 +373,7 @@ def generate_k4_blocks(k4_combined_transactions, longnames):
                 summa_forsaljningspris_a = 0
                 summa_omkostnadsbelopp_a = 0
                 k4_a_rows = ""
-        elif symbol not in CURRENCY_CODES: # Other (options, BTC, etc.)
+        elif section == 'D': # Other (options, BTC, etc.)
             k4_d_counter += 1
             logging.debug(f"Övriga värdepapper: {symbol} row {k4_d_counter}")
             k4_d_rows += generate_row(k4_d_counter, K4_FIELD_CODES_D, symbol, beskrivning, data, longnames)
@@ -465,20 +476,35 @@ def generate_body(config, k4_combined_transactions, longnames, year):
     file_body += assemble_blocks(config, blocks_a, blocks_c, blocks_d, year)
     return file_body
 
-def generate_blanketter_sru(config, k4_combined_transactions, longnames, year):
-    """Generate BLANKETTER.SRU file from K4 trading data.
+def render_blanketter_sru(config, k4_combined_transactions, longnames, year):
+    """Render the content of the BLANKETTER.SRU file from K4 trading data.
 
     Args:
         config: Dictionary containing configuration
         k4_combined_transactions: Dictionary containing combined K4 transactions
         longnames: Boolean indicating whether to use long names
         year: The tax year for which to generate the report
+
+    Returns:
+        str: Content of the BLANKETTER.SRU file
     """
     # Initialize file_content first
     file_content = ""
     file_body = generate_body(config, k4_combined_transactions, longnames, year)
     file_content += file_body
     file_content += "#FIL_SLUT\n"
+    return file_content
+
+def generate_blanketter_sru(config, k4_combined_transactions, longnames, year):
+    """Generate BLANKETTER.SRU file from K4 trading data.
+
+    Args:
+        config: Dictionary containing configuration
+        k4_combined_transactions: Dictionary containing combined K4 transactions
+        longnames: Boolean indicating whether to use long names
+        year: The tax year for which to generate the report
+    """
+    file_content = render_blanketter_sru(config, k4_combined_transactions, longnames, year)
 
     with open(OUTPUT_DIR + "BLANKETTER.SRU", "w") as file:
         file.write(file_content)
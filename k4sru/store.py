@@ -0,0 +1,182 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Optional local SQLite store for the trade history.
+#
+# Trades from any number of (overlapping) flex exports are stored once. A trade is identified by
+# trade_identity() plus its occurrence number within the export, so two identical fills in the
+# same export are both kept while the same fill seen in a second export is ignored. Currency
+# rates are stored as raw flex rows in a sibling table and processed by process_currency_rates.
+
+import logging
+import sqlite3
+from collections import Counter
+from .data import trade_identity, read_input_files, process_trades, no_stage, is_option
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trades (
+    datetime TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    side TEXT NOT NULL,
+    quantity TEXT NOT NULL,
+    trade_price TEXT NOT NULL,
+    commission TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    description TEXT NOT NULL,
+    isin TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    -- Engine order, see sort_trades: options are ordered by symbol and side, other trades by date
+    sort_key TEXT NOT NULL,
+    sort_rank INTEGER NOT NULL,
+    UNIQUE (datetime, symbol, side, quantity, trade_price, commission, exchange, occurrence)
+);
+CREATE INDEX IF NOT EXISTS trades_symbol ON trades (symbol, datetime);
+CREATE INDEX IF NOT EXISTS trades_isin ON trades (isin, datetime);
+CREATE INDEX IF NOT EXISTS trades_order ON trades (sort_key, sort_rank);
+CREATE TABLE IF NOT EXISTS currency_rates (
+    date TEXT NOT NULL,
+    from_currency TEXT NOT NULL,
+    to_currency TEXT NOT NULL,
+    rate TEXT NOT NULL,
+    PRIMARY KEY (date, from_currency, to_currency)
+);
+'''
+
+def open_store(filename):
+    """Open (and create if needed) the trade store.
+
+    Args:
+        filename: Path to the SQLite database file
+
+    Returns:
+        sqlite3.Connection: Connection to the store
+    """
+    conn = sqlite3.connect(filename)
+    conn.executescript(SCHEMA)
+    return conn
+
+def engine_order(trade):
+    """Get the (sort_key, sort_rank) columns matching the order of sort_trades.
+
+    Args:
+        trade: Trade dictionary in the IBKR flex format
+    """
+    symbol = trade['Symbol']
+    if is_option(symbol):
+        return symbol, 1 if trade['Buy/Sell'] == 'BUY' else 2
+    return trade['DateTime'], 1 if '.' in symbol else 2
+
+def store_trades(conn, trades):
+    """Store trades from one export, skipping trades that are already stored.
+
+    Args:
+        conn: Connection to the store
+        trades: List of trade dictionaries from a single export
+
+    Returns:
+        int: Number of new trades
+    """
+    occurrences = Counter()
+    rows = []
+    for trade in trades:
+        identity = trade_identity(trade)
+        occurrences[identity] += 1
+        rows.append(identity[:6] + (trade['CurrencyPrimary'], trade.get('Description', ''), trade.get('ISIN', ''), identity[6], occurrences[identity]) + engine_order(trade))
+    with conn:
+        before = conn.total_changes
+        conn.executemany('INSERT OR IGNORE INTO trades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        added = conn.total_changes - before
+    logging.info(f"{added} new trades stored, {len(rows) - added} already in the store.")
+    return added
+
+def store_rates(conn, rates):
+    """Store currency rates in the flex format, later rows replace earlier ones.
+
+    Args:
+        conn: Connection to the store
+        rates: List of currency rate dictionaries
+    """
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO currency_rates VALUES (?, ?, ?, ?)',
+                         ((rate['Date/Time'].split(';')[0], rate['FromCurrency'], rate['ToCurrency'], rate['Rate']) for rate in rates))
+
+def ingest_files(conn, filenames, workers=None):
+    """Read input files and store their trades and currency rates.
+
+    Args:
+        conn: Connection to the store
+        filenames: List of input file names and glob patterns
+        workers: Maximum number of worker processes used to parse the input files
+    """
+    for _, trades, rates in read_input_files(filenames, workers):
+        store_trades(conn, trades)
+        store_rates(conn, rates)
+
+def year_range(year):
+    """Get the [start, end) date strings of a tax year."""
+    return f'{year}', f'{year + 1}'
+
+def load_trades(conn, year, symbols=None):
+    """Stream the trades of a year in engine order.
+
+    Args:
+        conn: Connection to the store
+        year: The tax year
+        symbols: Optional list of symbols to include
+
+    Yields:
+        dict: Trade dictionaries in the IBKR flex format
+    """
+    query = ('SELECT datetime, symbol, side, quantity, trade_price, commission, currency, description, isin, exchange '
+             'FROM trades WHERE datetime >= ? AND datetime < ?')
+    params = list(year_range(year))
+    if symbols:
+        query += f" AND symbol IN ({', '.join('?' * len(symbols))})"
+        params.extend(symbols)
+    query += ' ORDER BY sort_key, sort_rank, rowid'
+    for row in conn.execute(query, params):
+        yield dict(zip(('DateTime', 'Symbol', 'Buy/Sell', 'Quantity', 'TradePrice', 'IBCommission', 'CurrencyPrimary', 'Description', 'ISIN', 'Exchange'), row))
+
+def load_rates(conn, year):
+    """Load the currency rates of a year.
+
+    Yields:
+        dict: Currency rate dictionaries in the IBKR flex format
+    """
+    for row in conn.execute('SELECT date, from_currency, to_currency, rate FROM currency_rates WHERE date >= ? AND date < ? ORDER BY date',
+                            year_range(year)):
+        yield dict(zip(('Date/Time', 'FromCurrency', 'ToCurrency', 'Rate'), row))
+
+def process_store_transactions(conn, year, stocks_data, k4_data, currency_rates, statistics_data, symbols=None, stage=no_stage,
+                               snapshot_index=None):
+    """Process the trades of a year from the store and generate the K4 rows.
+
+    Args:
+        conn: Connection to the store
+        year: The tax year for which to generate the report
+        symbols: Optional list of symbols to include
+        stage: Stage hook, see process_transactions
+        snapshot_index: Optional snapshot index receiving engine snapshots, see snapshots.py
+
+    Returns:
+        list: Post-processed K4 rows
+    """
+    # The trades are already in engine order, so the sort in process_trades is a linear pass
+    with stage('parse'):
+        trades = list(load_trades(conn, year, symbols))
+        rates = list(load_rates(conn, year))
+    logging.info(f"{len(trades)} stock trades and {len(rates)} currency rates have been read from the store.")
+    return process_trades(trades, rates, year, stocks_data, k4_data, currency_rates, statistics_data, stage=stage,
+                          snapshot_index=snapshot_index)
@@ -0,0 +1,148 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Input streams with transparent decompression. The compression is detected from the magic
+# bytes at the start of the file and the content is decompressed while it is being read.
+#
+# Inputs are read strictly sequentially and never seek, so standard input ('-') and named pipes
+# can be used wherever a file name is accepted.
+
+import io
+import logging
+import sys
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File name used for standard input
+STDIN = '-'
+
+# Magic bytes -> compression
+MAGIC_BYTES = {
+    b'\x1f\x8b': 'gzip',
+    b'\xfd7zXZ\x00': 'xz',
+    b'\x28\xb5\x2f\xfd': 'zstd',
+}
+
+def detect_compression(head):
+    """Detect the compression from the first bytes of a file.
+
+    Args:
+        head: The first bytes of the file
+
+    Returns:
+        str: 'gzip', 'xz', 'zstd' or None for uncompressed data
+    """
+    for magic, compression in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+def decompressing_reader(raw, compression):
+    """Wrap a binary stream in a streaming decompressor.
+
+    Args:
+        raw: Buffered binary stream positioned at the start of the compressed data
+        compression: 'gzip', 'xz', 'zstd' or None
+    """
+    # The decompressors are imported on first use to keep the startup of uncompressed runs short
+    if compression == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if compression == 'xz':
+        import lzma
+        return lzma.LZMAFile(raw, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            logging.error("Input is zstd compressed but the zstandard module is not installed.")
+            sys.exit(1)
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True))
+    return raw
+
+def input_name(source):
+    """Get a printable name of an input for log messages.
+
+    Args:
+        source: Path, '-' for standard input or binary file object
+    """
+    if source == STDIN:
+        return '<stdin>'
+    if isinstance(source, str):
+        return source
+    return str(getattr(source, 'name', '<stream>'))
+
+class PrefixedReader(io.RawIOBase):
+    """Raw binary stream that replays already consumed bytes before the rest of a stream."""
+
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+        self.name = input_name(stream)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.prefix:
+            data, self.prefix = self.prefix[:len(buffer)], self.prefix[len(buffer):]
+        else:
+            data = self.stream.read1(len(buffer)) if hasattr(self.stream, 'read1') else self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.stream.close()
+        super().close()
+
+def peek_line(stream):
+    """Read the first line of a binary stream without seeking.
+
+    Args:
+        stream: Binary file object
+
+    Returns:
+        tuple: (line, stream) where the returned stream starts with the line again
+    """
+    line = stream.readline()
+    return line, io.BufferedReader(PrefixedReader(line, stream))
+
+def open_input(source, binary=False, newline=None):
+    """Open an input for streaming reads, decompressing gzip, xz and zstd data on the fly.
+
+    Args:
+        source: Path, '-' for standard input or an already open binary file object
+        binary: Return a binary stream instead of a text stream
+        newline: Newline handling of the text stream, see open()
+
+    Returns:
+        file object: Stream with the decompressed content
+    """
+    if source == STDIN:
+        raw = sys.stdin.buffer
+    elif isinstance(source, str):
+        raw = open(source, 'rb')
+    else:
+        raw = source
+    if not hasattr(raw, 'peek'):
+        raw = io.BufferedReader(raw)
+    compression = detect_compression(raw.peek(8)[:8])
+    if compression:
+        logging.debug("Reading %s compressed input from %s", compression, input_name(source))
+    stream = decompressing_reader(raw, compression)
+    if binary:
+        return stream
+    return io.TextIOWrapper(stream, newline=newline)
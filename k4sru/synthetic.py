@@ -0,0 +1,248 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Deterministic generator of synthetic IBKR flex CSV files for benchmarks and tests.
+#
+# The trades are spread over the weekdays of the year in chronological order. Stocks are traded
+# in SEK, USD, EUR and DKK; foreign stock buys are normally funded by a currency pair trade
+# (e.g. USD.SEK) at the same time, a configurable share of them is left unfunded to exercise the
+# margin loan branches of the engine. IBIT-style option contracts and Bitstamp BTC fills are
+# mixed in, and a currency rates section covering every weekday is written after the trades.
+# The same arguments always produce the same file.
+
+import csv
+import gzip
+import math
+import random
+from datetime import date, timedelta
+from .ibkr import TRADE_FIELDS, RATE_FIELDS
+
+# Share of the stock symbols traded in each currency
+DEFAULT_CURRENCY_MIX = {'USD': 0.6, 'EUR': 0.2, 'SEK': 0.15, 'DKK': 0.05}
+
+# Exchange used for the stocks in each currency
+EXCHANGES = {'USD': 'NASDAQ', 'EUR': 'IBIS', 'SEK': 'SFB', 'DKK': 'CPH'}
+
+# Option contracts, priced per share and traded in lots of 100
+OPTION_SYMBOLS = ['IBIT  250321C00050000', 'IBIT  250620C00060000', 'IBIT  250919P00045000', 'IBIT  251219C00070000']
+
+def weekdays(year):
+    """Get the weekdays of a year as 'YYYYMMDD' strings."""
+    day = date(year, 1, 1)
+    days = []
+    while day.year == year:
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y%m%d'))
+        day += timedelta(days=1)
+    return days
+
+def synthetic_fx(year, seed=0):
+    """Generate daily exchange rates as random walks.
+
+    Returns:
+        dict: 'YYYYMMDD' -> {'USD': SEK per USD, 'EUR': USD per EUR, 'DKK': USD per DKK}
+    """
+    rng = random.Random(f'fx-{seed}')
+    usdsek, eurusd, dkkusd = 10.5, 1.08, 0.145
+    fx = {}
+    for day in weekdays(year):
+        usdsek *= math.exp(rng.gauss(0, 0.005))
+        eurusd *= math.exp(rng.gauss(0, 0.004))
+        dkkusd *= math.exp(rng.gauss(0, 0.004))
+        fx[day] = {'USD': round(usdsek, 4), 'EUR': round(eurusd, 4), 'DKK': round(dkkusd, 5)}
+    return fx
+
+def sek_price(fx, currency):
+    """Get the price in SEK of one unit of a currency from the daily rates."""
+    if currency == 'USD':
+        return fx['USD']
+    return fx[currency] * fx['USD']
+
+def iter_synthetic_rates(year, seed=0):
+    """Stream the currency rates section matching iter_synthetic_trades.
+
+    Yields:
+        dict: Currency rate dictionaries in the IBKR flex format
+    """
+    for day, fx in synthetic_fx(year, seed).items():
+        yield {'Date/Time': day, 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': f"{1 / fx['USD']:.6f}"}
+        yield {'Date/Time': day, 'FromCurrency': 'EUR', 'ToCurrency': 'USD', 'Rate': f"{fx['EUR']:.4f}"}
+        yield {'Date/Time': day, 'FromCurrency': 'DKK', 'ToCurrency': 'USD', 'Rate': f"{fx['DKK']:.5f}"}
+
+def trade_row(datetime, symbol, side, quantity, price, commission, currency, description, isin, exchange):
+    return {
+        'DateTime': datetime,
+        'Symbol': symbol,
+        'Buy/Sell': side,
+        'Quantity': quantity,
+        'TradePrice': price,
+        'IBCommission': commission,
+        'CurrencyPrimary': currency,
+        'Description': description,
+        'ISIN': isin,
+        'Exchange': exchange,
+    }
+
+def funding_trade(datetime, currency, amount, fx):
+    """Create a currency pair trade buying a currency for SEK, rounded up to whole currency units."""
+    pair = f'{currency}.SEK'
+    return trade_row(datetime, pair, 'BUY', str(math.ceil(amount)), f'{sek_price(fx, currency):.5f}', '0', 'SEK', pair, '', 'IDEALFX')
+
+def iter_synthetic_trades(count, year, symbols=50, currencies=None, margin_loans=0.05, options=0.05, btc=0.02, seed=0):
+    """Stream a deterministic synthetic trade history in chronological order.
+
+    Args:
+        count: Number of trades, including the currency pair trades funding foreign stock buys
+        year: The year of the trades
+        symbols: Number of stock symbols
+        currencies: Currency -> weight of the stock symbols, DEFAULT_CURRENCY_MIX if None
+        margin_loans: Share of foreign stock buys that are not funded by a currency trade
+        options: Share of the trades that are option trades
+        btc: Share of the trades that are BTC trades
+
+    Yields:
+        dict: Trade dictionaries in the IBKR flex format
+    """
+    rng = random.Random(f'trades-{seed}')
+    mix = currencies or DEFAULT_CURRENCY_MIX
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stocks = []
+    for i in range(symbols):
+        currency = rng.choices(names, weights)[0]
+        stocks.append({
+            'symbol': f'SYN{i:04d}',
+            'description': f'SYNTHETIC COMPANY {i:04d}',
+            'isin': f'XS{i:010d}',
+            'currency': currency,
+            'price': rng.uniform(5, 500),
+            'quantity': 0,
+        })
+    positions = {symbol: 0 for symbol in OPTION_SYMBOLS}
+    btc_quantity = 0
+    # Currency balances, options and BTC are paid with USD. Options are processed by the engine
+    # after all other trades (see sort_trades), so option buys are not funded.
+    balances = {name: 0.0 for name in names + ['USD']}
+
+    fx_by_day = synthetic_fx(year, seed)
+    days = list(fx_by_day)
+    per_day = max(1, math.ceil(count / len(days)))
+    # Seconds between two trades on the same day, trades run from 00:00:00 and onwards
+    step = max(1, 86400 // (per_day + 1))
+
+    emitted = 0
+    while emitted < count:
+        day = days[min(emitted // per_day, len(days) - 1)]
+        second = min((emitted % per_day) * step, 86399)
+        datetime = f'{day};{second // 3600:02d}{second // 60 % 60:02d}{second % 60:02d}'
+        fx = fx_by_day[day]
+        kind = rng.random()
+
+        if kind < options:
+            symbol = rng.choice(OPTION_SYMBOLS)
+            price = f'{rng.uniform(0.5, 10):.2f}'
+            if positions[symbol] > 0 and rng.random() < 0.5:
+                quantity = positions[symbol]
+                positions[symbol] = 0
+                balances['USD'] += quantity * float(price) * 100
+                yield trade_row(datetime, symbol, 'SELL', str(-quantity), price, '-1.05', 'USD', symbol.replace('  ', ' '), '', 'CBOE')
+            else:
+                quantity = rng.randint(1, 10)
+                positions[symbol] += quantity
+                balances['USD'] -= quantity * float(price) * 100
+                yield trade_row(datetime, symbol, 'BUY', str(quantity), price, '-1.05', 'USD', symbol.replace('  ', ' '), '', 'CBOE')
+            emitted += 1
+            continue
+
+        if kind < options + btc:
+            price = f'{rng.uniform(40000, 100000):.2f}'
+            if btc_quantity > 0 and rng.random() < 0.4:
+                quantity = min(btc_quantity, round(rng.uniform(0.001, 0.5), 8))
+                btc_quantity = round(btc_quantity - quantity, 8)
+                balances['USD'] += quantity * float(price)
+                yield trade_row(datetime, 'BTC', 'SELL', f'{-quantity:.8f}', price, '-5', 'USD', 'BTC', '', 'BITSTAMP')
+            else:
+                quantity = round(rng.uniform(0.001, 0.5), 8)
+                btc_quantity = round(btc_quantity + quantity, 8)
+                if balances['USD'] < quantity * float(price) + 5 and emitted + 1 < count:
+                    yield funding_trade(datetime, 'USD', quantity * float(price) + 5 - balances['USD'], fx)
+                    balances['USD'] = quantity * float(price) + 5
+                    emitted += 1
+                balances['USD'] -= quantity * float(price) + 5
+                yield trade_row(datetime, 'BTC', 'BUY', f'{quantity:.8f}', price, '-5', 'USD', 'BTC', '', 'BITSTAMP')
+            emitted += 1
+            continue
+
+        stock = rng.choice(stocks)
+        stock['price'] *= math.exp(rng.gauss(0, 0.02))
+        price = round(stock['price'], 2)
+        currency = stock['currency']
+        commission = round(-rng.uniform(1, 5), 2)
+        if stock['quantity'] > 0 and rng.random() < 0.45:
+            # Close the position or sell part of it
+            quantity = stock['quantity'] if rng.random() < 0.6 else rng.randint(1, stock['quantity'])
+            stock['quantity'] -= quantity
+            if currency != 'SEK':
+                balances[currency] += quantity * price + commission
+            yield trade_row(datetime, stock['symbol'], 'SELL', str(-quantity), f'{price:.2f}', f'{commission:.2f}', currency,
+                            stock['description'], stock['isin'], EXCHANGES.get(currency, 'SMART'))
+            emitted += 1
+            continue
+
+        quantity = rng.randint(1, 200)
+        cost = quantity * price - commission
+        if currency != 'SEK' and balances[currency] < cost and rng.random() >= margin_loans and emitted + 1 < count:
+            # Fund the buy with a currency pair trade, processed before the stock on the same time
+            yield funding_trade(datetime, currency, cost - balances[currency], fx)
+            balances[currency] = cost
+            emitted += 1
+        if currency != 'SEK':
+            balances[currency] -= cost
+        stock['quantity'] += quantity
+        yield trade_row(datetime, stock['symbol'], 'BUY', str(quantity), f'{price:.2f}', f'{commission:.2f}', currency,
+                        stock['description'], stock['isin'], EXCHANGES.get(currency, 'SMART'))
+        emitted += 1
+
+def write_flex_csv(filename, trades, rates):
+    """Write trades and currency rates as an IBKR flex CSV file, gzip compressed if the name ends with .gz.
+
+    Args:
+        filename: Path to the CSV file
+        trades: Iterable of trade dictionaries
+        rates: Iterable of currency rate dictionaries
+
+    Returns:
+        int: Number of trades written
+    """
+    opener = gzip.open if filename.endswith('.gz') else open
+    written = 0
+    with opener(filename, 'wt', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=TRADE_FIELDS, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        for trade in trades:
+            writer.writerow(trade)
+            written += 1
+        writer = csv.DictWriter(file, fieldnames=RATE_FIELDS, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(rates)
+    return written
+
+def generate_flex_csv(filename, count, year, symbols=50, currencies=None, margin_loans=0.05, options=0.05, btc=0.02, seed=0):
+    """Generate a synthetic IBKR flex CSV file, see iter_synthetic_trades.
+
+    Returns:
+        int: Number of trades written
+    """
+    trades = iter_synthetic_trades(count, year, symbols, currencies, margin_loans, options, btc, seed)
+    return write_flex_csv(filename, trades, iter_synthetic_rates(year, seed))
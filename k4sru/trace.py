@@ -0,0 +1,123 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Chrome trace event export of a k4sru run (--trace), viewable in https://ui.perfetto.dev or
+# chrome://tracing.
+#
+# Every pipeline stage is a complete ("X") event on the track of the main process, the parsing of
+# each input file is an event on the track of the process that parsed it, so the worker processes
+# of a parallel parse show up as separate tracks. All events carry the account (organisation
+# number of the configuration) and the tax year in their args, and the process tracks are named
+# after them so that traces of several accounts and years can be told apart.
+#
+# The trace file has the JSON object format:
+#
+#   {"traceEvents": [{"name": "engine", "cat": "stage", "ph": "X", "ts": 1735689600000000.0,
+#                     "dur": 1520.3, "pid": 4711, "tid": 4711, "args": {"account": "...", "year": 2025}}, ...],
+#    "displayTimeUnit": "ms", "otherData": {"account": "...", "year": 2025}}
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+def trace_tags(config, year):
+    """Get the tags of the trace events of a run.
+
+    Args:
+        config: Tax payer information, the organisation number is used as the account
+        year: The tax year
+
+    Returns:
+        dict: 'account' and 'year'
+    """
+    return {'account': str(config.get('orgnr', '')), 'year': year}
+
+def complete_event(name, category, start, end, pid, tid, tags):
+    """Create a complete event from wall clock start and end times in seconds."""
+    return {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': start * 1e6,
+        'dur': (end - start) * 1e6,
+        'pid': pid,
+        'tid': tid,
+        'args': dict(tags),
+    }
+
+def stage_tracer(events, tags):
+    """Create a stage hook that records a trace event for each stage.
+
+    Args:
+        events: List of trace events, updated in place
+        tags: Args added to every event, see trace_tags
+    """
+    @contextlib.contextmanager
+    def stage(name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            events.append(complete_event(name, 'stage', start, time.time(), os.getpid(), threading.get_native_id(), tags))
+    return stage
+
+def file_span_events(file_spans, tags):
+    """Create trace events for the input file parse spans, see read_input_files.
+
+    Returns:
+        list: Trace events, one per input file on the track of the process that parsed it
+    """
+    events = []
+    for span in file_spans:
+        event = complete_event(f"parse {span['file']}", 'parse', span['start'], span['end'], span['pid'], span['pid'], tags)
+        event['args']['file'] = span['file']
+        events.append(event)
+    return events
+
+def metadata_events(events, tags):
+    """Create process name metadata events for the processes of the trace events.
+
+    The main process (this process) is named 'irs <account> <year>', the others 'parse worker <pid>'.
+    """
+    label = f"irs {tags['account']} {tags['year']}".replace('  ', ' ')
+    main_pid = os.getpid()
+    metadata = []
+    for pid in sorted({event['pid'] for event in events}):
+        name = label if pid == main_pid else f'parse worker {pid}'
+        metadata.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': pid, 'args': {'name': name}})
+        metadata.append({'name': 'process_sort_index', 'ph': 'M', 'pid': pid, 'tid': pid, 'args': {'sort_index': 0 if pid == main_pid else 1}})
+    return metadata
+
+def save_trace(filename, events, tags, file_spans=None):
+    """Write the trace events as a Chrome trace event JSON file.
+
+    Args:
+        filename: Path to the trace file
+        events: Stage trace events from stage_tracer
+        tags: Tags of the run, see trace_tags
+        file_spans: Optional input file parse spans, see read_input_files
+    """
+    all_events = list(events) + file_span_events(file_spans or [], tags)
+    all_events.sort(key=lambda event: event['ts'])
+    trace = {
+        'traceEvents': metadata_events(all_events, tags) + all_events,
+        'displayTimeUnit': 'ms',
+        'otherData': dict(tags),
+    }
+    with open(filename, 'w') as file:
+        json.dump(trace, file)
+    logging.info(f"Trace with {len(all_events)} events saved to {filename}")
@@ -0,0 +1,229 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Mark-to-market valuation of the year-end portfolio (k4sru --prices).
+#
+# The open positions of stocks_data are joined with a price snapshot file (see prices.py). The
+# SEK rate of a currency is its row in the price file, otherwise the latest rate on or before the
+# valuation date in the currency rate index of the engine. For each position:
+#
+#   market value (SEK)   quantity * price * SEK rate of the price currency
+#   unrealized (SEK)     market value - totalprice, the cost basis of the engine in SEK
+#   market value (USD)   market value (SEK) / SEK rate of USD
+#   unrealized (USD)     market value in USD - totalpriceusd, for positions priced in USD whose
+#                        cost basis in the trade currency is kept by the usd_statistics_* functions
+#
+# A currency balance (e.g. EUR) is valued at its SEK rate, an option price is per share and the
+# position is in lots of 100. A short position or margin loan has a negative market value. The
+# exposure of a currency is the sum of the market values of the positions in that currency.
+#
+# The join and the rate lookup are done once per position and once per currency, the values are
+# then computed column by column, with NumPy when it is installed.
+
+import csv
+import logging
+from .data import BASE_CURRENCY, is_option
+from .prices import read_prices, sek_rate, index_rate_dates, latest_rate
+from .sru import OUTPUT_DIR, k4_section
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Header of the valuation CSV file and the row key of each column
+VALUATION_COLUMNS = [
+    ('Symbol', 'symbol'),
+    ('Quantity', 'quantity'),
+    ('Currency', 'currency'),
+    ('Price', 'price'),
+    ('Rate', 'rate'),
+    ('Avg Price (SEK)', 'avgprice'),
+    ('Cost (SEK)', 'cost_sek'),
+    ('Market Value (SEK)', 'market_value_sek'),
+    ('Unrealized (SEK)', 'unrealized_sek'),
+    ('Avg Price (USD)', 'avgprice_usd'),
+    ('Cost (USD)', 'cost_usd'),
+    ('Market Value (USD)', 'market_value_usd'),
+    ('Unrealized (USD)', 'unrealized_usd'),
+]
+
+def join_prices(stocks_data, prices):
+    """Join the open positions with the price file.
+
+    Args:
+        stocks_data: Stocks data after processing the trades
+        prices: Prices, see prices.read_prices
+
+    Returns:
+        dict: Columns 'symbol', 'quantity', 'avgprice', 'cost_sek', 'cost_usd', 'avgprice_usd',
+              'currency' and 'price' (price per position unit, None if the symbol has no price)
+    """
+    columns = {name: [] for name in ('symbol', 'quantity', 'avgprice', 'cost_sek', 'cost_usd', 'avgprice_usd', 'currency', 'price')}
+    for symbol in sorted(stocks_data):
+        data = stocks_data[symbol]
+        if data['quantity'] == 0:
+            continue
+        if k4_section(symbol) == 'C':
+            # A currency balance is worth one unit of itself
+            currency, price = symbol, 1.0
+        else:
+            entry = prices.get(symbol)
+            currency = entry['currency'] if entry else None
+            price = None
+            if entry is not None:
+                price = entry['price'] * 100 if is_option(symbol) else entry['price']
+        columns['symbol'].append(symbol)
+        columns['quantity'].append(data['quantity'])
+        columns['avgprice'].append(data['avgprice'])
+        columns['cost_sek'].append(data['totalprice'])
+        columns['cost_usd'].append(data.get('totalpriceusd'))
+        columns['avgprice_usd'].append(data.get('avgpriceusd'))
+        columns['currency'].append(currency)
+        columns['price'].append(price)
+    return columns
+
+def currency_rates_for(currencies, prices, currency_rates, date):
+    """Get the SEK rate of each currency, None for a currency without a rate.
+
+    Args:
+        currencies: Currency codes
+        prices: Prices, see prices.read_prices
+        currency_rates: Currency rate index of the engine, keyed by (date, currency)
+        date: Valuation date in 'YYYYMMDD' format
+
+    Returns:
+        dict: Currency -> SEK per unit
+    """
+    rate_dates = index_rate_dates(currency_rates)
+    fallback = lambda currency: latest_rate(currency_rates, rate_dates, currency, date)
+    rates = {}
+    for currency in set(currencies) | {'USD'}:
+        if currency is None:
+            continue
+        try:
+            rates[currency] = sek_rate(prices, currency, fallback)
+        except ValueError:
+            rates[currency] = None
+    return rates
+
+def compute_values(quantity, price, rate, cost_sek, usd_rate):
+    """Compute the market values and unrealized profit/loss of valued positions.
+
+    Args:
+        quantity, price, rate, cost_sek: Columns of equal length without missing values
+        usd_rate: SEK per USD
+
+    Returns:
+        tuple: (market value in SEK, unrealized in SEK, market value in USD) columns
+    """
+    if numpy is not None:
+        market_value = numpy.asarray(quantity, dtype=float) * numpy.asarray(price, dtype=float) * numpy.asarray(rate, dtype=float)
+        unrealized = market_value - numpy.asarray(cost_sek, dtype=float)
+        return market_value.tolist(), unrealized.tolist(), (market_value / usd_rate).tolist()
+    market_value = [q * p * r for q, p, r in zip(quantity, price, rate)]
+    unrealized = [value - cost for value, cost in zip(market_value, cost_sek)]
+    return market_value, unrealized, [value / usd_rate for value in market_value]
+
+def value_portfolio(stocks_data, prices, currency_rates, date):
+    """Value the open positions at the prices of a price file.
+
+    Args:
+        stocks_data: Stocks data after processing the trades
+        prices: Prices, see prices.read_prices
+        currency_rates: Currency rate index of the engine, keyed by (date, currency)
+        date: Valuation date in 'YYYYMMDD' format
+
+    Returns:
+        tuple: (list of row dictionaries with the keys of VALUATION_COLUMNS, list of symbols
+               without a price or currency rate); the values of such a symbol are None
+    """
+    columns = join_prices(stocks_data, prices)
+    rates = currency_rates_for(columns['currency'], prices, currency_rates, date)
+    columns['rate'] = [rates.get(currency) for currency in columns['currency']]
+    valued = [i for i, (price, rate) in enumerate(zip(columns['price'], columns['rate'])) if price is not None and rate is not None]
+    usd_rate = rates['USD'] or float('nan')
+    market_value, unrealized, market_value_usd = compute_values(
+        *([columns[name][i] for i in valued] for name in ('quantity', 'price', 'rate', 'cost_sek')), usd_rate)
+
+    keys = [key for _, key in VALUATION_COLUMNS]
+    empty = [None] * len(columns['symbol'])
+    rows = [dict(zip(keys, values)) for values in zip(*(columns.get(key, empty) for key in keys))]
+    for i, sek, profit, usd in zip(valued, market_value, unrealized, market_value_usd):
+        row = rows[i]
+        row['market_value_sek'] = sek
+        row['unrealized_sek'] = profit
+        if rates['USD'] is not None:
+            row['market_value_usd'] = usd
+            # The USD statistics are kept in the trade currency, which is USD when the price is
+            if row['currency'] == 'USD' and row['cost_usd'] is not None:
+                row['unrealized_usd'] = usd - row['cost_usd']
+    missing = [row['symbol'] for row in rows if row['market_value_sek'] is None]
+    return rows, missing
+
+def currency_exposure(rows):
+    """Get the market value and the share of the portfolio of each currency.
+
+    Args:
+        rows: Valuation rows, see value_portfolio
+
+    Returns:
+        dict: Currency -> {'market_value_sek', 'share'}, sorted by decreasing market value
+    """
+    totals = {}
+    for row in rows:
+        if row['market_value_sek'] is not None:
+            totals[row['currency']] = totals.get(row['currency'], 0.0) + row['market_value_sek']
+    gross = sum(abs(value) for value in totals.values())
+    return {currency: {'market_value_sek': value, 'share': abs(value) / gross if gross else 0.0}
+            for currency, value in sorted(totals.items(), key=lambda item: -item[1])}
+
+def save_valuation(year, rows, exposure):
+    """Write the valuation and currency exposure to valuation_<year>.csv and valuation_exposure_<year>.csv."""
+    with open(f'{OUTPUT_DIR}valuation_{year}.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow([header for header, _ in VALUATION_COLUMNS])
+        for row in rows:
+            writer.writerow(['' if row[key] is None else row[key] for _, key in VALUATION_COLUMNS])
+    with open(f'{OUTPUT_DIR}valuation_exposure_{year}.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Currency', 'Market Value (SEK)', 'Share'])
+        for currency, entry in exposure.items():
+            writer.writerow([currency, entry['market_value_sek'], entry['share']])
+
+def value_year_end(year, stocks_data, currency_rates, prices_file):
+    """Value the portfolio at the end of the tax year and save the valuation.
+
+    Args:
+        year: The tax year
+        stocks_data: Stocks data after processing the trades
+        currency_rates: Currency rate index of the engine, keyed by (date, currency)
+        prices_file: Path to the price snapshot file
+
+    Returns:
+        tuple: (rows, exposure), see value_portfolio and currency_exposure
+    """
+    prices = read_prices(prices_file)
+    rows, missing = value_portfolio(stocks_data, prices, currency_rates, f'{year}1231')
+    if missing:
+        logging.warning(f"No price or currency rate for {len(missing)} positions, not valued: {', '.join(missing)}")
+    exposure = currency_exposure(rows)
+    save_valuation(year, rows, exposure)
+    market_value = sum(row['market_value_sek'] for row in rows if row['market_value_sek'] is not None)
+    unrealized = sum(row['unrealized_sek'] for row in rows if row['unrealized_sek'] is not None)
+    logging.info(f"Market value of the portfolio {market_value:.0f} {BASE_CURRENCY}, unrealized profit/loss {unrealized:.0f} {BASE_CURRENCY}")
+    for currency, entry in exposure.items():
+        logging.info(f"  {currency}: {entry['market_value_sek']:.0f} {BASE_CURRENCY} ({entry['share']:.1%})")
+    logging.info(f"Saved the valuation for {year} to {OUTPUT_DIR}valuation_{year}.csv")
+    return rows, exposure
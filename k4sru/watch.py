@@ -0,0 +1,231 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Watch mode (irs watch): poll the inputs of a k4sru run and refresh the outputs when they change.
+#
+# The inputs are polled by modification time and size. Depending on what changed only the
+# affected stages are run again:
+#
+#   config.json                       INFO.SRU and BLANKETTER.SRU are rendered again, no engine run
+#   an input file                     only that file is parsed again, the others come from the parse
+#                                     cache, then the engine runs and all outputs are written
+#   input_currency_rates_<year>.json  the engine runs with the new rates
+#   input_portfolio_<year>.json       the engine runs from the new portfolio
+#
+# The engine state after each run is kept as a checkpoint. When the sorted trades of the next run
+# start with the trades of the checkpoint and the currency rates those trades used are unchanged
+# (typically trades appended to an export), only the new trades are processed from the checkpoint.
+
+import copy
+import json
+import logging
+import os
+import sys
+import time
+from .data import (expand_input_files, read_input_file, deduplicate_trades, process_currency_rates, sort_trades,
+                   trade_identity, process_input_data, post_process_trading_data, init_stocks_data,
+                   init_currency_rates, save_stocks_data, print_statistics, STDIN)
+from .sru import generate_info_sru, generate_blanketter_sru
+
+def input_stat(path):
+    """Get the (modification time, size) of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def new_watch_state(config_path, patterns, year, longnames=False):
+    """Create the state of a watch session.
+
+    Args:
+        config_path: Path to the configuration file
+        patterns: List of input file names and glob patterns
+        year: The tax year
+        longnames: Use long names in the SRU file
+
+    Returns:
+        dict: Watch state
+    """
+    if STDIN in patterns:
+        logging.error("Standard input cannot be watched")
+        sys.exit(1)
+    return {
+        'config_path': config_path,
+        'patterns': patterns,
+        'year': year,
+        'longnames': longnames,
+        'rates_path': f'input/input_currency_rates_{year}.json',
+        'portfolio_path': f'input/input_portfolio_{year}.json',
+        # Path -> (modification time, size) of the last refresh
+        'stats': {},
+        # Path -> {'stat', 'trades', 'rates'}
+        'parse_cache': {},
+        'config': None,
+        'portfolio': None,
+        'predefined_rates': None,
+        'engine': None,
+        'k4_rows': None,
+    }
+
+def changed_inputs(state):
+    """Find the inputs that changed since the last refresh.
+
+    Returns:
+        tuple: (set of changed input kinds 'config', 'rates', 'portfolio' and 'sources',
+                current stats keyed by path)
+    """
+    sources = expand_input_files(state['patterns'])
+    kinds = {state['config_path']: 'config', state['rates_path']: 'rates', state['portfolio_path']: 'portfolio'}
+    stats = {path: input_stat(path) for path in list(kinds) + sources}
+    changed = set()
+    for path in set(stats) | set(state['stats']):
+        if stats.get(path) != state['stats'].get(path):
+            changed.add(kinds.get(path, 'sources'))
+    return changed, stats
+
+def parse_sources(state, stats):
+    """Parse the input files that changed, the others are taken from the parse cache.
+
+    Returns:
+        list: (filename, trades, rates) tuples in command line order
+    """
+    cache = state['parse_cache']
+    sources = expand_input_files(state['patterns'])
+    for path in list(cache):
+        if path not in sources:
+            del cache[path]
+    parsed = []
+    for path in sources:
+        entry = cache.get(path)
+        if entry is None or entry['stat'] != stats.get(path):
+            _, trades, rates = read_input_file(path)
+            entry = cache[path] = {'stat': stats.get(path), 'trades': trades, 'rates': rates}
+            parsed.append(path)
+    if parsed:
+        logging.info(f"Parsed {', '.join(parsed)}, {len(sources) - len(parsed)} input files from the parse cache")
+    return [(path, cache[path]['trades'], cache[path]['rates']) for path in sources]
+
+def run_engine(state, sources):
+    """Run the engine, from the checkpoint of the previous run when the new trades are appended to it.
+
+    Returns:
+        str: 'append' if the engine continued from the checkpoint, otherwise 'full'
+    """
+    year = state['year']
+    trades, _ = deduplicate_trades([(filename, trades) for filename, trades, _ in sources])
+    currency_rates = {}
+    process_currency_rates([rate for _, _, rates in sources for rate in rates], currency_rates, year, state['predefined_rates'])
+    # The parse cache must keep the original trades, sort_trades scales option prices in place
+    sorted_trades = sort_trades([dict(trade) for trade in trades])
+    identities = [trade_identity(trade) for trade in sorted_trades]
+
+    checkpoint = state['engine']
+    if (checkpoint is not None and identities[:len(checkpoint['identities'])] == checkpoint['identities'] and
+            all(currency_rates.get(key) == value for key, value in checkpoint['currency_rates'].items())):
+        mode = 'append'
+        tail = sorted_trades[len(checkpoint['identities']):]
+        stocks_data = copy.deepcopy(checkpoint['stocks_data'])
+        k4_data = copy.deepcopy(checkpoint['k4_data'])
+        statistics_data = list(checkpoint['statistics_data'])
+    else:
+        mode = 'full'
+        tail = sorted_trades
+        stocks_data = copy.deepcopy(state['portfolio'])
+        k4_data = {}
+        statistics_data = []
+    process_input_data(tail, stocks_data, k4_data, currency_rates, statistics_data)
+    logging.info(f"Engine ({mode}) processed {len(tail)} of {len(sorted_trades)} trades")
+
+    state['engine'] = {
+        'identities': identities,
+        'currency_rates': currency_rates,
+        'stocks_data': copy.deepcopy(stocks_data),
+        'k4_data': copy.deepcopy(k4_data),
+        'statistics_data': list(statistics_data),
+    }
+    state['k4_rows'] = post_process_trading_data(sorted(k4_data.values(), key=lambda x: x['beteckning']), year)
+    save_stocks_data(year, stocks_data)
+    print_statistics(statistics_data, k4_data, year)
+    return mode
+
+def refresh(state, changed, stats):
+    """Run the stages affected by the changed inputs and write the outputs.
+
+    Args:
+        state: Watch state
+        changed: Changed input kinds, see changed_inputs
+        stats: Current stats of the inputs
+
+    Returns:
+        list: Names of the stages that ran
+    """
+    year = state['year']
+    stages = []
+    if 'config' in changed or state['config'] is None:
+        with open(state['config_path']) as file:
+            state['config'] = json.load(file)
+        generate_info_sru(state['config'])
+        stages.append('info_sru')
+    if 'portfolio' in changed or state['portfolio'] is None:
+        state['portfolio'] = init_stocks_data(year)
+        # The checkpoint started from the previous portfolio
+        state['engine'] = None
+        stages.append('portfolio')
+    if 'rates' in changed or state['predefined_rates'] is None:
+        state['predefined_rates'] = init_currency_rates(year)
+        stages.append('rates')
+    if changed - {'config'} or state['k4_rows'] is None:
+        sources = parse_sources(state, stats)
+        stages.append('parse')
+        stages.append('engine_' + run_engine(state, sources))
+    generate_blanketter_sru(state['config'], state['k4_rows'], state['longnames'], year)
+    stages.append('blanketter_sru')
+    state['stats'] = stats
+    return stages
+
+def watch(config_path, patterns, year, longnames=False, interval=0.5, cycles=None):
+    """Poll the inputs and refresh the outputs when they change, until interrupted.
+
+    Args:
+        config_path: Path to the configuration file
+        patterns: List of input file names and glob patterns
+        year: The tax year
+        longnames: Use long names in the SRU file
+        interval: Seconds between two polls
+        cycles: Stop after this many polls, run until interrupted if None
+    """
+    state = new_watch_state(config_path, patterns, year, longnames)
+    poll = 0
+    try:
+        while cycles is None or poll < cycles:
+            changed, stats = changed_inputs(state)
+            if changed:
+                start = time.perf_counter()
+                try:
+                    stages = refresh(state, changed, stats)
+                    logging.info(f"Outputs refreshed in {time.perf_counter() - start:.3f} s ({', '.join(sorted(changed))} changed: {', '.join(stages)})")
+                except SystemExit:
+                    # E.g. a file that is still being written, the inputs stay changed and the
+                    # refresh is retried on the next poll
+                    logging.error("Refresh failed, retrying on the next poll")
+                except (ValueError, OSError) as e:
+                    # E.g. a configuration that is half saved by an editor
+                    logging.error(f"Refresh failed, retrying on the next poll: {e}")
+            poll += 1
+            if cycles is None or poll < cycles:
+                time.sleep(interval)
+    except KeyboardInterrupt:
+        logging.info("Stopped watching")
+    return state
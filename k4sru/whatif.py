@@ -0,0 +1,255 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# What-if simulator (irs whatif): the K4 effect of hypothetical trades on the current engine state.
+#
+# The engine runs once over the input files. Each scenario is then applied to a fork of that
+# state: the stocks_data and k4_data dicts are copied shallowly and only the entries the trade
+# can change (the traded symbol and its currency) are copied, the other entries are shared with
+# the base state. The result of a scenario is the change of the K4 rows it touched and of the
+# total profit/loss and tax (30 %). Scenarios are evaluated in chunks in a process pool, each
+# worker receives the base state once.
+#
+# A scenario is a dictionary:
+#
+#   symbol      the traded symbol, e.g. 'AAOI' or 'IBIT 250117C00050000'
+#   quantity    number of shares, a number, 'all' or a percentage of the position such as '50%'
+#   side        'SELL' (default) or 'BUY'
+#   price       price per share in the trade currency, the last traded price if omitted
+#   currency    trade currency, the currency of the last trade of the symbol if omitted
+#   commission  commission in the trade currency (default 0)
+#   date        'YYYYMMDD;HHMMSS', the time of the last trade if omitted
+#
+# A missing currency rate for the date is taken from the latest earlier rate of the currency.
+
+import contextlib
+import json
+import logging
+import os
+import sys
+import time
+from collections import ChainMap
+from .data import (read_input_files, deduplicate_trades, process_currency_rates, sort_trades, process_trading_data,
+                   process_buy_entry, process_sell_entry, init_stocks_data, is_option, trade_keys, BASE_CURRENCY)
+from . import prices
+
+# Scenarios per task of the process pool
+CHUNK_SIZE = 500
+
+# Fewer scenarios are evaluated in this process
+MIN_POOL_SCENARIOS = 2000
+
+def new_base_state(year, sorted_trades, stocks_data, k4_data, currency_rates):
+    """Create the base state of the scenarios from the state of an engine run.
+
+    Args:
+        year: The tax year
+        sorted_trades: The processed trades in engine order, see sort_trades
+        stocks_data: Stocks data after processing the trades
+        k4_data: K4 data after processing the trades
+        currency_rates: Currency rate index used by the engine
+
+    Returns:
+        dict: Base state
+    """
+    last_trades = {}
+    for trade in sorted_trades:
+        last_trades[trade['Symbol']] = trade
+    return {
+        'year': year,
+        'stocks_data': stocks_data,
+        'k4_data': k4_data,
+        'currency_rates': currency_rates,
+        'rate_dates': prices.index_rate_dates(currency_rates),
+        # Symbol -> (price, currency, description) of its last trade, option prices are per lot
+        'last_trades': {symbol: (float(trade['TradePrice']), trade['CurrencyPrimary'], trade['Description'])
+                        for symbol, trade in last_trades.items()},
+        'last_datetime': max((trade['DateTime'] for trade in sorted_trades), default=f'{year}1231;235959'),
+        'profit_loss': sum(row['forsaljningspris'] - row['omkostnadsbelopp'] for row in k4_data.values()),
+    }
+
+def load_base_state(filenames, year, workers=None, predefined_rates=None):
+    """Run the engine over the input files and create the base state of the scenarios.
+
+    Args:
+        filenames: List of input file names and glob patterns
+        year: The tax year
+        workers: Maximum number of worker processes used to parse the input files
+        predefined_rates: Predefined rates keyed by (date, currency), read from input_currency_rates_<year>.json if None
+
+    Returns:
+        dict: Base state, see new_base_state
+    """
+    sources = read_input_files(filenames, workers)
+    trades, _ = deduplicate_trades([(filename, source_trades) for filename, source_trades, _ in sources])
+    currency_rates = {}
+    process_currency_rates([rate for _, _, rates in sources for rate in rates], currency_rates, year, predefined_rates)
+    sorted_trades = sort_trades(trades)
+    stocks_data = init_stocks_data(year)
+    k4_data = {}
+    process_trading_data(sorted_trades, stocks_data, k4_data, currency_rates, [])
+    return new_base_state(year, sorted_trades, stocks_data, k4_data, currency_rates)
+
+@contextlib.contextmanager
+def quiet_engine():
+    """Disable the INFO and DEBUG logging of the engine, which dominates the time of a scenario."""
+    previous = logging.root.manager.disable
+    logging.disable(logging.INFO)
+    try:
+        yield
+    finally:
+        logging.disable(previous)
+
+def fork(data, keys):
+    """Copy a dict of entries, copying only the entries of the given keys."""
+    forked = dict(data)
+    for key in keys:
+        if key in forked:
+            forked[key] = dict(forked[key])
+    return forked
+
+def latest_rate(base, currency, date):
+    """Get the rate of a currency on a date from the base state, see prices.latest_rate."""
+    return prices.latest_rate(base['currency_rates'], base['rate_dates'], currency, date)
+
+def scenario_rates(base, currency, date):
+    """Get the currency rate index of a scenario, with the latest earlier rate if the date has none."""
+    currency_rates = base['currency_rates']
+    key = (date.split(';')[0], currency)
+    if currency == BASE_CURRENCY or key in currency_rates:
+        return currency_rates
+    return ChainMap({key: latest_rate(base, currency, date)}, currency_rates)
+
+def scenario_quantity(base, symbol, quantity):
+    """Resolve a scenario quantity: a number, 'all' or a percentage of the position."""
+    if isinstance(quantity, str):
+        position = base['stocks_data'].get(symbol, {}).get('quantity', 0)
+        if quantity == 'all':
+            return abs(position)
+        if quantity.endswith('%'):
+            return abs(position) * float(quantity[:-1]) / 100
+    return abs(float(quantity))
+
+def evaluate_scenario(base, scenario):
+    """Apply a hypothetical trade to a fork of the base state.
+
+    Args:
+        base: Base state, see new_base_state
+        scenario: Scenario dictionary, see the module comment
+
+    Returns:
+        dict: 'scenario', the changed K4 rows in 'k4_delta' (symbol -> 'antal', 'forsaljningspris',
+              'omkostnadsbelopp', 'profit_loss'), the change of the total 'profit_loss' and 'tax',
+              and 'error' if the scenario could not be evaluated
+    """
+    symbol = scenario['symbol']
+    last_price, last_currency, description = base['last_trades'].get(symbol, (None, BASE_CURRENCY, symbol))
+    try:
+        quantity = scenario_quantity(base, symbol, scenario.get('quantity', 'all'))
+        price = scenario.get('price')
+        if price is None:
+            if last_price is None:
+                raise ValueError(f"no price given and no trade of {symbol}")
+            price = last_price
+        elif is_option(symbol):
+            # The engine works with option prices per lot, see sort_trades
+            price = float(price) * 100
+        currency = scenario.get('currency') or last_currency
+        date = scenario.get('date') or base['last_datetime']
+        currency_rates = scenario_rates(base, currency, date)
+    except (ValueError, TypeError) as e:
+        return {'scenario': scenario, 'k4_delta': {}, 'profit_loss': 0.0, 'tax': 0.0, 'error': str(e)}
+
+    keys = trade_keys(symbol, currency)
+    stocks_data = fork(base['stocks_data'], keys)
+    k4_data = fork(base['k4_data'], keys)
+    commission = float(scenario.get('commission', 0))
+    try:
+        if scenario.get('side', 'SELL').upper() == 'BUY':
+            process_buy_entry(symbol, description, quantity, float(price), commission, currency, date, stocks_data, k4_data, currency_rates, [])
+        else:
+            process_sell_entry(symbol, description, -quantity, float(price), commission, currency, date, stocks_data, k4_data, currency_rates, [])
+    except SystemExit:
+        return {'scenario': scenario, 'k4_delta': {}, 'profit_loss': 0.0, 'tax': 0.0, 'error': 'the engine rejected the trade, see the log'}
+
+    k4_delta = {}
+    empty = {'antal': 0, 'forsaljningspris': 0, 'omkostnadsbelopp': 0}
+    for key in keys:
+        after = k4_data.get(key)
+        before = base['k4_data'].get(key, empty)
+        if after is None or after == before:
+            continue
+        delta = {field: after[field] - before[field] for field in ('antal', 'forsaljningspris', 'omkostnadsbelopp')}
+        delta['profit_loss'] = delta['forsaljningspris'] - delta['omkostnadsbelopp']
+        k4_delta[key] = delta
+    profit_loss = sum(delta['profit_loss'] for delta in k4_delta.values())
+    return {'scenario': scenario, 'k4_delta': k4_delta, 'profit_loss': profit_loss, 'tax': profit_loss * 0.3, 'error': None}
+
+def evaluate_scenarios(base, scenarios):
+    """Evaluate scenarios in this process, see evaluate_scenario."""
+    with quiet_engine():
+        return [evaluate_scenario(base, scenario) for scenario in scenarios]
+
+# Base state of a worker process, set by init_worker
+worker_base = None
+
+def init_worker(base):
+    global worker_base
+    worker_base = base
+
+def evaluate_chunk(scenarios):
+    return evaluate_scenarios(worker_base, scenarios)
+
+def simulate(base, scenarios, workers=None):
+    """Evaluate scenarios, in a process pool when there are many.
+
+    Args:
+        base: Base state, see new_base_state
+        scenarios: List of scenario dictionaries
+        workers: Maximum number of worker processes, the number of CPUs if None
+
+    Returns:
+        list: Results in scenario order, see evaluate_scenario
+    """
+    start = time.perf_counter()
+    chunks = [scenarios[i:i + CHUNK_SIZE] for i in range(0, len(scenarios), CHUNK_SIZE)]
+    workers = min(len(chunks), workers or os.cpu_count() or 1)
+    if workers <= 1 or len(scenarios) < MIN_POOL_SCENARIOS:
+        results = evaluate_scenarios(base, scenarios)
+    else:
+        # Imported on first use, few scenarios are evaluated in this process
+        import concurrent.futures
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(base,)) as executor:
+            results = [result for chunk in executor.map(evaluate_chunk, chunks) for result in chunk]
+    seconds = time.perf_counter() - start
+    rate = len(scenarios) / seconds if seconds > 0 else 0
+    logging.info(f"Evaluated {len(scenarios)} scenarios in {seconds:.3f} s ({rate:.0f} scenarios/s)")
+    return results
+
+def read_scenarios(filename):
+    """Read scenarios from a JSON file with a list of scenario dictionaries.
+
+    Returns:
+        list: Scenarios
+    """
+    try:
+        with open(filename) as file:
+            scenarios = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Cannot read the scenarios in {filename}: {e}")
+        sys.exit(1)
+    if not isinstance(scenarios, list) or not all(isinstance(scenario, dict) and 'symbol' in scenario for scenario in scenarios):
+        logging.error(f"{filename} must contain a list of scenarios with a symbol")
+        sys.exit(1)
+    return scenarios
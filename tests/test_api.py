@@ -0,0 +1,59 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from k4sru.api import compute_k4, to_columnar
+from k4sru.columnar import K4_COLUMNS
+
+class TestApiFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def setUp(self):
+        self.trades = [
+            {'DateTime': '20250101;120000', 'Symbol': 'AAOI', 'Buy/Sell': 'BUY', 'Quantity': '10', 'TradePrice': '30', 'IBCommission': '-1', 'CurrencyPrimary': 'USD', 'Description': 'Applied Optoelectronics Inc', 'ISIN': 'US03823U1025', 'Exchange': 'NASDAQ'},
+            {'DateTime': '20250102;120000', 'Symbol': 'AAOI', 'Buy/Sell': 'SELL', 'Quantity': '-10', 'TradePrice': '40', 'IBCommission': '-1', 'CurrencyPrimary': 'USD', 'Description': 'Applied Optoelectronics Inc', 'ISIN': 'US03823U1025', 'Exchange': 'NASDAQ'},
+            {'DateTime': '20250102;130000', 'Symbol': 'ERIC-B', 'Buy/Sell': 'BUY', 'Quantity': '10', 'TradePrice': '100', 'IBCommission': '-5', 'CurrencyPrimary': 'SEK', 'Description': 'Ericsson', 'ISIN': 'SE0000108656', 'Exchange': 'SFB'},
+        ]
+        self.rates = [
+            {'Date/Time': '20250101', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.1'},
+            {'Date/Time': '20250102', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.1'},
+        ]
+
+    def test_compute_k4_001(self):
+        result = compute_k4(self.trades, self.rates, 2025, output='dict')
+        k4 = result['k4']
+        self.assertEqual(k4['beteckning'], ['AAOI', 'USD'])
+        self.assertEqual(k4['antal'], [10.0, 301.0])
+        self.assertEqual(k4['forsaljningspris'], [(10*40-1)*10, 301*10])
+        self.assertEqual(result['portfolio']['symbol'], ['USD', 'ERIC-B'])
+        self.assertEqual(result['journal']['symbol'], ['AAOI'])
+        self.assertEqual(result['journal']['win'], [True])
+
+    def test_compute_k4_002(self):
+        # Input trades and the initial portfolio are not modified
+        stocks_data = {'ERIC-B': {'entry_date': '20240101;120000', 'quantity': 10, 'totalprice': 800, 'avgprice': 80}}
+        compute_k4(self.trades, self.rates, 2025, stocks_data=stocks_data, output='dict')
+        self.assertEqual(stocks_data['ERIC-B']['quantity'], 10)
+        self.assertEqual(self.trades[0]['TradePrice'], '30')
+
+    def test_to_columnar_001(self):
+        columns = {'beteckning': ['A'], 'beskrivning': ['a'], 'antal': [1.0], 'forsaljningspris': [2], 'omkostnadsbelopp': [1]}
+        self.assertEqual(to_columnar(K4_COLUMNS, columns, 'dict'), columns)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import json
+import os
+import tempfile
+from k4sru.bench import run_benchmark, stage_timer, parse_importtime, check_startup, STAGES
+
+class TestBenchFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_stage_timer_001(self):
+        timings = {}
+        stage = stage_timer(timings)
+        with stage('parse'):
+            pass
+        with stage('parse'):
+            pass
+        self.assertEqual(list(timings), ['parse'])
+        self.assertGreaterEqual(timings['parse'], 0)
+
+    def test_run_benchmark_001(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'bench.json')
+            results = run_benchmark([200, 400], 2025, output, workers=1, startup_budget_ms=None, symbols=10, seed=1)
+            with open(output) as file:
+                self.assertEqual(json.load(file), json.loads(json.dumps(results)))
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertEqual([result['trades'] for result in results['results']], [200, 400])
+        for result in results['results']:
+            self.assertEqual(list(result['stages']), STAGES)
+            self.assertGreater(result['k4_rows'], 0)
+            self.assertTrue(result['equivalence']['store']['equivalent'])
+        self.assertNotIn('startup', results)
+
+    def test_parse_importtime_001(self):
+        output = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:       100 |        100 |   _io\n'
+                  'import time:       500 |        900 | site\n'
+                  'import time:       300 |        300 |     itertools\n'
+                  'import time:       400 |        700 |   re\n'
+                  'import time:      1000 |       2500 | argparse\n')
+        self.assertEqual(parse_importtime(output), {'site': 900, 'argparse': 2500})
+
+    def test_check_startup_001(self):
+        result = check_startup(budget_ms=10000, runs=1)
+        self.assertTrue(result['within_budget'])
+        self.assertGreater(result['import_ms'], 0)
+        # The command line does not import the engine to show the help
+        self.assertNotIn('k4sru.data', [name for name, _ in result['modules']])
+        self.assertFalse(check_startup(budget_ms=0, runs=1)['within_budget'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import io
+from k4sru.bitstamp import iter_bitstamp_csv, parse_bitstamp_datetime, is_bitstamp_header
+from k4sru.data import post_process_trading_data, process_trading_data
+
+LEGACY_EXPORT = '''Type,Datetime,Account,Amount,Value,Rate,Fee,Sub Type
+Deposit,"Jan. 04, 2025, 08:00 AM",Main Account,5000.00 USD,,,,
+Market,"Jan. 05, 2025, 09:15 AM",Main Account,0.12345678 BTC,3000.00 USD,24300.00 USD,15.00 USD,Buy
+Limit,"May 06, 2025, 01:30 PM",Main Account,0.12345678 BTC,3100.00 USD,25110.00 USD,15.50 USD,Sell
+'''
+
+CURRENT_EXPORT = '''ID,Account,Object,Type,Subtype,Datetime,Amount,Amount currency,Value,Value currency,Rate,Rate currency,Fee,Fee currency,Order ID
+1,Main Account,Deposit,,,2025-01-04T08:00:00Z,5000.00,USD,,,,,,,
+2,Main Account,Order,Market,Buy,2025-01-05T09:15:00Z,0.12345678,BTC,3000.00,SEK,24300.00,SEK,15.00,SEK,10
+3,Main Account,Order,Limit,Sell,2025-05-06T13:30:00Z,0.02345678,BTC,600.00,SEK,25110.00,SEK,3.00,SEK,11
+'''
+
+class TestBitstampFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_parse_bitstamp_datetime_001(self):
+        self.assertEqual(parse_bitstamp_datetime('Jan. 05, 2025, 09:15 AM'), '20250105;091500')
+        self.assertEqual(parse_bitstamp_datetime('Sept. 30, 2025, 11:59 PM'), '20250930;235900')
+        self.assertEqual(parse_bitstamp_datetime('2025-01-05T10:15:00+01:00'), '20250105;091500')
+
+    def test_is_bitstamp_header_001(self):
+        self.assertTrue(is_bitstamp_header(LEGACY_EXPORT.splitlines()[0].split(',')))
+        self.assertTrue(is_bitstamp_header(CURRENT_EXPORT.splitlines()[0].split(',')))
+        self.assertFalse(is_bitstamp_header(['DateTime', 'Symbol', 'IBCommission']))
+
+    def test_iter_bitstamp_csv_001(self):
+        trades = list(iter_bitstamp_csv(io.StringIO(LEGACY_EXPORT)))
+        self.assertEqual(len(trades), 2)
+        self.assertEqual(trades[0], {'DateTime': '20250105;091500', 'Symbol': 'BTC', 'Buy/Sell': 'BUY', 'Quantity': '0.12345678',
+                                     'TradePrice': '24300.00', 'IBCommission': '-15.00', 'CurrencyPrimary': 'USD', 'Description': 'BTC',
+                                     'ISIN': '', 'Exchange': 'BITSTAMP', 'TradeID': ''})
+        self.assertEqual(trades[1]['Quantity'], '-0.12345678')
+        self.assertEqual(trades[1]['DateTime'], '20250506;133000')
+
+    def test_iter_bitstamp_csv_002(self):
+        trades = list(iter_bitstamp_csv(io.StringIO(CURRENT_EXPORT)))
+        self.assertEqual([t['TradeID'] for t in trades], ['2', '3'])
+        self.assertEqual(trades[1]['Quantity'], '-0.02345678')
+        # BTC quantities keep all 8 decimals through the engine to the K4 row
+        stocks_data = {}
+        k4_data = {}
+        output = process_trading_data(trades, stocks_data, k4_data, {}, [])
+        rows = post_process_trading_data(output, 2025)
+        self.assertEqual(rows[0]['antal'], '0.02345678')
+        self.assertAlmostEqual(stocks_data['BTC']['quantity'], 0.1, places=12)
+
+if __name__ == '__main__':
+    unittest.main()
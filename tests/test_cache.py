@@ -0,0 +1,111 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import os
+import tempfile
+from k4sru.cache import result_key, restore_result, store_result, evict, result_files
+
+class TestCacheFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+        os.makedirs('input')
+        os.makedirs('output')
+        self.write('input/config.json', '{"orgnr": "123456789012"}')
+        self.write('input/a.csv', 'trades a')
+        self.write('input/b.csv', 'trades b')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def write(self, path, content):
+        with open(path, 'w') as file:
+            file.write(content)
+
+    def read(self, path):
+        with open(path) as file:
+            return file.read()
+
+    def write_outputs(self, text):
+        for name in result_files(2025):
+            self.write('output/' + name, text)
+        self.write('output/BLANKETTER.SRU', f'#IDENTITET 123456789012 20250101 120000\n{text}\n')
+
+    def test_result_key_001(self):
+        key = result_key('input/config.json', ['input/*.csv'], 2025, False)
+        self.assertEqual(key, result_key('input/config.json', ['input/a.csv', 'input/b.csv'], 2025, False))
+        self.assertNotEqual(key, result_key('input/config.json', ['input/*.csv'], 2025, True))
+        self.assertNotEqual(key, result_key('input/config.json', ['input/*.csv'], 2024, False))
+        self.assertNotEqual(key, result_key('input/config.json', ['input/b.csv', 'input/a.csv'], 2025, False))
+
+        # The content of the files is hashed, not their names or times
+        os.rename('input/b.csv', 'input/c.csv')
+        self.assertEqual(key, result_key('input/config.json', ['input/*.csv'], 2025, False))
+        self.write('input/c.csv', 'trades c')
+        self.assertNotEqual(key, result_key('input/config.json', ['input/*.csv'], 2025, False))
+
+    def test_result_key_002(self):
+        key = result_key('input/config.json', ['input/a.csv'], 2025, False)
+        self.write('input/input_portfolio_2025.json', '{}')
+        portfolio_key = result_key('input/config.json', ['input/a.csv'], 2025, False)
+        self.assertNotEqual(key, portfolio_key)
+        self.write('input/input_currency_rates_2025.json', '{}')
+        self.assertNotEqual(portfolio_key, result_key('input/config.json', ['input/a.csv'], 2025, False))
+        self.write('input/config.json', '{"orgnr": "210987654321"}')
+        self.assertNotEqual(key, result_key('input/config.json', ['input/a.csv'], 2025, False))
+
+    def test_restore_result_001(self):
+        key = result_key('input/config.json', ['input/a.csv'], 2025, False)
+        self.assertFalse(restore_result('cache', key, 2025))
+        self.write_outputs('first')
+        store_result('cache', key, 2025, 1 << 20)
+        self.write_outputs('second')
+
+        self.assertTrue(restore_result('cache', key, 2025))
+        self.assertEqual(self.read('output/output_portfolio_2025.json'), 'first')
+        self.assertEqual(self.read('output/trading_statistics_2025.csv'), 'first')
+        # The time of the restore is written to the #IDENTITET line
+        lines = self.read('output/BLANKETTER.SRU').splitlines()
+        self.assertRegex(lines[0], r'^#IDENTITET 123456789012 \d{8} \d{6}$')
+        self.assertNotEqual(lines[0], '#IDENTITET 123456789012 20250101 120000')
+        self.assertEqual(lines[1], 'first')
+
+    def test_evict_001(self):
+        self.write_outputs('x' * 100)
+        for i, key in enumerate(['k1', 'k2', 'k3']):
+            store_result('cache', key, 2025, 1 << 20)
+            os.utime(f'cache/{key}', (1000 + i, 1000 + i))
+        # k1 was used last
+        restore_result('cache', 'k1', 2025)
+        size = sum(os.path.getsize(f'cache/k1/{name}') for name in os.listdir('cache/k1'))
+        self.assertEqual(evict('cache', 2 * size), ['k2'])
+        self.assertEqual(sorted(os.listdir('cache')), ['k1', 'k3'])
+
+        # An entry larger than the cache is not stored
+        store_result('cache', 'k4', 2025, size - 1)
+        self.assertEqual(sorted(os.listdir('cache')), ['k1', 'k3'])
+        store_result('cache', 'k4', 2025, size)
+        self.assertEqual(os.listdir('cache'), ['k4'])
+
+if __name__ == '__main__':
+    unittest.main()
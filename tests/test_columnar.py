@@ -0,0 +1,100 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import math
+import os
+import struct
+import tempfile
+from unittest import mock
+from k4sru.columnar import resolve_columnar_format, k4_columns, portfolio_columns, write_fixed_width, read_fixed_width, K4_COLUMNS, PORTFOLIO_COLUMNS, COLUMNAR_MAGIC
+
+class TestColumnarFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_k4_columns_001(self):
+        rows = [
+            {'beteckning': 'BTC', 'beskrivning': 'Bitcoin', 'antal': '0.12345678', 'forsaljningspris': 1000, 'omkostnadsbelopp': 800},
+            {'beteckning': 'RHMd', 'beskrivning': 'RHEINMETALL AG', 'antal': 20, 'forsaljningspris': 282697, 'omkostnadsbelopp': 278411}
+        ]
+        columns = k4_columns(rows)
+        self.assertEqual(columns['beteckning'], ['BTC', 'RHMd'])
+        self.assertEqual(columns['antal'], [0.12345678, 20.0])
+        self.assertEqual(columns['forsaljningspris'], [1000, 282697])
+
+    def test_portfolio_columns_001(self):
+        stocks_data = {
+            'AAOI': {'entry_date': '20250101;120000', 'quantity': 10, 'totalprice': 3000, 'avgprice': 300, 'totalpriceusd': 290, 'avgpriceusd': 29},
+            'EUR': {'quantity': 0, 'totalprice': 0, 'avgprice': 0}
+        }
+        columns = portfolio_columns(stocks_data)
+        self.assertEqual(columns['symbol'], ['AAOI'])
+        self.assertEqual(columns['avgpriceusd'], [29.0])
+
+    def test_write_fixed_width_001(self):
+        rows = [
+            {'beteckning': 'RHMd', 'beskrivning': 'RHEINMETALL AG', 'antal': 20, 'forsaljningspris': 282697, 'omkostnadsbelopp': 278411},
+            {'beteckning': 'EUR', 'beskrivning': 'Euro – €', 'antal': 2081, 'forsaljningspris': -5, 'omkostnadsbelopp': 0}
+        ]
+        filename = os.path.join(self.tmpdir.name, 'k4_2025.col')
+        write_fixed_width(filename, 'k4', K4_COLUMNS, k4_columns(rows))
+        header, columns = read_fixed_width(filename)
+        self.assertEqual(header['rows'], 2)
+        self.assertEqual(header['data_offset'] % 8, 0)
+        self.assertEqual(columns['beskrivning'], ['RHEINMETALL AG', 'Euro – €'])
+        self.assertEqual(columns['forsaljningspris'], [282697, -5])
+        # The data block is a plain array of fixed-size records
+        with open(filename, 'rb') as file:
+            data = file.read()
+        self.assertTrue(data.startswith(COLUMNAR_MAGIC))
+        self.assertEqual(len(data), header['data_offset'] + 2 * header['record_size'])
+        antal = next(c for c in header['columns'] if c['name'] == 'antal')
+        (value,) = struct.unpack_from('<d', data, header['data_offset'] + header['record_size'] + antal['offset'])
+        self.assertEqual(value, 2081.0)
+
+    def test_write_fixed_width_002(self):
+        filename = os.path.join(self.tmpdir.name, 'portfolio_2025.col')
+        stocks_data = {'EUR': {'entry_date': '20250101;120000', 'quantity': 100, 'totalprice': 1100, 'avgprice': 11}}
+        write_fixed_width(filename, 'portfolio', PORTFOLIO_COLUMNS, portfolio_columns(stocks_data))
+        header, columns = read_fixed_width(filename)
+        self.assertEqual(columns['symbol'], ['EUR'])
+        self.assertTrue(math.isnan(columns['totalpriceusd'][0]))
+
+    def test_write_fixed_width_003(self):
+        filename = os.path.join(self.tmpdir.name, 'journal_2025.col')
+        write_fixed_width(filename, 'k4', K4_COLUMNS, k4_columns([]))
+        header, columns = read_fixed_width(filename)
+        self.assertEqual(header['rows'], 0)
+        self.assertEqual(columns['beteckning'], [])
+
+    def test_resolve_columnar_format_001(self):
+        self.assertEqual(resolve_columnar_format('fixed'), 'fixed')
+        # Without pyarrow 'auto' falls back to the fixed-width format and 'arrow' stops
+        with mock.patch('k4sru.columnar.pyarrow', None):
+            self.assertEqual(resolve_columnar_format('auto'), 'fixed')
+            with self.assertRaises(SystemExit):
+                resolve_columnar_format('arrow')
+
+if __name__ == '__main__':
+    unittest.main()
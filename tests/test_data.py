@@ -14,7 +14,10 @@
 
 import unittest
 import logging
+import os
+import tempfile
 from k4sru.data import process_k4_entry, process_currency_buy, process_currency_sell, process_buy_entry, process_sell_entry, process_input_data, process_trading_data
+from k4sru.data import deduplicate_trades, expand_input_files, read_input_files
 
 class TestDataFunctions(unittest.TestCase):
     stocks_data = {}
@@ -822,5 +825,38 @@ class TestDataFunctions(unittest.TestCase):
         self.assertEqual(output[0]['forsaljningspris'], 5*110-5) # 545
         self.assertEqual(output[0]['omkostnadsbelopp'], 5*100.5) # 502.5
 
+    def test_deduplicate_trades_001(self):
+        buy = {'DateTime': '20250101;120000', 'Symbol': 'ERIC-B', 'Buy/Sell': 'BUY', 'Quantity': '10', 'TradePrice': '100', 'IBCommission': '-5', 'CurrencyPrimary': 'SEK', 'Description': 'Ericsson', 'Exchange': 'SFB'}
+        sell = {'DateTime': '20250102;120000', 'Symbol': 'ERIC-B', 'Buy/Sell': 'SELL', 'Quantity': '-5', 'TradePrice': '110', 'IBCommission': '-5', 'CurrencyPrimary': 'SEK', 'Description': 'Ericsson', 'Exchange': 'SFB'}
+        # Monthly export overlapping the YTD export, numbers formatted differently
+        monthly = [dict(sell, Quantity='-5.0', TradePrice='110.00')]
+        trades, duplicates = deduplicate_trades([('ytd.csv', [buy, sell]), ('monthly.csv', monthly)])
+        self.assertEqual(trades, [buy, sell])
+        self.assertEqual(duplicates, [('monthly.csv', monthly[0])])
+
+    def test_deduplicate_trades_002(self):
+        # Identical fills in the same export are separate trades, the overlapping export repeats one of them
+        buy = {'DateTime': '20250101;120000', 'Symbol': 'ERIC-B', 'Buy/Sell': 'BUY', 'Quantity': '10', 'TradePrice': '100', 'IBCommission': '-5', 'CurrencyPrimary': 'SEK', 'Description': 'Ericsson', 'Exchange': 'SFB'}
+        trades, duplicates = deduplicate_trades([('a.csv', [buy, dict(buy)]), ('b.csv', [dict(buy), dict(buy), dict(buy)])])
+        self.assertEqual(len(trades), 3)
+        self.assertEqual(len(duplicates), 2)
+
+    def test_read_input_files_001(self):
+        header = '"DateTime","Symbol","Buy/Sell","Quantity","TradePrice","IBCommission","CurrencyPrimary","Description","ISIN","Exchange"\n'
+        buy = '"20250101;120000","ERIC-B","BUY","10","100","-5","SEK","Ericsson","SE0000108656","SFB"\n'
+        sell = '"20250102;120000","ERIC-B","SELL","-5","110","-5","SEK","Ericsson","SE0000108656","SFB"\n'
+        rates = '"Date/Time","FromCurrency","ToCurrency","Rate"\n"20250101","SEK","USD","0.1"\n'
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, 'ytd.csv'), 'w') as file:
+                file.write(header + buy + rates)
+            with open(os.path.join(tmpdir, 'bitstamp.csv'), 'w') as file:
+                file.write(header + sell)
+            filenames = expand_input_files([os.path.join(tmpdir, '*.csv'), os.path.join(tmpdir, 'ytd.csv')])
+            self.assertEqual([os.path.basename(f) for f in filenames], ['bitstamp.csv', 'ytd.csv'])
+            sources = read_input_files([os.path.join(tmpdir, 'ytd.csv'), os.path.join(tmpdir, 'bitstamp.csv')], workers=2)
+        self.assertEqual([os.path.basename(f) for f, _, _ in sources], ['ytd.csv', 'bitstamp.csv'])
+        self.assertEqual([len(trades) for _, trades, _ in sources], [1, 1])
+        self.assertEqual([len(rates) for _, _, rates in sources], [1, 0])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,95 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from k4sru.data import process_trades
+from k4sru.equivalence import ENGINES, register_engine, check_equivalence, compare_values, compare_sru, mask_identitet
+from k4sru.options import parse_tolerance
+from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates
+
+def skewed_engine(trades, currency_rates_csv, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates=None):
+    # Reference engine with every K4 sales price off by 0.5 SEK
+    k4_rows = process_trades(trades, currency_rates_csv, year, stocks_data, k4_data, currency_rates, statistics_data, predefined_rates)
+    for entry in k4_data.values():
+        entry['forsaljningspris'] += 0.5
+    return k4_rows
+
+class TestEquivalenceFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+        cls.trades = list(iter_synthetic_trades(300, 2025, symbols=5, seed=3))
+        cls.rates = list(iter_synthetic_rates(2025, seed=3))
+
+    def tearDown(self):
+        ENGINES.pop('skewed', None)
+
+    def test_compare_values_001(self):
+        differences = []
+        compare_values('k4_data', {'A': {'antal': 10, 'pris': 1.0, 'namn': 'A'}}, {'A': {'antal': 10, 'pris': 1.0000001, 'namn': 'A'}}, 1e-6, differences)
+        self.assertEqual(differences, [])
+
+        compare_values('k4_data', {'A': [1, 2.5], 'B': 'x'}, {'A': [1, 2.6], 'C': 'x'}, 0.01, differences)
+        self.assertEqual(differences, ["k4_data['A'][1]: 2.6 != 2.5", "k4_data['B']: missing", "k4_data['C']: unexpected"])
+
+    def test_compare_sru_001(self):
+        differences = []
+        compare_sru('#UPPGIFT 3100 1000\n', '#UPPGIFT 3100 1001\n', 0, differences)
+        self.assertEqual(len(differences), 1)
+        differences = []
+        compare_sru('#UPPGIFT 3100 1000\n', '#UPPGIFT 3100 1001\n', 1, differences)
+        self.assertEqual(differences, [])
+
+    def test_mask_identitet_001(self):
+        self.assertEqual(mask_identitet('#BLANKETT K4-2025P4\n#IDENTITET 123456789012 20260101 120000\n'),
+                         '#BLANKETT K4-2025P4\n#IDENTITET 123456789012 <masked>\n')
+
+    def test_parse_tolerance_001(self):
+        self.assertEqual(parse_tolerance('k4_data=0.01'), ('k4_data', 0.01))
+        with self.assertRaises(ValueError):
+            parse_tolerance('k4=0.01')
+
+    def test_check_equivalence_001(self):
+        report = check_equivalence(self.trades, self.rates, 2025, ['store'], predefined_rates={})
+        self.assertTrue(report['reference']['equivalent'])
+        self.assertTrue(report['store']['equivalent'])
+        self.assertEqual(report['store']['differences'], [])
+
+    def test_check_equivalence_002(self):
+        register_engine('skewed', skewed_engine)
+        report = check_equivalence(self.trades, self.rates, 2025, ['skewed'], predefined_rates={})
+        self.assertFalse(report['skewed']['equivalent'])
+        self.assertTrue(any(difference.startswith('k4_data') for difference in report['skewed']['differences']))
+
+        # Within the tolerance of every section
+        tolerances = {'k4_data': 0.5}
+        report = check_equivalence(self.trades, self.rates, 2025, ['skewed'], predefined_rates={}, tolerances=tolerances)
+        self.assertTrue(report['skewed']['equivalent'])
+
+    def test_check_equivalence_003(self):
+        with self.assertRaises(SystemExit):
+            check_equivalence(self.trades, self.rates, 2025, ['unknown'], predefined_rates={})
+
+    def test_check_equivalence_004(self):
+        # The reference engine processes every trade like k4sru, the store engine only the tax year
+        trades = list(iter_synthetic_trades(100, 2024, symbols=5, seed=4)) + self.trades
+        rates = list(iter_synthetic_rates(2024, seed=4)) + self.rates
+        report = check_equivalence(trades, rates, 2025, ['store'], predefined_rates={})
+        self.assertFalse(report['store']['equivalent'])
+        self.assertTrue(any(difference.startswith('k4_data') for difference in report['store']['differences']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import io
+import os
+import tempfile
+from k4sru.flexxml import iter_flex_xml, normalize_flex_datetime
+from k4sru.parsers import find_parser
+from k4sru.data import read_input_file
+
+FLEX_XML = b'''<?xml version="1.0" encoding="UTF-8"?>
+<FlexQueryResponse queryName="trades" type="AF">
+<FlexStatements count="1">
+<FlexStatement accountId="U1234567" fromDate="20250101" toDate="20251231">
+<Trades>
+<Trade dateTime="20250225;030616" symbol="RHMd" buySell="BUY" quantity="2" tradePrice="985.4" ibCommission="-3" currency="EUR" description="RHEINMETALL AG" isin="DE0007030009" exchange="IBIS" tradeID="1001" levelOfDetail="EXECUTION" />
+<Trade dateTime="20250225;030616" symbol="RHMd" buySell="BUY" quantity="2" tradePrice="985.4" ibCommission="-3" currency="EUR" description="RHEINMETALL AG" isin="DE0007030009" exchange="IBIS" tradeID="" levelOfDetail="ORDER" />
+<Trade dateTime="2025-04-04;07:14:23" symbol="RHMd" buySell="SELL" quantity="-2" tradePrice="1291" ibCommission="-1.29" currency="EUR" description="RHEINMETALL AG" isin="DE0007030009" exchange="EUDARK" tradeID="1002" levelOfDetail="EXECUTION" />
+<Trade dateTime="20250405;071423" symbol="RHMd" buySell="SELL (Ca.)" quantity="-2" tradePrice="1291" ibCommission="-1.29" currency="EUR" description="RHEINMETALL AG" isin="DE0007030009" exchange="EUDARK" tradeID="1003" levelOfDetail="EXECUTION" />
+</Trades>
+<ConversionRates>
+<ConversionRate reportDate="20250225" fromCurrency="EUR" toCurrency="USD" rate="1.0515" />
+</ConversionRates>
+</FlexStatement>
+</FlexStatements>
+</FlexQueryResponse>
+'''
+
+class TestFlexXmlFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_normalize_flex_datetime_001(self):
+        self.assertEqual(normalize_flex_datetime('20250225;030616'), '20250225;030616')
+        self.assertEqual(normalize_flex_datetime('2025-02-25, 03:06:16'), '20250225;030616')
+        self.assertEqual(normalize_flex_datetime('20250225'), '20250225')
+
+    def test_iter_flex_xml_001(self):
+        records = list(iter_flex_xml(io.BytesIO(FLEX_XML)))
+        trades = [record for kind, record in records if kind == 'trade']
+        rates = [record for kind, record in records if kind == 'rate']
+        self.assertEqual([t['TradeID'] for t in trades], ['1001', '1002'])
+        self.assertEqual(trades[0], {'DateTime': '20250225;030616', 'Symbol': 'RHMd', 'Buy/Sell': 'BUY', 'Quantity': '2', 'TradePrice': '985.4',
+                                     'IBCommission': '-3', 'CurrencyPrimary': 'EUR', 'Description': 'RHEINMETALL AG', 'ISIN': 'DE0007030009',
+                                     'Exchange': 'IBIS', 'TradeID': '1001'})
+        self.assertEqual(trades[1]['DateTime'], '20250404;071423')
+        self.assertEqual(rates, [{'Date/Time': '20250225', 'FromCurrency': 'EUR', 'ToCurrency': 'USD', 'Rate': '1.0515'}])
+
+    def test_read_input_file_001(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'statement.xml')
+            with open(filename, 'wb') as file:
+                file.write(FLEX_XML)
+            self.assertEqual(find_parser(FLEX_XML.decode().splitlines()[0]), 'flexxml')
+            _, trades, rates = read_input_file(filename)
+        self.assertEqual(len(trades), 2)
+        self.assertEqual(len(rates), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import random
+from k4sru.whatif import new_base_state
+from k4sru.harvest import harvest, capital_income, find_candidates
+
+def k4_row(symbol, profit):
+    return {'beteckning': symbol, 'beskrivning': symbol, 'antal': -1, 'forsaljningspris': 1000.0 + profit, 'omkostnadsbelopp': 1000.0}
+
+def make_base(positions, k4_rows, currency_rates=None):
+    stocks_data = {symbol: {'quantity': quantity, 'avgprice': avgprice, 'totalprice': quantity * avgprice}
+                   for symbol, (quantity, avgprice) in positions.items()}
+    trades = [{'Symbol': symbol, 'TradePrice': '1', 'CurrencyPrimary': 'SEK', 'Description': symbol, 'DateTime': '20251230;120000'}
+              for symbol in positions]
+    k4_data = {row['beteckning']: row for row in k4_rows}
+    return new_base_state(2025, trades, stocks_data, k4_data, currency_rates or {})
+
+class TestHarvestFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_capital_income_001(self):
+        # Shares are netted, a net loss of shares and the loss of a currency or BTC row count 70 %
+        self.assertAlmostEqual(capital_income([k4_row('ABB', 1000), k4_row('AAOI', -400)]), 600)
+        self.assertAlmostEqual(capital_income([k4_row('ABB', 1000), k4_row('AAOI', -2000)]), -700)
+        self.assertAlmostEqual(capital_income([k4_row('ABB', 1000), k4_row('USD', -1000)]), 300)
+        self.assertAlmostEqual(capital_income([k4_row('BTC', 500), k4_row('USD', -100)]), 430)
+
+    def test_harvest_001(self):
+        base = make_base({'AAA': (100, 50.0), 'BBB': (10, 200.0), 'CCC': (100, 10.0)}, [k4_row('GAIN', 3000)])
+        prices = {'AAA': {'price': 30.0, 'currency': 'SEK'}, 'BBB': {'price': 100.0, 'currency': 'SEK'},
+                  'CCC': {'price': 12.0, 'currency': 'SEK'}}
+        # AAA loses 20 of 30 SEK sold, BBB 100 of 100: BBB is sold first, the least proceeds
+        result = harvest(base, prices, target=0)
+        self.assertEqual([(trade['symbol'], trade['quantity']) for trade in result['trades']], [('AAA', 100), ('BBB', 10)])
+        self.assertAlmostEqual(result['before']['capital_income'], 3000)
+        self.assertAlmostEqual(result['after']['capital_income'], 0)
+
+        result = harvest(base, prices, target=2000)
+        self.assertEqual([(trade['symbol'], trade['quantity']) for trade in result['trades']], [('BBB', 10)])
+        self.assertAlmostEqual(result['after']['tax'], 600)
+        self.assertEqual({row['beteckning']: row['section'] for row in result['k4_rows']}, {'BBB': 'A', 'GAIN': 'A'})
+
+    def test_harvest_002(self):
+        # The share gain is offset in full, the currency loss only to 70 %
+        base = make_base({'AAA': (100, 50.0), 'USD': (1000, 10.0)}, [k4_row('GAIN', 1000)])
+        prices = {'AAA': {'price': 40.0, 'currency': 'SEK'}, 'USD': {'price': 9.0, 'currency': 'SEK'}}
+        result = harvest(base, prices, loss_budget=1000)
+        self.assertEqual([(trade['symbol'], trade['quantity']) for trade in result['trades']], [('AAA', 100)])
+        self.assertAlmostEqual(result['after']['capital_income'], 0)
+
+        # Without a budget all losses are realized
+        result = harvest(base, prices)
+        self.assertEqual([trade['symbol'] for trade in result['trades']], ['AAA', 'USD.SEK'])
+        self.assertAlmostEqual(result['after']['capital_income'], -700)
+
+        # A target below the income uses losses, above it gains
+        result = harvest(base, {'AAA': {'price': 60.0, 'currency': 'SEK'}}, target=1500)
+        self.assertEqual([(trade['symbol'], trade['quantity']) for trade in result['trades']], [('AAA', 50)])
+        self.assertEqual(result['skipped'], ['USD'])
+
+    def test_harvest_003(self):
+        rng = random.Random(1)
+        positions = {f'S{i:04d}': (rng.randint(1, 500), rng.uniform(10, 500)) for i in range(3000)}
+        prices = {symbol: {'price': avgprice * rng.uniform(0.5, 1.6), 'currency': 'SEK'} for symbol, (_, avgprice) in positions.items()}
+        base = make_base(positions, [k4_row('GAIN', 400000)])
+        result = harvest(base, prices, loss_budget=150000)
+        loss = -sum(trade['profit_loss'] for trade in result['trades'])
+        self.assertLessEqual(loss, 150000)
+        self.assertGreater(loss, 149000)
+        self.assertAlmostEqual(result['after']['capital_income'], 400000 - loss, places=3)
+        self.assertLess(result['seconds'], 5)
+
+    def test_find_candidates_001(self):
+        # Foreign prices are converted with the price file rate or the latest engine rate
+        base = make_base({'AAA': (10, 100.0), 'BBB': (10, 100.0), 'EUR': (100, 11.0), 'SHORT': (-5, 10.0)}, [],
+                         {('20251201', 'EUR'): 11.5})
+        prices = {'AAA': {'price': 10.0, 'currency': 'USD'}, 'USD': {'price': 9.5, 'currency': 'SEK'},
+                  'BBB': {'price': 8.0, 'currency': 'EUR'}}
+        candidates, skipped = find_candidates(base, prices, '20251230;120000')
+        values = {candidate['symbol']: candidate['unit_value'] for candidate in candidates}
+        self.assertAlmostEqual(values['AAA'], 95.0)
+        self.assertAlmostEqual(values['BBB'], 92.0)
+        self.assertAlmostEqual(values['EUR.SEK'], 11.5)
+        self.assertEqual(skipped, [])
+
+if __name__ == '__main__':
+    unittest.main()
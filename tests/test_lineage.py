@@ -0,0 +1,80 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import copy
+import os
+import tempfile
+from k4sru import lineage
+from k4sru.data import process_transactions, process_trades
+from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates, write_flex_csv
+
+class TestLineageFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+        cls.trades = list(iter_synthetic_trades(800, 2025, symbols=8, options=0.05, btc=0.05, seed=9))
+        cls.rates = list(iter_synthetic_rates(2025, seed=9))
+
+    def tearDown(self):
+        lineage.disable()
+        lineage.reset()
+
+    def test_record_001(self):
+        # Disabled: nothing is recorded
+        k4_data = {}
+        process_trades(copy.deepcopy(self.trades), copy.deepcopy(self.rates), 2025, {}, k4_data, {}, [], {})
+        self.assertTrue(k4_data)
+        self.assertEqual(lineage.rows, {})
+
+        # The contributions of each K4 row sum to the row
+        lineage.enable()
+        recorded = {}
+        process_trades(copy.deepcopy(self.trades), copy.deepcopy(self.rates), 2025, {}, recorded, {}, [], {})
+        self.assertEqual(recorded, k4_data)
+        self.assertEqual(set(lineage.rows), set(k4_data))
+        for symbol, row in k4_data.items():
+            entries = lineage.rows[symbol]
+            self.assertEqual(sum(entry[-3] for entry in entries), row['antal'])
+            self.assertEqual(sum(entry[-2] for entry in entries), row['forsaljningspris'])
+            self.assertEqual(sum(entry[-1] for entry in entries), row['omkostnadsbelopp'])
+
+    def test_explain_001(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_file = os.path.join(tmpdir, 'trades.csv')
+            write_flex_csv(input_file, copy.deepcopy(self.trades), self.rates)
+            with open(input_file) as file:
+                lines = file.read().splitlines()
+            lineage.enable()
+            k4_data = {}
+            process_transactions([input_file], 2025, {}, k4_data, {}, [])
+            lineage.disable()
+            lineage_file = os.path.join(tmpdir, 'lineage_2025.lin')
+            lineage.save_lineage(lineage_file, 2025)
+
+            for symbol, row in k4_data.items():
+                result = lineage.explain(lineage_file, symbol)
+                self.assertEqual(result['beteckning'], symbol)
+                self.assertAlmostEqual(sum(c['forsaljningspris'] for c in result['contributions']), row['forsaljningspris'], places=6)
+                for contribution in result['contributions']:
+                    self.assertEqual(contribution['source'], input_file)
+                    # Trade n is on line n + 1 of the CSV file
+                    line = lines[contribution['trade']]
+                    self.assertTrue(line.startswith(f'"{contribution["date"]}","{contribution["symbol"]}","{contribution["side"]}"'), line)
+            self.assertIsNone(lineage.explain(lineage_file, 'NO SUCH ROW'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import json
+import os
+import tempfile
+from k4sru import metrics
+from k4sru.data import process_buy_entry, process_sell_entry
+
+class TestMetricsFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_branch_001(self):
+        # Disabled metrics are not collected
+        metrics.branch('UC-1')
+        self.assertIsNone(metrics.start_trade())
+        self.assertEqual(metrics.snapshot()['counts'], {})
+
+    def test_branch_002(self):
+        metrics.enable()
+        stocks_data = {}
+        k4_data = {}
+        statistics_data = []
+        currency_rates = {}
+        for process, quantity, price in [(process_buy_entry, 10, 100.0), (process_sell_entry, -10, 120.0)]:
+            start = metrics.start_trade()
+            process('ABB', 'ABB LTD', quantity, price, -1.0, 'SEK', '20250225', stocks_data, k4_data, currency_rates, statistics_data)
+            metrics.end_trade(start)
+
+        data = metrics.snapshot()
+        self.assertEqual(data['trades'], 2)
+        self.assertEqual(data['counts']['UC-1'], 1)
+        self.assertEqual(data['counts']['buy_base.first'], 1)
+        self.assertEqual(data['counts']['UC-5'], 1)
+        self.assertEqual(data['counts']['sell_base.long'], 1)
+        self.assertEqual(data['counts']['k4.base'], 1)
+        self.assertEqual(data['histograms']['UC-1']['count'], 1)
+        self.assertEqual(sum(data['histograms']['k4.base']['buckets']), 1)
+
+    def test_end_trade_001(self):
+        # Only every third trade is timed, labels hit twice in a trade are timed once
+        metrics.enable(sample=3)
+        for _ in range(6):
+            start = metrics.start_trade()
+            metrics.branch('UC-1')
+            metrics.branch('UC-1')
+            metrics.end_trade(start)
+        data = metrics.snapshot()
+        self.assertEqual(data['counts']['UC-1'], 12)
+        self.assertEqual(data['histograms']['UC-1']['count'], 2)
+
+    def test_format_prometheus_001(self):
+        data = {'trades': 1, 'sample_every': 1, 'bucket_bounds_ns': [1000, 2000],
+                'counts': {'UC-1': 1}, 'histograms': {'UC-1': {'buckets': [0, 1, 0], 'sum_ns': 1500, 'count': 1}}}
+        text = metrics.format_prometheus(data)
+        self.assertIn('irs_engine_trades_total 1\n', text)
+        self.assertIn('irs_engine_branch_hits_total{branch="UC-1"} 1\n', text)
+        self.assertIn('irs_engine_branch_latency_seconds_bucket{branch="UC-1",le="1e-06"} 0\n', text)
+        self.assertIn('irs_engine_branch_latency_seconds_bucket{branch="UC-1",le="2e-06"} 1\n', text)
+        self.assertIn('irs_engine_branch_latency_seconds_bucket{branch="UC-1",le="+Inf"} 1\n', text)
+        self.assertIn('irs_engine_branch_latency_seconds_sum{branch="UC-1"} 1.5e-06\n', text)
+
+    def test_save_metrics_001(self):
+        metrics.enable()
+        metrics.branch('UC-3')
+        with tempfile.TemporaryDirectory() as workdir:
+            json_file = os.path.join(workdir, 'metrics.json')
+            metrics.save_metrics(json_file)
+            with open(json_file) as file:
+                self.assertEqual(json.load(file)['counts'], {'UC-3': 1})
+            prom_file = os.path.join(workdir, 'metrics.prom')
+            metrics.save_metrics(prom_file)
+            with open(prom_file) as file:
+                self.assertIn('branch="UC-3"', file.read())
+
+if __name__ == '__main__':
+    unittest.main()
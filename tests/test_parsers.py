@@ -0,0 +1,77 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import io
+from k4sru.parsers import PARSERS, register_parser, find_parser, iter_input
+from k4sru.ibkr import iter_ibkr_csv
+
+IBKR_CSV = (
+    '"DateTime","Symbol","Buy/Sell","Quantity","TradePrice","IBCommission","CurrencyPrimary","Description","ISIN","Exchange"\n'
+    '"20250225;030616","AAOI","BUY","10","30","-1","USD","APPLIED OPTOELECTRONICS INC","US03823U1025","NASDAQ"\n'
+    '"Date/Time","FromCurrency","ToCurrency","Rate"\n'
+    '"20250225","SEK","USD","0.1"\n'
+)
+
+def sniff_semicolon(header):
+    return header.startswith('date;symbol;side;quantity;price')
+
+def parse_semicolon(stream):
+    next(stream)
+    for line in stream:
+        date, symbol, side, quantity, price = line.decode().strip().split(';')
+        yield 'trade', {'DateTime': date, 'Symbol': symbol, 'Buy/Sell': side, 'Quantity': quantity, 'TradePrice': price,
+                        'IBCommission': '0', 'CurrencyPrimary': 'SEK', 'Description': symbol, 'ISIN': '', 'Exchange': 'TEST'}
+
+class TestParsersFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def tearDown(self):
+        PARSERS.pop('semicolon', None)
+
+    def test_find_parser_001(self):
+        self.assertEqual(find_parser(IBKR_CSV.splitlines()[0]), 'ibkr')
+        self.assertEqual(find_parser('<?xml version="1.0" encoding="UTF-8"?>'), 'flexxml')
+        self.assertEqual(find_parser('Type,Datetime,Account,Amount,Value,Rate,Fee,Sub Type'), 'bitstamp')
+        self.assertIsNone(find_parser('date;symbol;side;quantity;price'))
+
+    def test_iter_input_001(self):
+        records = list(iter_input(io.BytesIO(IBKR_CSV.encode())))
+        self.assertEqual([kind for kind, _ in records], ['trade', 'rate'])
+        self.assertEqual(records[0][1]['Symbol'], 'AAOI')
+        self.assertEqual(records[1][1]['Rate'], '0.1')
+
+    def test_register_parser_001(self):
+        register_parser('semicolon', sniff_semicolon, parse_semicolon)
+        self.assertEqual(find_parser('date;symbol;side;quantity;price'), 'semicolon')
+
+        data = b'date;symbol;side;quantity;price\n20250225;ABB;BUY;10;500\n'
+        records = list(iter_input(io.BytesIO(data)))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][1]['Exchange'], 'TEST')
+
+    def test_iter_ibkr_csv_001(self):
+        # Without the currency rates section
+        records = list(iter_ibkr_csv(io.StringIO(''.join(IBKR_CSV.splitlines(keepends=True)[:2]))))
+        self.assertEqual([kind for kind, _ in records], ['trade'])
+
+        with self.assertRaises(SystemExit):
+            list(iter_ibkr_csv(io.StringIO('"DateTime","Symbol","IBCommission"\n"20250225;030616","AAOI","-1"\n')))
+
+if __name__ == '__main__':
+    unittest.main()
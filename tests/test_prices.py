@@ -0,0 +1,63 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import os
+import tempfile
+from k4sru.prices import read_prices, sek_rate
+
+class TestPricesFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_prices_001(self):
+        path = self.write('prices.csv', 'Symbol,Price,Currency\nAAOI,24.10,USD\nUSD,9.52,SEK\nABB,410,\n')
+        self.assertEqual(read_prices(path), {
+            'AAOI': {'price': 24.10, 'currency': 'USD'},
+            'USD': {'price': 9.52, 'currency': 'SEK'},
+            'ABB': {'price': 410.0, 'currency': 'SEK'},
+        })
+
+    def test_read_prices_002(self):
+        path = self.write('prices.json', '{"AAOI": {"price": 24.1, "currency": "USD"}, "ABB": 410}')
+        self.assertEqual(read_prices(path), {'AAOI': {'price': 24.1, 'currency': 'USD'}, 'ABB': {'price': 410.0, 'currency': 'SEK'}})
+        with self.assertRaises(SystemExit):
+            read_prices(self.write('bad.csv', 'Symbol,Price\nAAOI,abc\n'))
+        with self.assertRaises(SystemExit):
+            read_prices(os.path.join(self.tmpdir.name, 'missing.csv'))
+
+    def test_sek_rate_001(self):
+        prices = {'USD': {'price': 9.52, 'currency': 'SEK'}, 'EUR': {'price': 1.1, 'currency': 'USD'}}
+        self.assertEqual(sek_rate(prices, 'SEK'), 1.0)
+        self.assertEqual(sek_rate(prices, 'USD'), 9.52)
+        self.assertIsNone(sek_rate(prices, 'EUR'))
+        self.assertEqual(sek_rate(prices, 'EUR', lambda currency: 11.0), 11.0)
+
+if __name__ == '__main__':
+    unittest.main()
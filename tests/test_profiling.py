@@ -0,0 +1,78 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import os
+import pstats
+import tempfile
+import tracemalloc
+from k4sru.profiling import stage_profiler, format_profile_summary, save_profile_report, format_bytes
+
+class TestProfilingFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def test_stage_profiler_001(self):
+        results = {}
+        stage = stage_profiler(results, 'time')
+        with stage('parse'):
+            pass
+        self.assertEqual(results['parse']['calls'], 1)
+        self.assertIsNone(results['parse']['peak_bytes'])
+        self.assertIsNone(results['parse']['stats'])
+
+    def test_stage_profiler_002(self):
+        results = {}
+        stage = stage_profiler(results, 'full')
+        with stage('engine'):
+            data = [str(i) * 10 for i in range(10000)]
+        with stage('engine'):
+            del data
+        self.assertEqual(results['engine']['calls'], 2)
+        self.assertGreater(results['engine']['peak_bytes'], 100000)
+        self.assertIsInstance(results['engine']['stats'], pstats.Stats)
+
+    def test_format_bytes_001(self):
+        self.assertEqual(format_bytes(None), '-')
+        self.assertEqual(format_bytes(512), '512 B')
+        self.assertEqual(format_bytes(2048), '2.0 KiB')
+        self.assertEqual(format_bytes(3 * 1024 ** 3), '3.0 GiB')
+
+    def test_save_profile_report_001(self):
+        results = {}
+        stage = stage_profiler(results, 'full')
+        with stage('sort'):
+            sorted(range(1000), reverse=True)
+        lines = format_profile_summary(results)
+        self.assertTrue(any(line.startswith('sort ') for line in lines))
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)
+            try:
+                os.makedirs('output')
+                written = save_profile_report(results, 2025)
+                self.assertEqual(written, ['output/profile_2025.txt', 'output/profile_2025_sort.prof'])
+                self.assertTrue(all(os.path.exists(filename) for filename in written))
+            finally:
+                os.chdir(cwd)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import copy
+import os
+import tempfile
+from k4sru.data import process_trades
+from k4sru.snapshots import new_snapshot_index
+from k4sru.reconcile import read_broker_positions, reconcile_positions, reconcile
+from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates
+
+class TestReconcileFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_read_broker_positions_001(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'positions.csv')
+            with open(filename, 'w') as file:
+                file.write('ReportDate,Symbol,ISIN,Quantity\n'
+                           '2025-06-30,RHMd,DE0007030009,4\n'
+                           '20250630,IBIT  250117C00050000,,2\n'
+                           '20250630,RHMd,DE0007030009,1\n'
+                           ',AAOI,US03823U1025,10\n')
+            reports = read_broker_positions(filename, 2025)
+        self.assertEqual(sorted(reports), ['20250630', '20251231'])
+        self.assertEqual(reports['20250630']['RHMd'], {'quantity': 5.0, 'isin': 'DE0007030009'})
+        self.assertEqual(reports['20250630']['IBIT 250117C00050000']['quantity'], 2.0)
+        self.assertEqual(reports['20251231']['AAOI']['quantity'], 10.0)
+
+    def test_reconcile_positions_001(self):
+        computed = {
+            'RHMd': {'quantity': 4}, 'AAOI': {'quantity': 10}, 'ERIC-B': {'quantity': 5},
+            'IBIT 250117C00050000': {'quantity': 2}, 'SOLD': {'quantity': 0}, 'EUR': {'quantity': -1000.5},
+        }
+        broker = {
+            'RHM': {'quantity': 4, 'isin': 'DE0007030009'},
+            'AAOI': {'quantity': 12, 'isin': ''},
+            'IBIT 250117C00050000': {'quantity': 2, 'isin': ''},
+            'NVDA': {'quantity': 3, 'isin': 'US67066G1040'},
+            'CLOSED': {'quantity': 0, 'isin': ''},
+        }
+        differences = reconcile_positions(computed, broker, {'DE0007030009': 'RHMd'})
+        self.assertEqual([(d['symbol'], d['status'], d['difference']) for d in differences],
+                         [('AAOI', 'mismatch', -2), ('ERIC-B', 'missing_broker', 5), ('NVDA', 'missing_computed', -3)])
+        # Currency balances only when asked for
+        differences = reconcile_positions(computed, broker, {'DE0007030009': 'RHMd'}, currencies=True)
+        self.assertIn(('EUR', 'missing_broker'), [(d['symbol'], d['status']) for d in differences])
+
+    def test_reconcile_001(self):
+        trades = list(iter_synthetic_trades(1200, 2025, symbols=8, options=0.05, seed=5))
+        rates = list(iter_synthetic_rates(2025, seed=5))
+        index = new_snapshot_index(2025, 100, 0)
+        process_trades(copy.deepcopy(trades), copy.deepcopy(rates), 2025, {}, {}, {}, [], {}, snapshot_index=index)
+
+        # Month-end exports from runs of the trades up to each month-end agree with the index
+        month_ends = ['20250131', '20250430', '20250731', '20251031', '20251231']
+        reports = {}
+        for date in month_ends:
+            stocks_data = {}
+            process_trades(copy.deepcopy([trade for trade in trades if trade['DateTime'] <= f'{date};235959']),
+                           copy.deepcopy(rates), 2025, stocks_data, {}, {}, [], {})
+            reports[date] = {symbol: {'quantity': data['quantity'], 'isin': ''}
+                             for symbol, data in stocks_data.items() if data['quantity'] != 0}
+        result = reconcile(index, reports, currencies=True)
+        self.assertIsNone(result['first_divergent_date'])
+        self.assertTrue(all(entry['positions'] for entry in result['dates']))
+
+        # A broker fill missing in the replay shows from the first month-end after it
+        symbol = next(symbol for symbol in reports['20250430'] if ' ' not in symbol and symbol not in ('USD', 'EUR', 'DKK'))
+        for date in month_ends[1:]:
+            entry = reports[date].setdefault(symbol, {'quantity': 0, 'isin': ''})
+            entry['quantity'] += 7
+        result = reconcile(index, reports, currencies=True)
+        self.assertEqual(result['first_divergent_date'], '20250430')
+        self.assertEqual(result['dates'][1]['differences'][0]['difference'], -7)
+
+if __name__ == '__main__':
+    unittest.main()
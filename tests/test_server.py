@@ -0,0 +1,225 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+from k4sru.server import (RequestError, new_state, add_rates, add_trades, k4_preview, portfolio, save_checkpoint,
+                          load_checkpoint, make_handler, create_server)
+from k4sru.data import process_trades
+
+def trade(datetime, symbol, side, quantity, price, currency='SEK'):
+    return {'DateTime': datetime, 'Symbol': symbol, 'Buy/Sell': side, 'Quantity': quantity, 'TradePrice': price,
+            'IBCommission': '-1', 'CurrencyPrimary': currency, 'Description': symbol, 'ISIN': '', 'Exchange': 'TEST'}
+
+RATES = [
+    {'Date/Time': '20250225', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.1'},
+    {'Date/Time': '20250226', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.1'},
+]
+
+TRADES = [
+    trade('20250225;090000', 'ABB', 'BUY', '10', '500'),
+    trade('20250225;100000', 'USD.SEK', 'BUY', '1000', '10'),
+    trade('20250225;110000', 'AAOI', 'BUY', '10', '30', 'USD'),
+    trade('20250226;090000', 'ABB', 'SELL', '-4', '550'),
+    trade('20250226;100000', 'AAOI', 'SELL', '-10', '40', 'USD'),
+]
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+class TestServerFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_add_trades_001(self):
+        # Fills posted one by one give the same result as the batch engine
+        state = new_state(2025)
+        add_rates(state, RATES)
+        for entry in TRADES:
+            self.assertEqual(add_trades(state, [entry]), {'accepted': 1, 'duplicates': 0, 'warnings': []})
+        k4_data = {}
+        stocks_data = {}
+        process_trades([dict(entry) for entry in TRADES], RATES, 2025, stocks_data, k4_data, {}, [], {})
+        self.assertEqual(state['k4_data'], k4_data)
+        self.assertEqual(state['stocks_data'], stocks_data)
+
+        preview = k4_preview(state)
+        self.assertEqual([row['beteckning'] for row in preview['rows']], ['AAOI', 'ABB', 'USD'])
+        self.assertAlmostEqual(preview['tax'], preview['profit_loss'] * 0.3)
+        self.assertEqual(portfolio(state, 'ABB')['ABB']['quantity'], 6)
+        self.assertEqual(portfolio(state, 'AAOI'), {})
+
+    def test_add_trades_002(self):
+        state = new_state(2025)
+        add_rates(state, RATES)
+        add_trades(state, TRADES[:2])
+        # Posting a batch again is ignored, with a warning for each fill without a TradeID
+        result = add_trades(state, TRADES[:2])
+        self.assertEqual((result['accepted'], result['duplicates'], len(result['warnings'])), (0, 2, 2))
+        # Older fills are rejected
+        with self.assertRaises(RequestError) as cm:
+            add_trades(state, [trade('20250224;090000', 'ABB', 'BUY', '1', '500')])
+        self.assertEqual(cm.exception.status, 409)
+        # Fills without a rate are rejected and leave the state untouched
+        stocks_data = json.dumps(state['stocks_data'])
+        with self.assertRaises(RequestError) as cm:
+            add_trades(state, [TRADES[2], trade('20250227;090000', 'AAOI', 'BUY', '1', '30', 'USD')])
+        self.assertEqual(cm.exception.status, 422)
+        self.assertEqual(json.dumps(state['stocks_data']), stocks_data)
+        self.assertEqual(state['trades'], 2)
+
+    def test_add_trades_003(self):
+        # Identical fills within an export are kept, like in deduplicate_trades
+        trades = [trade('20250225;110000', 'AAOI', 'BUY', '10', '30'), trade('20250225;110000', 'AAOI', 'BUY', '10', '30'),
+                  trade('20250226;100000', 'AAOI', 'SELL', '-20', '40')]
+        state = new_state(2025)
+        self.assertEqual(add_trades(state, trades), {'accepted': 3, 'duplicates': 0, 'warnings': []})
+        stocks_data = {}
+        process_trades([dict(entry) for entry in trades], [], 2025, stocks_data, {}, {}, [], {})
+        self.assertEqual(state['stocks_data'], stocks_data)
+        self.assertEqual(state['stocks_data']['AAOI']['quantity'], 0)
+        # Posting the export again is ignored
+        result = add_trades(state, trades)
+        self.assertEqual((result['accepted'], result['duplicates'], len(result['warnings'])), (0, 3, 3))
+
+    def test_add_trades_004(self):
+        # A field that is not a number is a bad request and leaves the state untouched
+        state = new_state(2025)
+        with self.assertRaises(RequestError) as cm:
+            add_trades(state, [trade('20250225;090000', 'ABB', 'BUY', 'ten', '500')])
+        self.assertEqual(cm.exception.status, 400)
+        self.assertEqual(state['trades'], 0)
+        self.assertEqual(state['seen'], set())
+
+    def test_add_trades_005(self):
+        # Identical fills posted one per request are told apart by their TradeID
+        fills = [dict(trade('20250225;110000', 'AAOI', 'BUY', '10', '30'), TradeID=str(i)) for i in (1, 2)]
+        fills.append(dict(trade('20250226;100000', 'AAOI', 'SELL', '-20', '40'), TradeID='3'))
+        state = new_state(2025)
+        for fill in fills:
+            self.assertEqual(add_trades(state, [fill]), {'accepted': 1, 'duplicates': 0, 'warnings': []})
+        self.assertEqual(state['stocks_data']['AAOI']['quantity'], 0)
+        self.assertEqual(add_trades(state, fills[:1]), {'accepted': 0, 'duplicates': 1, 'warnings': []})
+
+        # Without the TradeID the second fill cannot be told apart, it is ignored with a warning
+        state = new_state(2025)
+        add_trades(state, [trade('20250225;110000', 'AAOI', 'BUY', '10', '30')])
+        result = add_trades(state, [trade('20250225;110000', 'AAOI', 'BUY', '10', '30')])
+        self.assertEqual((result['accepted'], result['duplicates'], len(result['warnings'])), (0, 1, 1))
+        self.assertEqual(state['stocks_data']['AAOI']['quantity'], 10)
+
+    def test_add_trades_006(self):
+        # Only the entries a batch can change are copied, the others are kept as they are
+        state = new_state(2025)
+        add_rates(state, RATES)
+        add_trades(state, TRADES[:3])
+        abb = state['stocks_data']['ABB']
+        add_trades(state, [TRADES[4]])
+        self.assertIs(state['stocks_data']['ABB'], abb)
+        self.assertEqual(state['stocks_data']['AAOI']['quantity'], 0)
+
+    def test_add_trades_007(self):
+        # Options are processed after the dated trades of their batch, like k4sru does for the year
+        option = trade('20250225;120000', 'AAOI  250321C00030000', 'BUY', '1', '2', 'USD')
+        usd = [TRADES[1], trade('20250226;110000', 'USD.SEK', 'BUY', '1000', '11')]
+        state = new_state(2025)
+        add_rates(state, RATES)
+        add_trades(state, usd + [option])
+        stocks_data = {}
+        process_trades([dict(entry) for entry in usd + [option]], RATES, 2025, stocks_data, {}, {}, [], {})
+        self.assertEqual(state['stocks_data'], stocks_data)
+
+        # An option posted before later dated fills in its currency is processed before them, so
+        # the USD balance differs from k4sru, which processes the option after all dated trades
+        state = new_state(2025)
+        add_rates(state, RATES)
+        add_trades(state, [usd[0], option])
+        add_trades(state, [usd[1]])
+        self.assertEqual(state['stocks_data']['AAOI  250321C00030000'], stocks_data['AAOI  250321C00030000'])
+        self.assertNotAlmostEqual(state['stocks_data']['USD']['totalprice'], stocks_data['USD']['totalprice'])
+
+    def test_save_checkpoint_001(self):
+        state = new_state(2025)
+        add_rates(state, RATES)
+        add_trades(state, TRADES)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'checkpoint.json')
+            save_checkpoint(state, filename)
+            self.assertFalse(state['dirty'])
+            restored = load_checkpoint(filename)
+        for key in ('k4_data', 'stocks_data', 'statistics_data', 'currency_rates', 'seen', 'last_datetime', 'trades'):
+            self.assertEqual(restored[key], state[key], key)
+
+    def request(self, connection, method, path, body=None):
+        connection.request(method, path, json.dumps(body) if body is not None else None)
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+
+    def test_create_server_001(self):
+        state = new_state(2025)
+        lock = threading.Lock()
+        server = create_server(make_handler(state, lock), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1])
+            self.assertEqual(self.request(connection, 'POST', '/rates', RATES), (200, {'rates': 2}))
+            self.assertEqual(self.request(connection, 'POST', '/trades', TRADES), (200, {'accepted': 5, 'duplicates': 0, 'warnings': []}))
+            status, preview = self.request(connection, 'GET', '/k4')
+            self.assertEqual(status, 200)
+            self.assertEqual(preview['trades'], 5)
+            self.assertEqual(self.request(connection, 'GET', '/portfolio?symbol=ABB')[1]['ABB']['quantity'], 6)
+            self.assertEqual(self.request(connection, 'POST', '/checkpoint')[0], 400)
+            self.assertEqual(self.request(connection, 'POST', '/trades', '{')[0], 400)
+            self.assertEqual(self.request(connection, 'GET', '/unknown')[0], 404)
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_create_server_002(self):
+        state = new_state(2025)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            socket_path = os.path.join(tmpdir, 'irs.sock')
+            checkpoint = os.path.join(tmpdir, 'checkpoint.json')
+            server = create_server(make_handler(state, threading.Lock(), checkpoint), socket_path=socket_path)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                connection = UnixHTTPConnection(socket_path)
+                self.assertEqual(self.request(connection, 'POST', '/rates', RATES)[0], 200)
+                bad_rate = dict(RATES[0], Rate='n/a')
+                self.assertEqual(self.request(connection, 'POST', '/rates', [bad_rate])[0], 400)
+                self.assertEqual(self.request(connection, 'POST', '/checkpoint')[1]['checkpoint'], checkpoint)
+                self.assertTrue(os.path.exists(checkpoint))
+                connection.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import copy
+import os
+import tempfile
+from k4sru.data import process_trades
+from k4sru.options import parse_timestamp
+from k4sru.snapshots import (new_snapshot_index, snapshot_points, snapshot_state, state_as_of, positions_as_of,
+                             save_snapshot_index, load_snapshot_index)
+from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates
+
+class TestSnapshotsFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+        cls.trades = list(iter_synthetic_trades(1500, 2025, symbols=10, options=0.05, seed=3))
+        cls.rates = list(iter_synthetic_rates(2025, seed=3))
+
+    def run_engine(self, trades, snapshot_index=None):
+        stocks_data = {}
+        process_trades(copy.deepcopy(trades), copy.deepcopy(self.rates), 2025, stocks_data, {}, {}, [], {},
+                       snapshot_index=snapshot_index)
+        return stocks_data
+
+    def test_snapshot_points_001(self):
+        trades = [{'DateTime': f'202501{day:02d};120000'} for day in (1, 1, 2, 3, 10, 11, 12, 20)]
+        self.assertEqual(snapshot_points(trades, 3, 0), [0, 3, 6])
+        self.assertEqual(snapshot_points(trades, 0, 7), [0, 4, 7])
+        self.assertEqual(snapshot_points(trades, 2, 7), [0, 2, 4, 6, 7])
+        self.assertEqual(snapshot_points([], 2, 7), [0])
+
+    def test_state_as_of_001(self):
+        index = new_snapshot_index(2025, 100, 14)
+        final = self.run_engine(self.trades, index)
+        # Recording snapshots does not change the result
+        self.assertEqual(final, self.run_engine(self.trades))
+        self.assertGreater(len(index['snapshots']), 10)
+        self.assertTrue(index['options'])
+
+        # The same state as a run with the trades up to the timestamp
+        times = sorted(trade['DateTime'] for trade in self.trades)
+        for timestamp in ['20250101;000000', times[len(times) // 3], times[len(times) // 2], '20250630;235959', times[-1]]:
+            expected = self.run_engine([trade for trade in self.trades if trade['DateTime'] <= timestamp])
+            stocks_data, replayed = state_as_of(index, timestamp)
+            self.assertEqual(stocks_data, expected, timestamp)
+            self.assertLessEqual(replayed, 100 + len(index['options']))
+
+    def test_state_as_of_002(self):
+        # A full base every 4 snapshots, the others only hold the changed entries
+        index = new_snapshot_index(2025, 50, 0, base_every=4)
+        self.run_engine(self.trades, index)
+        deltas = [i for i in range(len(index['snapshots'])) if i % 4]
+        self.assertLess(sum(len(index['snapshots'][i]) for i in deltas), sum(len(snapshot_state(index, i)) for i in deltas))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'snapshots_2025.json')
+            save_snapshot_index(filename, index)
+            index = load_snapshot_index(filename)
+        times = sorted(trade['DateTime'] for trade in self.trades)
+        for timestamp in [times[len(times) // 5], times[len(times) // 2 + 7], times[-3]]:
+            expected = self.run_engine([trade for trade in self.trades if trade['DateTime'] <= timestamp])
+            stocks_data, replayed = state_as_of(index, timestamp)
+            self.assertEqual(stocks_data, expected, timestamp)
+            self.assertLessEqual(replayed, 50 + len(index['options']))
+
+    def test_positions_as_of_001(self):
+        index = new_snapshot_index(2025, 200, 0)
+        final = self.run_engine(self.trades, index)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'snapshots_2025.json')
+            save_snapshot_index(filename, index)
+            index = load_snapshot_index(filename)
+        positions = positions_as_of(index, '20251231;235959')
+        self.assertEqual(set(positions), {symbol for symbol, data in final.items() if data['quantity'] != 0})
+        for symbol, position in positions.items():
+            self.assertAlmostEqual(position['quantity'], final[symbol]['quantity'])
+            self.assertAlmostEqual(position['avgprice'], final[symbol]['avgprice'])
+        self.assertEqual(positions_as_of(index, '20250101;000000', ['SYN0000']),
+                         {'SYN0000': {'quantity': 0, 'avgprice': 0, 'totalprice': 0}})
+
+    def test_parse_timestamp_001(self):
+        self.assertEqual(parse_timestamp('2025-06-30'), '20250630;235959')
+        self.assertEqual(parse_timestamp('20250630'), '20250630;235959')
+        self.assertEqual(parse_timestamp('2025-06-30 15:30:00'), '20250630;153000')
+        self.assertEqual(parse_timestamp('20250630;153000'), '20250630;153000')
+        with self.assertRaises(ValueError):
+            parse_timestamp('2025-06')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from k4sru.data import sort_trades
+from k4sru.store import open_store, store_trades, store_rates, load_trades, load_rates
+
+class TestStoreFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def setUp(self):
+        self.conn = open_store(':memory:')
+        self.trades = [
+            {'DateTime': '20250102;120000', 'Symbol': 'ERIC-B', 'Buy/Sell': 'SELL', 'Quantity': '-5', 'TradePrice': '110', 'IBCommission': '-5', 'CurrencyPrimary': 'SEK', 'Description': 'Ericsson', 'ISIN': 'SE0000108656', 'Exchange': 'SFB'},
+            {'DateTime': '20250101;120000', 'Symbol': 'ERIC-B', 'Buy/Sell': 'BUY', 'Quantity': '10', 'TradePrice': '100', 'IBCommission': '-5', 'CurrencyPrimary': 'SEK', 'Description': 'Ericsson', 'ISIN': 'SE0000108656', 'Exchange': 'SFB'},
+            {'DateTime': '20250101;120000', 'Symbol': 'USD.SEK', 'Buy/Sell': 'BUY', 'Quantity': '100', 'TradePrice': '10', 'IBCommission': '0', 'CurrencyPrimary': 'SEK', 'Description': 'USD.SEK', 'ISIN': '', 'Exchange': 'IDEALFX'},
+            {'DateTime': '20250103;120000', 'Symbol': 'IBIT  250117C00055000', 'Buy/Sell': 'SELL', 'Quantity': '-1', 'TradePrice': '2', 'IBCommission': '-1', 'CurrencyPrimary': 'USD', 'Description': 'IBIT 17JAN25 55 C', 'ISIN': '', 'Exchange': 'CBOE'},
+            {'DateTime': '20250102;120000', 'Symbol': 'IBIT  250117C00055000', 'Buy/Sell': 'BUY', 'Quantity': '1', 'TradePrice': '1', 'IBCommission': '-1', 'CurrencyPrimary': 'USD', 'Description': 'IBIT 17JAN25 55 C', 'ISIN': '', 'Exchange': 'CBOE'},
+            {'DateTime': '20240102;120000', 'Symbol': 'ERIC-B', 'Buy/Sell': 'BUY', 'Quantity': '10', 'TradePrice': '90', 'IBCommission': '-5', 'CurrencyPrimary': 'SEK', 'Description': 'Ericsson', 'ISIN': 'SE0000108656', 'Exchange': 'SFB'},
+        ]
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_store_trades_001(self):
+        self.assertEqual(store_trades(self.conn, self.trades), 6)
+        # The same export stored again adds nothing, numbers are compared in canonical form
+        overlapping = [dict(trade) for trade in self.trades]
+        overlapping[0]['Quantity'] = '-5.0'
+        self.assertEqual(store_trades(self.conn, overlapping), 0)
+
+    def test_store_trades_002(self):
+        # Two identical fills in one export are both kept
+        self.assertEqual(store_trades(self.conn, [self.trades[1], self.trades[1]]), 2)
+        self.assertEqual(store_trades(self.conn, [self.trades[1]]), 0)
+        self.assertEqual(len(list(load_trades(self.conn, 2025))), 2)
+
+    def test_load_trades_001(self):
+        store_trades(self.conn, self.trades)
+        expected = [(t['DateTime'], t['Symbol']) for t in sort_trades([dict(t) for t in self.trades if t['DateTime'].startswith('2025')])]
+        loaded = [(t['DateTime'], t['Symbol']) for t in load_trades(self.conn, 2025)]
+        self.assertEqual(loaded, expected)
+
+    def test_load_trades_002(self):
+        store_trades(self.conn, self.trades)
+        loaded = list(load_trades(self.conn, 2025, symbols=['ERIC-B']))
+        self.assertEqual([t['Buy/Sell'] for t in loaded], ['BUY', 'SELL'])
+        self.assertEqual(loaded[0]['ISIN'], 'SE0000108656')
+
+    def test_load_rates_001(self):
+        store_rates(self.conn, [
+            {'Date/Time': '20250101', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.1'},
+            {'Date/Time': '20241231', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.09'},
+        ])
+        store_rates(self.conn, [{'Date/Time': '20250101', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.11'}])
+        self.assertEqual(list(load_rates(self.conn, 2025)), [{'Date/Time': '20250101', 'FromCurrency': 'SEK', 'ToCurrency': 'USD', 'Rate': '0.11'}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import gzip
+import io
+import lzma
+import os
+import tempfile
+from unittest import mock
+from k4sru.streams import detect_compression, open_input, peek_line
+from k4sru.ibkr import split_input_sections
+from k4sru.parsers import find_parser
+from k4sru.data import read_input_file, process_transactions
+
+IBKR_CSV = (
+    '"DateTime","Symbol","Buy/Sell","Quantity","TradePrice","IBCommission","CurrencyPrimary","Description","ISIN","Exchange"\n'
+    '"20250225;030616","AAOI","BUY","10","30","-1","USD","APPLIED OPTOELECTRONICS INC","US03823U1025","NASDAQ"\n'
+    '"20250301;100000","AAOI","SELL","-10","40","-1","USD","APPLIED OPTOELECTRONICS INC","US03823U1025","NASDAQ"\n'
+    '"Date/Time","FromCurrency","ToCurrency","Rate"\n'
+    '"20250225","SEK","USD","0.1"\n'
+    '"20250301","SEK","USD","0.1"\n'
+)
+
+class TestStreamsFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_detect_compression_001(self):
+        self.assertEqual(detect_compression(gzip.compress(b'data')), 'gzip')
+        self.assertEqual(detect_compression(lzma.compress(b'data')), 'xz')
+        self.assertEqual(detect_compression(b'\x28\xb5\x2f\xfd\x00'), 'zstd')
+        self.assertIsNone(detect_compression(b'"DateTime"'))
+        self.assertIsNone(detect_compression(b''))
+
+    def test_open_input_001(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name, content in (('plain.csv', IBKR_CSV.encode()),
+                                  ('trades.csv.gz', gzip.compress(IBKR_CSV.encode())),
+                                  ('trades.csv.xz', lzma.compress(IBKR_CSV.encode()))):
+                filename = os.path.join(tmpdir, name)
+                with open(filename, 'wb') as file:
+                    file.write(content)
+                with open_input(filename) as file:
+                    self.assertEqual(file.read(), IBKR_CSV)
+                with open_input(filename, binary=True) as file:
+                    self.assertEqual(file.read(), IBKR_CSV.encode())
+
+    def test_read_input_file_compressed_001(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # The file name does not matter, the compression is detected from the content
+            filename = os.path.join(tmpdir, 'trades.csv')
+            with gzip.open(filename, 'wt') as file:
+                file.write(IBKR_CSV)
+            with open_input(filename) as file:
+                self.assertEqual(find_parser(file.readline()), 'ibkr')
+            _, trades, rates = read_input_file(filename)
+        self.assertEqual([t['Buy/Sell'] for t in trades], ['BUY', 'SELL'])
+        self.assertEqual([r['Date/Time'] for r in rates], ['20250225', '20250301'])
+
+    def test_split_input_sections_001(self):
+        trade_lines, rate_lines = split_input_sections(iter(IBKR_CSV.splitlines(keepends=True)))
+        self.assertEqual(len(list(trade_lines)), 3)
+        self.assertEqual(len(list(rate_lines)), 3)
+
+        # Without currency rates section
+        trade_lines, rate_lines = split_input_sections(iter(IBKR_CSV.splitlines(keepends=True)[:3]))
+        self.assertEqual(len(list(trade_lines)), 3)
+        self.assertEqual(list(rate_lines), [])
+
+    def test_peek_line_001(self):
+        header, stream = peek_line(io.BytesIO(IBKR_CSV.encode()))
+        self.assertTrue(header.startswith(b'"DateTime"'))
+        self.assertEqual(stream.read(), IBKR_CSV.encode())
+
+    def test_read_input_file_stdin_001(self):
+        # Standard input is not seekable, the format is detected and the file parsed in one pass
+        stdin = mock.Mock(buffer=io.BytesIO(gzip.compress(IBKR_CSV.encode())))
+        with mock.patch('sys.stdin', stdin):
+            filename, trades, rates = read_input_file('-')
+        self.assertEqual(filename, '-')
+        self.assertEqual(len(trades), 2)
+        self.assertEqual(len(rates), 2)
+
+    def test_process_transactions_no_rates_001(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # A file without the currency rates section can be read, but the input needs currency rates
+            filename = os.path.join(tmpdir, 'trades.csv')
+            with open(filename, 'w') as file:
+                file.write(''.join(IBKR_CSV.splitlines(keepends=True)[:3]))
+            _, trades, rates = read_input_file(filename)
+            self.assertEqual((len(trades), len(rates)), (2, 0))
+            with self.assertRaises(SystemExit):
+                process_transactions([filename], 2025, {}, {}, {}, [])
+
+if __name__ == '__main__':
+    unittest.main()
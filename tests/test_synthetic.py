@@ -0,0 +1,68 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import os
+import tempfile
+from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates, generate_flex_csv
+from k4sru.options import parse_currency_mix
+from k4sru.data import read_input_file, process_trades
+
+class TestSyntheticFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_parse_currency_mix_001(self):
+        self.assertEqual(parse_currency_mix('usd=0.6,EUR=0.4'), {'USD': 0.6, 'EUR': 0.4})
+        self.assertEqual(parse_currency_mix('SEK'), {'SEK': 1.0})
+
+    def test_iter_synthetic_trades_001(self):
+        trades = list(iter_synthetic_trades(500, 2025, symbols=10, seed=1))
+        self.assertEqual(len(trades), 500)
+        # Deterministic and chronological
+        self.assertEqual(trades, list(iter_synthetic_trades(500, 2025, symbols=10, seed=1)))
+        self.assertEqual([t['DateTime'] for t in trades], sorted(t['DateTime'] for t in trades))
+        self.assertNotEqual(trades, list(iter_synthetic_trades(500, 2025, symbols=10, seed=2)))
+        symbols = {t['Symbol'] for t in trades}
+        self.assertIn('BTC', symbols)
+        self.assertTrue(any(symbol.startswith('IBIT ') for symbol in symbols))
+        self.assertTrue(any(symbol.endswith('.SEK') for symbol in symbols))
+
+    def test_iter_synthetic_trades_002(self):
+        # Only SEK stocks, no options or BTC: no currency trades and no margin loans
+        trades = list(iter_synthetic_trades(200, 2025, symbols=5, currencies={'SEK': 1}, options=0, btc=0))
+        self.assertEqual({t['CurrencyPrimary'] for t in trades}, {'SEK'})
+        stocks_data = {}
+        k4_data = {}
+        process_trades(trades, [], 2025, stocks_data, k4_data, {}, [], predefined_rates={})
+        self.assertTrue(all(data['quantity'] >= 0 for data in stocks_data.values()))
+        self.assertTrue(k4_data)
+
+    def test_generate_flex_csv_001(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'synthetic.csv.gz')
+            self.assertEqual(generate_flex_csv(filename, 300, 2025, seed=3), 300)
+            _, trades, rates = read_input_file(filename)
+        self.assertEqual(len(trades), 300)
+        self.assertEqual(len(rates), len(list(iter_synthetic_rates(2025, seed=3))))
+
+        # The engine finds a currency rate for every trade
+        k4_rows = process_trades(trades, rates, 2025, {}, {}, {}, [], predefined_rates={})
+        self.assertTrue(k4_rows)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import json
+import os
+import tempfile
+from k4sru.trace import trace_tags, stage_tracer, file_span_events, save_trace
+from k4sru.data import read_input_files, combine_stages
+
+class TestTraceFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def test_stage_tracer_001(self):
+        tags = trace_tags({'orgnr': '123456789012'}, 2025)
+        self.assertEqual(tags, {'account': '123456789012', 'year': 2025})
+        events = []
+        stage = stage_tracer(events, tags)
+        with stage('parse'):
+            pass
+        with stage('engine'):
+            pass
+        self.assertEqual([event['name'] for event in events], ['parse', 'engine'])
+        self.assertEqual(events[0]['ph'], 'X')
+        self.assertEqual(events[0]['pid'], os.getpid())
+        self.assertGreaterEqual(events[0]['dur'], 0)
+        self.assertLessEqual(events[0]['ts'], events[1]['ts'])
+        self.assertEqual(events[1]['args'], tags)
+
+    def test_combine_stages_001(self):
+        first = []
+        second = []
+        stage = combine_stages(stage_tracer(first, {}), stage_tracer(second, {}))
+        with stage('sort'):
+            pass
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+
+    def test_file_span_events_001(self):
+        spans = [{'file': 'a.csv', 'pid': 42, 'start': 10.0, 'end': 10.5}]
+        events = file_span_events(spans, {'account': '1', 'year': 2025})
+        self.assertEqual(events[0]['name'], 'parse a.csv')
+        self.assertEqual(events[0]['pid'], 42)
+        self.assertEqual(events[0]['ts'], 10.0e6)
+        self.assertEqual(events[0]['dur'], 0.5e6)
+        self.assertEqual(events[0]['args']['file'], 'a.csv')
+
+    def test_save_trace_001(self):
+        tags = {'account': '1', 'year': 2025}
+        spans = []
+        events = []
+        with tempfile.TemporaryDirectory() as workdir:
+            filenames = []
+            for name in ('a.csv', 'b.csv'):
+                filename = os.path.join(workdir, name)
+                with open(filename, 'w') as file:
+                    file.write('"DateTime","Symbol","Buy/Sell","Quantity","TradePrice","IBCommission","CurrencyPrimary","Description","ISIN","Exchange"\n'
+                               '"20250225;030616","ABB","BUY","10","500","-1","SEK","ABB LTD","CH0012221716","SFB"\n')
+                filenames.append(filename)
+            with stage_tracer(events, tags)('parse'):
+                sources = read_input_files(filenames, workers=2, file_spans=spans)
+            self.assertEqual([len(source) for source in sources], [3, 3])
+            self.assertEqual([span['file'] for span in spans], filenames)
+
+            trace_file = os.path.join(workdir, 'trace.json')
+            save_trace(trace_file, events, tags, spans)
+            with open(trace_file) as file:
+                trace = json.load(file)
+        self.assertEqual(trace['otherData'], tags)
+        names = [event['name'] for event in trace['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual(sorted(names), sorted(['parse', f'parse {filenames[0]}', f'parse {filenames[1]}']))
+        process_names = [event['args']['name'] for event in trace['traceEvents'] if event['name'] == 'process_name']
+        self.assertIn('irs 1 2025', process_names)
+        # The files are parsed in worker processes, a worker may parse both
+        self.assertGreaterEqual(len([name for name in process_names if name.startswith('parse worker')]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
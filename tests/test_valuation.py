@@ -0,0 +1,97 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+from k4sru.valuation import value_portfolio, currency_exposure
+
+class TestValuationFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def setUp(self):
+        self.stocks_data = {
+            'AAOI': {'quantity': 100, 'totalprice': 20000.0, 'avgprice': 200.0, 'totalpriceusd': 2000.0, 'avgpriceusd': 20.0},
+            'ERIC-B': {'quantity': 50, 'totalprice': 4000.0, 'avgprice': 80.0},
+            'IBIT 250117C00050000': {'quantity': 2, 'totalprice': 2000.0, 'avgprice': 1000.0, 'totalpriceusd': 200.0, 'avgpriceusd': 100.0},
+            'EUR': {'quantity': 1000, 'totalprice': 11000.0, 'avgprice': 11.0},
+            'USD': {'quantity': -500, 'totalprice': -5000.0, 'avgprice': 10.0},
+            'SOLD': {'quantity': 0, 'totalprice': 0, 'avgprice': 0},
+            'NOPRICE': {'quantity': 10, 'totalprice': 100.0, 'avgprice': 10.0},
+        }
+        # USD from the rate index, EUR from the price file
+        self.currency_rates = {('20251230', 'USD'): 9.0, ('20251231', 'USD'): 10.0, ('20260102', 'USD'): 11.0, ('20251231', 'EUR'): 11.5}
+        self.prices = {
+            'AAOI': {'price': 25.0, 'currency': 'USD'},
+            'ERIC-B': {'price': 90.0, 'currency': 'SEK'},
+            'IBIT 250117C00050000': {'price': 0.5, 'currency': 'USD'},
+            'EUR': {'price': 11.2, 'currency': 'SEK'},
+        }
+
+    def test_value_portfolio_001(self):
+        rows, missing = value_portfolio(self.stocks_data, self.prices, self.currency_rates, '20251231')
+        rows = {row['symbol']: row for row in rows}
+        self.assertNotIn('SOLD', rows)
+        self.assertEqual(missing, ['NOPRICE'])
+        self.assertIsNone(rows['NOPRICE']['market_value_sek'])
+
+        aaoi = rows['AAOI']
+        self.assertAlmostEqual(aaoi['market_value_sek'], 25000.0)
+        self.assertAlmostEqual(aaoi['unrealized_sek'], 5000.0)
+        self.assertAlmostEqual(aaoi['market_value_usd'], 2500.0)
+        self.assertAlmostEqual(aaoi['unrealized_usd'], 500.0)
+
+        # Option prices are per share, the position is in lots of 100
+        option = rows['IBIT 250117C00050000']
+        self.assertAlmostEqual(option['price'], 50.0)
+        self.assertAlmostEqual(option['market_value_sek'], 1000.0)
+        self.assertAlmostEqual(option['unrealized_usd'], -100.0)
+
+        # No USD statistics for a position priced in SEK
+        self.assertAlmostEqual(rows['ERIC-B']['unrealized_sek'], 500.0)
+        self.assertAlmostEqual(rows['ERIC-B']['market_value_usd'], 450.0)
+        self.assertIsNone(rows['ERIC-B']['unrealized_usd'])
+
+        # Currency balances at their SEK rate, a margin loan has a negative value
+        self.assertAlmostEqual(rows['EUR']['market_value_sek'], 11200.0)
+        self.assertAlmostEqual(rows['EUR']['unrealized_sek'], 200.0)
+        self.assertAlmostEqual(rows['USD']['market_value_sek'], -5000.0)
+        self.assertAlmostEqual(rows['USD']['unrealized_sek'], 0.0)
+
+    def test_value_portfolio_002(self):
+        # The latest rate on or before the valuation date
+        rows, _ = value_portfolio({'AAOI': self.stocks_data['AAOI']}, self.prices, self.currency_rates, '20251230')
+        self.assertAlmostEqual(rows[0]['market_value_sek'], 22500.0)
+        # A rate in the price file takes precedence over the rate index
+        prices = dict(self.prices, USD={'price': 12.0, 'currency': 'SEK'})
+        rows, _ = value_portfolio({'AAOI': self.stocks_data['AAOI']}, prices, self.currency_rates, '20251231')
+        self.assertAlmostEqual(rows[0]['market_value_sek'], 30000.0)
+        # No rate before the valuation date
+        rows, missing = value_portfolio({'AAOI': self.stocks_data['AAOI']}, self.prices, self.currency_rates, '20251201')
+        self.assertEqual(missing, ['AAOI'])
+        self.assertIsNone(rows[0]['market_value_usd'])
+
+    def test_currency_exposure_001(self):
+        rows, _ = value_portfolio(self.stocks_data, self.prices, self.currency_rates, '20251231')
+        exposure = currency_exposure(rows)
+        self.assertEqual(list(exposure), ['USD', 'EUR', 'SEK'])
+        self.assertAlmostEqual(exposure['USD']['market_value_sek'], 25000.0 + 1000.0 - 5000.0)
+        self.assertAlmostEqual(exposure['EUR']['market_value_sek'], 11200.0)
+        self.assertAlmostEqual(exposure['SEK']['market_value_sek'], 4500.0)
+        self.assertAlmostEqual(sum(entry['share'] for entry in exposure.values()), 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
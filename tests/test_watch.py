@@ -0,0 +1,128 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import json
+import os
+import tempfile
+from k4sru.watch import new_watch_state, changed_inputs, refresh, watch
+from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates, write_flex_csv
+
+CONFIG = {'orgnr': '123456789012', 'namn': 'Test', 'adress': 'Street 1', 'postnr': '12345', 'postort': 'City', 'email': 'test@example.com'}
+
+class TestWatchFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+        cls.trades = list(iter_synthetic_trades(400, 2025, symbols=8, options=0, seed=2))
+        cls.rates = list(iter_synthetic_rates(2025, seed=2))
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmpdir.name)
+        os.makedirs('input')
+        os.makedirs('output')
+        with open('input/config.json', 'w') as file:
+            json.dump(CONFIG, file)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def read_outputs(self):
+        outputs = {}
+        for name in ('output_portfolio_2025.json', 'trading_statistics_2025.csv', 'BLANKETTER.SRU'):
+            with open(f'output/{name}') as file:
+                outputs[name] = [line for line in file if not line.startswith('#IDENTITET')]
+        return outputs
+
+    def refresh_changed(self, state):
+        changed, stats = changed_inputs(state)
+        return changed, refresh(state, changed, stats) if changed else []
+
+    def test_refresh_001(self):
+        write_flex_csv('input/a.csv', self.trades[:200], self.rates)
+        state = new_watch_state('input/config.json', ['input/*.csv'], 2025)
+        changed, stages = self.refresh_changed(state)
+        self.assertEqual(changed, {'config', 'sources'})
+        self.assertIn('engine_full', stages)
+        self.assertEqual(self.refresh_changed(state), (set(), []))
+
+        # Trades appended to the export continue from the engine checkpoint
+        write_flex_csv('input/a.csv', self.trades, self.rates)
+        os.utime('input/a.csv', ns=(1, 1))
+        changed, stages = self.refresh_changed(state)
+        self.assertEqual(changed, {'sources'})
+        self.assertIn('engine_append', stages)
+        appended = self.read_outputs()
+
+        # The same outputs as a full run
+        state = new_watch_state('input/config.json', ['input/*.csv'], 2025)
+        self.assertIn('engine_full', self.refresh_changed(state)[1])
+        self.assertEqual(self.read_outputs(), appended)
+
+    def test_refresh_002(self):
+        write_flex_csv('input/a.csv', self.trades[:200], self.rates)
+        write_flex_csv('input/b.csv', self.trades[200:], [])
+        state = new_watch_state('input/config.json', ['input/*.csv'], 2025)
+        self.refresh_changed(state)
+        cached = state['parse_cache']['input/a.csv']
+
+        # Only the SRU files are written again when the configuration changes
+        with open('input/config.json', 'w') as file:
+            json.dump(dict(CONFIG, namn='Other'), file)
+        os.utime('input/config.json', ns=(1, 1))
+        self.assertEqual(self.refresh_changed(state), ({'config'}, ['info_sru', 'blanketter_sru']))
+        with open('output/BLANKETTER.SRU') as file:
+            self.assertIn('#NAMN Other', file.read())
+
+        # A changed portfolio runs the engine from the start, the input files come from the parse cache
+        with open('input/input_portfolio_2025.json', 'w') as file:
+            json.dump({'SYN9999': {'quantity': 10, 'totalprice': 1000, 'avgprice': 100}}, file)
+        changed, stages = self.refresh_changed(state)
+        self.assertEqual(changed, {'portfolio'})
+        self.assertIn('engine_full', stages)
+        self.assertIs(state['parse_cache']['input/a.csv'], cached)
+        with open('output/output_portfolio_2025.json') as file:
+            self.assertIn('SYN9999', json.load(file))
+
+    def test_watch_001(self):
+        write_flex_csv('input/a.csv', self.trades, self.rates)
+        with open('input/b.csv', 'w') as file:
+            file.write('not a trade export\n')
+        # A failing refresh does not stop watching and is retried
+        state = watch('input/config.json', ['input/*.csv'], 2025, interval=0, cycles=2)
+        self.assertEqual(state['stats'], {})
+        os.remove('input/b.csv')
+        state = watch('input/config.json', ['input/*.csv'], 2025, interval=0, cycles=1)
+        self.assertIn('input/a.csv', state['stats'])
+        self.assertTrue(os.path.exists('output/BLANKETTER.SRU'))
+
+    def test_watch_002(self):
+        write_flex_csv('input/a.csv', self.trades, self.rates)
+        # A half-written configuration does not stop watching
+        with open('input/config.json', 'w') as file:
+            file.write('{"orgnr": "1234')
+        state = watch('input/config.json', ['input/*.csv'], 2025, interval=0, cycles=2)
+        self.assertEqual(state['stats'], {})
+        with open('input/config.json', 'w') as file:
+            json.dump(CONFIG, file)
+        state = watch('input/config.json', ['input/*.csv'], 2025, interval=0, cycles=1)
+        self.assertIn('input/a.csv', state['stats'])
+
+if __name__ == '__main__':
+    unittest.main()
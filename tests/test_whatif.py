@@ -0,0 +1,88 @@
+# Copyright 2025 mercaator
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import logging
+import copy
+from k4sru.data import process_trades, process_currency_rates, sort_trades, process_trading_data
+from k4sru.options import parse_sell
+from k4sru.whatif import new_base_state, evaluate_scenario, simulate, MIN_POOL_SCENARIOS
+from k4sru.synthetic import iter_synthetic_trades, iter_synthetic_rates
+
+def total_profit_loss(k4_data):
+    return sum(row['forsaljningspris'] - row['omkostnadsbelopp'] for row in k4_data.values())
+
+class TestWhatifFunctions(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+        cls.trades = list(iter_synthetic_trades(1000, 2025, symbols=8, options=0, seed=5))
+        cls.rates = list(iter_synthetic_rates(2025, seed=5))
+        currency_rates = {}
+        process_currency_rates(copy.deepcopy(cls.rates), currency_rates, 2025, {})
+        sorted_trades = sort_trades(copy.deepcopy(cls.trades))
+        stocks_data = {}
+        k4_data = {}
+        process_trading_data(sorted_trades, stocks_data, k4_data, currency_rates, [])
+        cls.base = new_base_state(2025, sorted_trades, stocks_data, k4_data, currency_rates)
+        cls.symbols = [symbol for symbol, data in stocks_data.items() if data['quantity'] > 0 and symbol.startswith('SYN')]
+
+    def test_evaluate_scenario_001(self):
+        state = copy.deepcopy((self.base['stocks_data'], self.base['k4_data']))
+        for symbol in self.symbols[:3]:
+            result = evaluate_scenario(self.base, {'symbol': symbol, 'quantity': '50%', 'price': 123.0})
+            self.assertIsNone(result['error'])
+            self.assertIn(symbol, result['k4_delta'])
+            self.assertAlmostEqual(result['tax'], result['profit_loss'] * 0.3)
+
+            # The same change as a run with the sell appended to the input
+            last_trade = [trade for trade in self.trades if trade['Symbol'] == symbol][-1]
+            quantity = self.base['stocks_data'][symbol]['quantity'] / 2
+            sell = dict(last_trade, **{'DateTime': self.base['last_datetime'], 'Buy/Sell': 'SELL', 'Quantity': str(-quantity),
+                                       'TradePrice': '123.0', 'IBCommission': '0'})
+            k4_data = {}
+            process_trades(copy.deepcopy(self.trades) + [sell], copy.deepcopy(self.rates), 2025, {}, k4_data, {}, [], {})
+            self.assertAlmostEqual(result['profit_loss'], total_profit_loss(k4_data) - self.base['profit_loss'], places=6)
+        # The base state is not changed by the scenarios
+        self.assertEqual((self.base['stocks_data'], self.base['k4_data']), state)
+
+    def test_evaluate_scenario_002(self):
+        result = evaluate_scenario(self.base, {'symbol': 'NOPE', 'quantity': 'all'})
+        self.assertEqual(result['error'], 'no price given and no trade of NOPE')
+        # A date without a rate uses the latest earlier rate, there is none before the year
+        symbol = next(symbol for symbol in self.symbols if self.base['last_trades'][symbol][1] != 'SEK')
+        result = evaluate_scenario(self.base, {'symbol': symbol, 'quantity': 1, 'date': '20261231;120000'})
+        self.assertIsNone(result['error'])
+        result = evaluate_scenario(self.base, {'symbol': symbol, 'quantity': 1, 'date': '20200101;120000'})
+        self.assertIn('rate on or before 20200101', result['error'])
+
+    def test_simulate_001(self):
+        scenarios = [{'symbol': symbol, 'quantity': f'{percent}%'} for symbol in self.symbols for percent in range(10, 101, 10)]
+        scenarios = (scenarios * (MIN_POOL_SCENARIOS // len(scenarios) + 1))[:MIN_POOL_SCENARIOS]
+        serial = simulate(self.base, scenarios, workers=1)
+        pooled = simulate(self.base, scenarios, workers=2)
+        self.assertEqual(len(pooled), len(scenarios))
+        self.assertEqual([result['profit_loss'] for result in serial], [result['profit_loss'] for result in pooled])
+        self.assertEqual([result['scenario'] for result in pooled], scenarios)
+
+    def test_parse_sell_001(self):
+        self.assertEqual(parse_sell('AAOI:100'), {'symbol': 'AAOI', 'quantity': 100.0})
+        self.assertEqual(parse_sell('AAOI:50%:41.5'), {'symbol': 'AAOI', 'quantity': '50%', 'price': 41.5})
+        self.assertEqual(parse_sell('AAOI:all'), {'symbol': 'AAOI', 'quantity': 'all'})
+        with self.assertRaises(ValueError):
+            parse_sell('AAOI')
+
+if __name__ == '__main__':
+    unittest.main()